@@ -0,0 +1,157 @@
+"""
+Local stand-in for arXiv that serves synthetic listing pages and export API feeds
+
+Pages are generated once per repository and served with an ETag, so that
+conditional requests are answered with 304 like the real site. Monthly listings
+(/list/<repository>/<yymm>?skip=&show=) are generated on request. The export API
+(/api/query?id_list=...) returns an Atom entry for every requested new-style ID
+
+Usage
+python benchmarks/arxiv_stub.py [--port 8000]
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic import atom_feed, listing_page, monthly_page
+
+# IDs the export API knows about, others are left out of the feed
+KNOWN_ID_PATTERN = re.compile(r"^\d{4}\.\d{4,5}(v\d+)?$")
+MONTH_PATTERN = re.compile(r"^\d{4}$")
+
+
+class ArxivStub:
+    """
+    HTTP server on a background thread, serving /list/<repository>/new and /api/query
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, new: int = 400, cross_lists: int = 150,
+                 replaced: int = 250, monthly: int = 3000):
+        """
+        :param port: Port to listen on, 0 picks a free port
+        :param new: Number of new submissions per page
+        :param cross_lists: Number of cross-listed submissions per page
+        :param replaced: Number of replacements per page
+        :param monthly: Typical number of entries in the listing of a month, each month varies by up to 50%
+        """
+        self.sizes: tuple[int, int, int] = (new, cross_lists, replaced)
+        self.monthly: int = monthly
+        self.pages: dict[str, tuple[bytes, str]] = {}
+        self.requests: int = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> ArxivStub:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="arxiv-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def page(self, repository: str) -> tuple[bytes, str]:
+        """
+        :return: Body and ETag of the listing of a repository
+        """
+        with self._lock:
+            if repository not in self.pages:
+                body: bytes = listing_page(repository, *self.sizes, seed=sum(map(ord, repository))).encode("utf8")
+                self.pages[repository] = body, f'"{hashlib.md5(body).hexdigest()}"'
+            return self.pages[repository]
+
+    def month_total(self, repository: str, yymm: str) -> int:
+        """
+        :return: Number of entries in the listing of a month
+        """
+        return int(self.monthly * random.Random(f"{repository}-{yymm}").uniform(0.5, 1.5))
+
+    def _handler(self):
+        stub: ArxivStub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                parts: list[str] = url.path.strip("/").split("/")
+
+                with stub._lock:
+                    stub.requests += 1
+
+                if parts == ["api", "query"]:
+                    id_list: list[str] = ",".join(parse_qs(url.query).get("id_list", [])).split(",")
+                    known: list[str] = [arxiv_id for arxiv_id in id_list if KNOWN_ID_PATTERN.match(arxiv_id)]
+                    body: bytes = atom_feed(known, random.Random(url.query)).encode("utf8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/atom+xml; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                if len(parts) != 3 or parts[0] != "list":
+                    self.send_error(404)
+                    return
+
+                if MONTH_PATTERN.match(parts[2]):
+                    query: dict[str, list[str]] = parse_qs(url.query)
+                    skip: int = int(query.get("skip", ["0"])[0])
+                    show: int = int(query.get("show", ["25"])[0])
+                    body = monthly_page(parts[1], parts[2], stub.month_total(parts[1], parts[2]), skip, show,
+                                        seed=sum(map(ord, parts[1]))).encode("utf8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                body, etag = stub.page(parts[1])
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    stub = ArxivStub(port=args.port).start()
+    print(f"Serving listings at {stub.url}/list/<repository>/new and /list/<repository>/<yymm>, "
+          f"and metadata at {stub.url}/api/query")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
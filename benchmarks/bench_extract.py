@@ -0,0 +1,115 @@
+"""
+Check that the entries extracted from every page of the corpus agree with a BeautifulSoup
+reference, in their IDs, listing types, titles, authors and subjects, then compare the speed
+of the fast identifier scan with BeautifulSoup
+
+Exits with a non-zero status if any page differs
+
+Usage
+python benchmarks/bench_extract.py [--repeat 5]
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT: Path = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "scout"), str(ROOT)]
+os.chdir(ROOT / "scout")
+
+from listing import (  # noqa: E402
+    ListingEntry, extract_listing_entries, _clean, _extract_identifiers_bs4, _extract_identifiers_fast,
+    _parse_identifier
+)
+
+CORPUS_DIR: Path = Path(__file__).resolve().parent / "corpus"
+TARGETS: list[str] = ["new", "cross-list", "replaced"]
+
+
+def reference_entries(content: bytes, include: list[str]) -> list[ListingEntry]:
+    """
+    Entries of a page read from its BeautifulSoup tree, the fields of each from the <dd> after its <dt>
+    """
+    from bs4 import BeautifulSoup
+
+    entries: dict[str, ListingEntry] = {}
+    for tag in BeautifulSoup(content, "html.parser").find_all(class_="list-identifier"):
+        arxiv_id, listing_type = _parse_identifier(tag.text)
+        if not arxiv_id or listing_type not in include or arxiv_id in entries:
+            continue
+
+        entry = ListingEntry(arxiv_id=arxiv_id, listing_type=listing_type)
+        term = tag.find_parent("dt")
+        details = term.find_next_sibling("dd") if term is not None else None
+        if details is not None:
+            if (title := details.find("div", class_="list-title")) is not None:
+                entry.title = _clean(title.text)
+            if (authors := details.find("div", class_="list-authors")) is not None:
+                links: list = authors.find_all("a")
+                names: list[str] = [_clean(link.text) for link in links] if links else _clean(authors.text).split(",")
+                entry.authors = [name for name in (name.strip() for name in names) if name]
+            if (subjects := details.find("div", class_="list-subjects")) is not None:
+                entry.subjects = [subject.strip() for subject in _clean(subjects.text).split(";") if subject.strip()]
+        entries[arxiv_id] = entry
+
+    return list(entries.values())
+
+
+def check_parity(name: str, content: bytes) -> bool:
+    expected: list[str] = _extract_identifiers_bs4(content)
+    actual: list[str] = _extract_identifiers_fast(content)
+
+    if expected != actual:
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            if a != b:
+                print(f"{name}: identifier {index} differs, {a!r} != {b!r}")
+                break
+        else:
+            print(f"{name}: found {len(actual)} identifiers, expected {len(expected)}")
+        return False
+
+    # The entries stored by a scrape, one listing type at a time and all of them together
+    for include in [[target] for target in TARGETS] + [TARGETS]:
+        expected_entries: list[ListingEntry] = reference_entries(content, include)
+        actual_entries: list[ListingEntry] = extract_listing_entries(content, include)
+        if expected_entries != actual_entries:
+            for a, b in zip(expected_entries, actual_entries):
+                if a != b:
+                    print(f"{name}: entries differ for {include}, {a!r} != {b!r}")
+                    break
+            else:
+                print(f"{name}: found {len(actual_entries)} entries for {include}, expected {len(expected_entries)}")
+            return False
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per page and implementation")
+    args = parser.parse_args()
+
+    pages: dict[str, bytes] = {path.name.removesuffix(".html.gz"): gzip.decompress(path.read_bytes())
+                               for path in sorted(CORPUS_DIR.glob("*.html.gz"))}
+    if not pages:
+        sys.exit(f"No pages found in {CORPUS_DIR}, run make_corpus.py")
+
+    failures: list[str] = [name for name, content in pages.items() if not check_parity(name, content)]
+    if failures:
+        sys.exit(f"Parity check failed for {', '.join(failures)}")
+    print(f"Parity check passed for {len(pages)} pages\n")
+
+    print(f"{'page':<16} {'KiB':>8} {'ids':>6} {'bs4 ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for name, content in pages.items():
+        num_ids: int = len(_extract_identifiers_fast(content))
+        slow: float = min(timeit.repeat(lambda: _extract_identifiers_bs4(content), number=1, repeat=args.repeat))
+        fast: float = min(timeit.repeat(lambda: _extract_identifiers_fast(content), number=1, repeat=args.repeat))
+        print(f"{name:<16} {len(content) / 1024:>8.0f} {num_ids:>6} {slow * 1000:>10.2f} {fast * 1000:>10.3f} "
+              f"{slow / fast if fast else float('inf'):>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
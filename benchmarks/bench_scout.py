@@ -0,0 +1,513 @@
+"""
+Benchmark Scout's hot paths against synthetic paper and metric tables
+
+For each size the paper table is filled with that many rows (and the metric table
+with one row per thousand papers), then each benchmark drives the application
+through the Flask test client, with listings served by a local stand-in for arXiv.
+Throughput, p50/p99 latency and peak RSS are reported for every benchmark, each of
+which runs in a fresh process so that peak RSS is its own
+
+Databases are generated once per size and seed and kept in the data directory,
+benchmarks that write to the database run against a copy
+
+Usage
+python benchmarks/bench_scout.py [--sizes 10k,1m,10m] [--benchmarks papers,export] [--repeat 5]
+python benchmarks/bench_scout.py --compare benchmarks/results/<earlier>.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+
+ROOT: Path = Path(__file__).resolve().parent.parent
+BENCHMARKS_DIR: Path = Path(__file__).resolve().parent
+DATA_DIR: Path = BENCHMARKS_DIR / "data"
+RESULTS_DIR: Path = BENCHMARKS_DIR / "results"
+
+# Papers are spread evenly over days starting from BASE_DATE, with new-style IDs from FIRST_YYMM
+BASE_DATE: datetime = datetime(2015, 1, 1)
+PAPERS_PER_DAY: int = 2_000
+FIRST_YYMM: int = 1501
+METRICS_PER_PAPER: float = 1 / 1_000
+
+# Uploads use IDs from months after those in the table, one month per run
+UPLOAD_ROWS: int = 100_000
+UPLOAD_YYMM: int = 5001
+
+# Repositories scraped from the stub, and the size of their listings
+SCRAPE_REPOSITORIES: int = 40
+
+# Requests to the export API made by each enrichment run, and the papers in each
+ENRICH_BATCHES: int = 20
+ENRICH_BATCH_SIZE: int = 400
+
+SIZES: dict[str, int] = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+# Benchmarks ----------------------------------------------------------------------------------------------------------
+
+class Run:
+    """
+    Measurements of a benchmark, one latency per timed operation
+    """
+
+    def __init__(self, unit: str):
+        self.unit: str = unit
+        self.items: int = 0
+        self.latencies: list[float] = []
+
+    def time(self, func: Callable[[], int]):
+        """
+        :param func: Operation to time, returning the number of items it processed
+        """
+        start: float = time.perf_counter()
+        items: int = func()
+        self.latencies.append(time.perf_counter() - start)
+        self.items += items
+
+
+def bench_extract(context: dict, repeat: int) -> Run:
+    from listing import extract_listing_entries
+    from synthetic import CORPUS, listing_page
+
+    pages: list[bytes] = [listing_page(*spec, seed=sum(map(ord, name))).encode("utf8")
+                          for name, spec in CORPUS.items()]
+    run = Run("ids")
+    for _ in range(repeat):
+        for page in pages:
+            run.time(lambda: len(extract_listing_entries(page, ["new", "cross-list", "replaced"])))
+    return run
+
+
+def bench_scrape(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    run = Run("repositories")
+
+    def scrape() -> int:
+        response = client.get("/scrape", headers={"Accept": "application/json"})
+        job_id: int = response.get_json()["job_id"]
+        while (job := client.get(f"/jobs/{job_id}").get_json())["status"] not in ("finished", "failed"):
+            time.sleep(0.005)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Scrape failed: {job['error']}")
+        return len(job["progress"].get("repositories", {}))
+
+    for _ in range(repeat):
+        run.time(scrape)
+    return run
+
+
+def bench_enrich(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    run = Run("papers")
+
+    def enrich() -> int:
+        response = client.get("/enrich", headers={"Accept": "application/json"})
+        job_id: int = response.get_json()["job_id"]
+        while (job := client.get(f"/jobs/{job_id}").get_json())["status"] not in ("finished", "failed"):
+            time.sleep(0.005)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Enrichment failed: {job['error']}")
+        return job["progress"]["enriched"] + job["progress"]["missing"]
+
+    # Each run continues from where the previous one stopped
+    for _ in range(repeat):
+        run.time(enrich)
+    return run
+
+
+def bench_upload(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    rows: int = min(context["size"], UPLOAD_ROWS)
+    run = Run("rows")
+
+    for index in range(repeat):
+        lines: list[str] = ["Id,Date"] + [f"{_add_months(UPLOAD_YYMM, index)}.{sequence:05d},2023-06-01"
+                                          for sequence in range(rows)]
+        body: bytes = "\n".join(lines).encode("utf8")
+
+        def upload() -> int:
+            response = client.post("/upload?filename=papers.csv", data=body, headers={"Accept": "application/json"})
+            if response.status_code != 200:
+                raise RuntimeError(f"Upload failed: {response.get_json()}")
+            return response.get_json()["rows"]
+
+        run.time(upload)
+    return run
+
+
+def bench_papers(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    days: int = _num_days(context["size"])
+    rng = random.Random(context["seed"])
+    run = Run("ids")
+
+    # One request per day, for a sample of days
+    for _ in range(repeat * 20):
+        day: datetime = BASE_DATE + timedelta(days=rng.randrange(days))
+        url: str = f"/papers?start_date={day:%d-%m-%Y}&end_date={day + timedelta(days=1):%d-%m-%Y}"
+        run.time(lambda: len(client.get(url).get_json()))
+    return run
+
+
+def bench_papers_paged(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    days: int = _num_days(context["size"])
+    rng = random.Random(context["seed"])
+    run = Run("ids")
+
+    # Walk a week of papers a page at a time, timing each page
+    for _ in range(repeat):
+        start: datetime = BASE_DATE + timedelta(days=rng.randrange(max(days - 7, 1)))
+        url: str = f"/papers?start_date={start:%d-%m-%Y}&end_date={start + timedelta(days=7):%d-%m-%Y}&limit=1000"
+        cursor: str | None = ""
+
+        while cursor is not None:
+            page: dict = {}
+
+            def get_page() -> int:
+                page.update(client.get(f"{url}&after={cursor}" if cursor else url).get_json())
+                return len(page["ids"])
+
+            run.time(get_page)
+            cursor = page["next"]
+    return run
+
+
+def bench_changes(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    rng = random.Random(context["seed"])
+    run = Run("ids")
+
+    # Follow the change feed for a few pages from a random point, as a consumer catching up would
+    for _ in range(repeat):
+        cursor: str = str(rng.randrange(max(context["size"] - 5_000, 1)))
+        for _ in range(5):
+            page: dict = {}
+
+            def get_page() -> int:
+                page.update(client.get(f"/papers/changes?since={cursor}&limit=1000").get_json())
+                return len(page["papers"])
+
+            run.time(get_page)
+            cursor = page["next"]
+            if not page["more"]:
+                break
+    return run
+
+
+def bench_export(context: dict, repeat: int) -> Run:
+    client = context["client"]
+    run = Run("rows")
+
+    def export() -> int:
+        response = client.get("/export?format=csv", buffered=False)
+        lines: int = sum(chunk.count(b"\n") for chunk in response.iter_encoded())
+        response.close()
+        return lines - 1
+
+    for _ in range(repeat):
+        run.time(export)
+    return run
+
+
+def bench_chart(context: dict, repeat: int) -> Run:
+    from charts import render_metrics_to_bokeh
+
+    run = Run("charts")
+    with context["app"].app_context():
+        for _ in range(repeat):
+            run.time(lambda: int(render_metrics_to_bokeh(force=True)))
+    return run
+
+
+# Name, function, whether it depends on the size of the tables and whether it writes to them
+BENCHMARKS: dict[str, tuple[Callable[[dict, int], Run], bool, bool]] = {
+    "extract": (bench_extract, False, False),
+    "scrape": (bench_scrape, True, True),
+    "upload": (bench_upload, True, True),
+    "enrich": (bench_enrich, True, True),
+    "papers": (bench_papers, True, False),
+    "papers_paged": (bench_papers_paged, True, False),
+    "changes": (bench_changes, True, False),
+    "export": (bench_export, True, False),
+    "chart": (bench_chart, True, False),
+}
+
+
+# Synthetic database --------------------------------------------------------------------------------------------------
+
+def _add_months(yymm: int, months: int) -> int:
+    year, month = divmod(yymm, 100)
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year * 100 + month + 1
+
+
+def _num_days(size: int) -> int:
+    return max(-(-size // PAPERS_PER_DAY), 1)
+
+
+def _paper_rows(size: int):
+    from arxiv_ids import encode_arxiv_id
+
+    seconds_per_paper: float = 86400 / PAPERS_PER_DAY
+    for index in range(size):
+        month, sequence = divmod(index, 100_000)
+        arxiv_id: str = f"{_add_months(FIRST_YYMM, month)}.{sequence:05d}"
+        day, offset = divmod(index, PAPERS_PER_DAY)
+        index_date: datetime = BASE_DATE + timedelta(days=day, seconds=offset * seconds_per_paper)
+        yield arxiv_id, index_date.strftime("%Y-%m-%d %H:%M:%S.%f"), encode_arxiv_id(arxiv_id)
+
+
+def _metric_rows(size: int, seed: int):
+    rng = random.Random(seed)
+    for index in range(max(int(size * METRICS_PER_PAPER), 1)):
+        found: int = rng.randint(500, 3000)
+        index_date: datetime = BASE_DATE + timedelta(hours=6 * index)
+        yield index_date.strftime("%Y-%m-%d %H:%M:%S.%f"), found, rng.randint(0, found), rng.randint(0, 40)
+
+
+def build_database(path: Path, size: int, seed: int):
+    """
+    Create the schema through the application, then fill the tables directly for speed
+    """
+    import app as scout_app
+    from db import db
+
+    print(f"Generating {size:,} papers in {path}", file=sys.stderr)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary: Path = path.with_suffix(".tmp")
+    temporary.unlink(missing_ok=True)
+
+    app = scout_app.create_app({"SCHEDULER_ENABLED": False, "MIGRATE": "auto",
+                                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{temporary}"},
+                               instance_path=tempfile.mkdtemp(prefix="scout-bench-"))
+    with app.app_context():
+        db.engine.dispose()
+
+    connection = sqlite3.connect(temporary)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.execute("PRAGMA synchronous=OFF")
+    with connection:
+        connection.executemany("INSERT INTO paper (arxiv_id, index_date, arxiv_key) VALUES (?, ?, ?)",
+                               _paper_rows(size))
+        connection.executemany("INSERT INTO metric (index_date, papers_found, papers_added, cache_hits) "
+                               "VALUES (?, ?, ?, ?)", _metric_rows(size, seed))
+        connection.execute("UPDATE paper SET ingest_seq = rowid")
+        connection.execute("UPDATE stat SET value = (SELECT COUNT(*) FROM paper) WHERE key = 'paper_count'")
+        connection.execute("UPDATE stat SET value = (SELECT MAX(ingest_seq) FROM paper) WHERE key = 'ingest_seq'")
+    connection.execute("VACUUM")
+    connection.close()
+
+    os.replace(temporary, path)
+
+
+# Worker --------------------------------------------------------------------------------------------------------------
+
+def run_worker(name: str, size: int, seed: int, repeat: int, data_dir: Path) -> dict:
+    """
+    Run a single benchmark in this process
+
+    :return: Result of the benchmark
+    """
+    sys.path[:0] = [str(ROOT / "scout"), str(ROOT), str(BENCHMARKS_DIR)]
+    os.chdir(ROOT / "scout")
+
+    from arxiv_stub import ArxivStub
+    from fetcher import TokenBucket
+    import settings
+
+    func, sized, writes = BENCHMARKS[name]
+    workdir: Path = Path(tempfile.mkdtemp(prefix="scout-bench-"))
+    stub = ArxivStub().start()
+
+    try:
+        # The config points the scraper at the stub, without caching so that every scrape parses every page
+        # and every request for papers runs its query
+        config: dict = dict(settings.load_config())
+        config.update(arxiv_url=stub.url,
+                      repositories=config["repositories"][:SCRAPE_REPOSITORIES],
+                      http_cache={"enabled": False},
+                      response_cache={"enabled": False},
+                      enrich={"api_url": f"{stub.url}/api/query", "batch_size": ENRICH_BATCH_SIZE,
+                              "max_in_flight": 4, "max_batches": ENRICH_BATCHES},
+                      scrape_interval_minutes=0,
+                      logging={"level": "WARNING", "levels": {}, "format": "text"})
+        config_path: Path = workdir / "config.yml"
+        config_path.write_text(json.dumps(config))
+        settings.config_service = settings.ConfigService(config_path)
+
+        database: Path = data_dir / f"papers-{size}-{seed}.sqlite"
+        if sized and not database.exists():
+            build_database(database, size, seed)
+        if writes:
+            shutil.copy(database, workdir / database.name)
+            database = workdir / database.name
+
+        import app as scout_app
+        import work_queue
+        app = scout_app.create_app({"SCHEDULER_ENABLED": False, "MIGRATE": "auto",
+                                    "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}" if sized else "sqlite://"},
+                                   instance_path=str(workdir / "instance"))
+
+        # arXiv's rate limit is not applied to the stub
+        work_queue.get_rate_limiter = lambda seconds_per_request: TokenBucket(0)
+
+        context: dict = {"app": app, "client": app.test_client(), "size": size, "seed": seed}
+        rss_before: int = _peak_rss()
+        run: Run = func(context, repeat)
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Throughput is over the timed operations only, excluding the preparation of their inputs
+    latencies: list[float] = sorted(run.latencies)
+    elapsed: float = sum(latencies)
+    return {"benchmark": name,
+            "size": size if sized else None,
+            "operations": len(latencies),
+            "items": run.items,
+            "unit": run.unit,
+            "seconds": elapsed,
+            "throughput": run.items / elapsed if elapsed > 0 else None,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+            "rss_before_mb": rss_before / 1024 / 1024,
+            "peak_rss_mb": _peak_rss() / 1024 / 1024}
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    # Nearest rank, values must be sorted
+    if not values:
+        return 0.0
+    rank: int = max(-(-len(values) * percentile // 100), 1)
+    return values[int(rank) - 1]
+
+
+def _peak_rss() -> int:
+    # Kilobytes on Linux, bytes on macOS
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Driver --------------------------------------------------------------------------------------------------------------
+
+def run_benchmarks(names: list[str], sizes: list[int], seed: int, repeat: int, data_dir: Path) -> list[dict]:
+    results: list[dict] = []
+    for size in sizes:
+        for name in names:
+            sized: bool = BENCHMARKS[name][1]
+            if not sized and size != sizes[0]:
+                continue
+
+            command: list[str] = [sys.executable, __file__, "--worker", name, "--size", str(size), "--seed", str(seed),
+                                  "--repeat", str(repeat), "--data-dir", str(data_dir)]
+            process = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+            if process.returncode != 0:
+                print(f"{name} failed for {size:,} papers", file=sys.stderr)
+                continue
+
+            result: dict = json.loads(process.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(_format_result(result))
+    return results
+
+
+def _format_result(result: dict, baseline: dict | None = None) -> str:
+    size: str = f"{result['size']:,}" if result["size"] else "-"
+    line: str = (f"{result['benchmark']:<14} {size:>12} {result['throughput']:>14,.0f} {result['unit'] + '/s':<16} "
+                 f"{result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['peak_rss_mb']:>10.0f}")
+    if baseline is not None and baseline.get("throughput"):
+        line += f" {result['throughput'] / baseline['throughput']:>8.2f}x"
+    return line
+
+
+def _header(compare: bool = False) -> str:
+    return (f"{'benchmark':<14} {'papers':>12} {'throughput':>14} {'':<16} {'p50 ms':>10} {'p99 ms':>10} "
+            f"{'RSS MiB':>10}" + (f" {'vs base':>9}" if compare else ""))
+
+
+def compare(results: list[dict], baseline_path: Path):
+    baseline: dict = {(result["benchmark"], result["size"]): result
+                      for result in json.loads(baseline_path.read_text())["results"]}
+
+    print(f"\nCompared with {baseline_path}")
+    print(_header(compare=True))
+    for result in results:
+        print(_format_result(result, baseline.get((result["benchmark"], result["size"]))))
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_sizes(value: str) -> list[int]:
+    return [SIZES[size.lower()] if size.lower() in SIZES else int(size) for size in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k", help=f"Comma separated sizes, e.g. {','.join(SIZES)}")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="Comma separated benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Location of the generated databases")
+    parser.add_argument("--output", type=Path, help="Results file, defaults to a new file in benchmarks/results")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare throughput with")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.size, args.seed, args.repeat, args.data_dir)))
+        return
+
+    names: list[str] = args.benchmarks.split(",")
+    unknown: list[str] = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmarks {', '.join(unknown)}, expected {', '.join(BENCHMARKS)}")
+
+    sizes: list[int] = _parse_sizes(args.sizes)
+    started_at: datetime = datetime.now(timezone.utc)
+
+    print(_header())
+    results: list[dict] = run_benchmarks(names, sizes, args.seed, args.repeat, args.data_dir)
+
+    output: Path = args.output or RESULTS_DIR / f"{started_at:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"started_at": started_at.isoformat(),
+                                  "commit": _git_commit(),
+                                  "python": platform.python_version(),
+                                  "platform": platform.platform(),
+                                  "cpus": os.cpu_count(),
+                                  "seed": args.seed,
+                                  "repeat": args.repeat,
+                                  "results": results}, indent=2))
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if len(results) != len([name for name in names if BENCHMARKS[name][1]]) * len(sizes) + \
+            len([name for name in names if not BENCHMARKS[name][1]]):
+        sys.exit("Some benchmarks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Check that ingest stores exactly the identifiers the paper table does not hold yet
+
+Known identifiers are dropped by the in-memory filter before they reach SQLite, so the
+filter must agree with the primary key of the paper table. An identifier with a version,
+e.g. 2306.01234v2, is a different key to 2306.01234 and each must be stored once, whether
+they arrive in one chunk or in separate ones, and whether the filter was built as papers
+were stored or loaded from the database
+
+Exits with a non-zero status if any case stores the wrong number of papers
+
+Usage
+python benchmarks/check_ingest_ids.py
+"""
+from __future__ import annotations
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+ROOT: Path = Path(__file__).resolve().parent.parent
+
+# Identifiers stored by each step in turn and the number of new papers expected, each step is one call to insert_papers
+CASES: list[tuple[str, list[str], int]] = [
+    ("unversioned", ["2306.01234"], 1),
+    ("versioned after unversioned", ["2306.01234v2"], 1),
+    ("versioned and unversioned in one chunk", ["2306.05555v1", "2306.05555"], 2),
+    ("repeated in one chunk", ["2306.06666v1", "2306.06666v1", "2306.06666"], 2),
+    ("every stored identifier again", ["2306.01234", "2306.01234v2", "2306.05555v1", "2306.05555",
+                                       "2306.06666v1", "2306.06666"], 0),
+    ("another version", ["2306.01234v3"], 1),
+    ("old-style", ["hep-th/9901001", "hep-th/9901001v2"], 2),
+]
+
+
+def main():
+    sys.path[:0] = [str(ROOT / "scout"), str(ROOT)]
+    os.chdir(ROOT / "scout")
+
+    import app as scout_app
+    from db import db, migrate
+    from ingest import insert_papers, load_id_filter
+
+    app = scout_app.create_app({"SCHEDULER_ENABLED": False, "MIGRATE": "auto", "SQLALCHEMY_DATABASE_URI": "sqlite://"},
+                               instance_path=tempfile.mkdtemp(prefix="scout-check-"))
+
+    failures: list[str] = []
+    with app.app_context():
+        stored: set[str] = set()
+        for name, arxiv_ids, expected in CASES:
+            added: int = insert_papers(((arxiv_id, datetime(2023, 6, 1)) for arxiv_id in arxiv_ids), source="check")
+            stored.update(arxiv_ids)
+            print(f"{name:<45} stored {added}, expected {expected}")
+            if added != expected:
+                failures.append(f"{name}: stored {added} papers, expected {expected}")
+
+        # A filter loaded from the database must agree with one built as papers were stored
+        id_filter = load_id_filter()
+        for arxiv_id in sorted(stored):
+            if arxiv_id not in id_filter:
+                failures.append(f"Loaded filter is missing {arxiv_id}")
+        for arxiv_id in ("2306.01234v4", "2306.05555v2", "2306.06666v2", "hep-th/9901001v3"):
+            if arxiv_id in id_filter:
+                failures.append(f"Loaded filter claims {arxiv_id} is stored")
+
+        # Versioned identifiers given a key by an earlier version are repaired by the migration
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("UPDATE paper SET arxiv_key = 230601234 WHERE arxiv_id = '2306.01234v2'")
+        migrate()
+        with db.engine.connect() as connection:
+            key = connection.exec_driver_sql("SELECT arxiv_key FROM paper WHERE arxiv_id = '2306.01234v2'").scalar()
+        if key is not None:
+            failures.append(f"Migration left the key {key} of 2306.01234v2")
+
+    if failures:
+        sys.exit("\n".join(failures))
+    print("All identifiers were stored exactly once")
+
+
+if __name__ == "__main__":
+    main()
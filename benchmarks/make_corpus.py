@@ -0,0 +1,51 @@
+"""
+Regenerate the listing pages in benchmarks/corpus
+
+Usage
+python benchmarks/make_corpus.py
+"""
+from __future__ import annotations
+import gzip
+from pathlib import Path
+
+from synthetic import CORPUS, listing_page
+
+CORPUS_DIR: Path = Path(__file__).parent / "corpus"
+
+# Hand-written page covering markup that the extractors must agree on
+EDGE_CASES: str = """<!DOCTYPE html>
+<html><head><title>Edge cases</title></head>
+<body>
+<!-- <span class="list-identifier">arXiv:9999.99999</span> is commented out -->
+<p>The class list-identifier may appear in text, or in another attribute <a title="list-identifier">here</a>.</p>
+<dl>
+<dt><span class='list-identifier'><a href="/abs/2306.00001">arXiv:2306.00001</a> [<a href="/pdf/2306.00001">pdf</a>]</span></dt>
+<dt><span class="meta list-identifier extra"><a href="/abs/2306.00002">arXiv:2306.00002</a> (cross-list from math.OC) [pdf]</span></dt>
+<dt><SPAN CLASS=list-identifier><A HREF="/abs/2306.00003">arXiv:2306.00003</A> (replaced) [<!-- hidden -->pdf]</SPAN></dt>
+<dt><span class="list-identifier-wide">arXiv:2306.00004</span></dt>
+<dt><div class="list-identifier"><b>arXiv:2306.00005</b>&nbsp;&amp;&#160;(cross-list from cs.AI)</div></dt>
+<dt><span class="list-identifier"><a href="/abs/2306.00006">arXiv:2306.00006</a> Jos&eacute; [pdf]</span></dt>
+<dt><span class="list-identifier"></span></dt>
+<dt><span class="list-identifier">arXiv:2306.00007
+ [pdf]</span></dt>
+</dl>
+</body></html>
+"""
+
+
+def main():
+    CORPUS_DIR.mkdir(exist_ok=True)
+
+    for name, (category, new, cross_lists, replaced) in CORPUS.items():
+        page: str = listing_page(category, new, cross_lists, replaced, seed=sum(map(ord, name)))
+        path: Path = CORPUS_DIR / f"{name}.new.html.gz"
+        path.write_bytes(gzip.compress(page.encode("utf8"), mtime=0))
+        print(f"Wrote {path} ({len(page):,} bytes)")
+
+    path: Path = CORPUS_DIR / "edge_cases.html.gz"
+    path.write_bytes(gzip.compress(EDGE_CASES.encode("utf8"), mtime=0))
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Report the cold-start cost of Scout, from importing the app to create_app returning
+
+Each run is a fresh interpreter against a database that has already been migrated,
+as on a normal start. The median time to import the app and to create it are
+compared with the budget, and the modules that are slowest to import are listed
+from a run under -X importtime. Modules that only some requests need, such as
+pandas for uploads or bokeh for the chart, must not be loaded during start up
+
+Exits with a non-zero status if start up is over budget or loads one of those modules,
+so that it can be run as a check
+
+Usage
+python benchmarks/startup_report.py [--runs 5] [--budget-ms 1000] [--top 15]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT: Path = Path(__file__).resolve().parent.parent
+SCOUT_DIR: Path = ROOT / "scout"
+
+# Imported on first use by the requests that need them, never at start up
+DEFERRED_MODULES: tuple[str, ...] = ("pandas", "numpy", "bokeh", "pyarrow", "requests")
+
+# Run in each fresh interpreter, printing the timings as JSON on the last line of stdout
+CHILD: str = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({"SCHEDULER_ENABLED": False, "MIGRATE": sys.argv[2], "SQLALCHEMY_DATABASE_URI": sys.argv[1]},
+               instance_path=sys.argv[3])
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "create_app_ms": (created - imported) * 1000,
+                  "modules": sorted({name.partition(".")[0] for name in sys.modules})}))
+"""
+
+
+def run_child(database: Path, instance_path: Path, migrate: str = "check",
+              importtime: bool = False) -> tuple[dict, str]:
+    """
+    Create the app in a fresh interpreter
+
+    :param database: Database file, which must already be migrated unless migrate is auto
+    :param instance_path: Instance directory of the app
+    :param migrate: MIGRATE setting of the app
+    :param importtime: Whether to run under -X importtime, which slows imports
+    :return: Timings and top-level modules loaded, and the report of -X importtime
+    """
+    env: dict = dict(os.environ, PYTHONPATH=os.pathsep.join([str(SCOUT_DIR), str(ROOT)]))
+    command: list[str] = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", CHILD,
+                          f"sqlite:///{database}", migrate, str(instance_path)]
+    process = subprocess.run(command, cwd=SCOUT_DIR, env=env, capture_output=True, text=True)
+    if process.returncode:
+        sys.exit(f"Failed to create the app:\n{process.stderr}")
+
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def parse_importtime(report: str) -> list[tuple[int, int, str]]:
+    """
+    :param report: Standard error of a run under -X importtime
+    :return: Self and cumulative microseconds of each import, with its name indented by depth
+    """
+    imports: list[tuple[int, int, str]] = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        imports.append((int(own), int(cumulative), name.rstrip()))
+
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="Budget for importing and creating the app")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    workdir: Path = Path(tempfile.mkdtemp(prefix="scout-startup-"))
+    database: Path = workdir / "scout.sqlite"
+    instance_path: Path = workdir / "instance"
+
+    # Migrated once up front, as it is before a normal start
+    run_child(database, instance_path, migrate="auto")
+
+    runs: list[dict] = [run_child(database, instance_path)[0] for _ in range(max(args.runs, 1))]
+    import_ms: float = statistics.median(run["import_ms"] for run in runs)
+    create_app_ms: float = statistics.median(run["create_app_ms"] for run in runs)
+    total_ms: float = import_ms + create_app_ms
+
+    _, report = run_child(database, instance_path, importtime=True)
+    imports: list[tuple[int, int, str]] = parse_importtime(report)
+
+    print(f"Slowest imports under -X importtime, of {len(imports):,}")
+    print(f"{'self ms':>9} {'cumulative ms':>14}  module")
+    for own, cumulative, name in sorted(imports, key=lambda entry: entry[1], reverse=True)[:args.top]:
+        print(f"{own / 1000:>9.1f} {cumulative / 1000:>14.1f}  {name}")
+
+    print(f"\nMedian of {len(runs)} runs: import {import_ms:.0f} ms, create_app {create_app_ms:.0f} ms, "
+          f"total {total_ms:.0f} ms of a {args.budget_ms:.0f} ms budget")
+
+    failures: list[str] = []
+    loaded: list[str] = [module for module in DEFERRED_MODULES if module in runs[0]["modules"]]
+    if loaded:
+        failures.append(f"Loaded at start up: {', '.join(loaded)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"Start up took {total_ms:.0f} ms, over the budget of {args.budget_ms:.0f} ms")
+
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
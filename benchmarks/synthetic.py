@@ -0,0 +1,201 @@
+"""
+Synthetic data used by the benchmarks
+
+Listing pages follow the layout of arXiv's /list/<repository>/new pages, so that
+they exercise the same markup as the scraper sees in production
+"""
+from __future__ import annotations
+import html
+import random
+
+SUBJECTS: dict[str, str] = {
+    "cs.AI": "Artificial Intelligence",
+    "cs.CL": "Computation and Language",
+    "cs.CV": "Computer Vision and Pattern Recognition",
+    "cs.DL": "Digital Libraries",
+    "cs.LG": "Machine Learning",
+    "cs.RO": "Robotics",
+    "math.OC": "Optimization and Control",
+    "stat.ML": "Machine Learning",
+    "eess.IV": "Image and Video Processing",
+    "q-bio.NC": "Neurons and Cognition",
+}
+
+WORDS: list[str] = ("learning neural network model graph data robust efficient transformer attention "
+                    "language vision diffusion reinforcement policy optimal bounds scalable sparse "
+                    "federated benchmark towards understanding causal inference generative adversarial "
+                    "quantum kernel private fair multi-agent planning retrieval").split()
+
+NAMES: list[str] = ("Alice Bob Carol Dan Erin Frank Grace Heidi Ivan Judy Mallory Niaj Olivia Peggy "
+                    "Rupert Sybil Trent Victor Walter Zoë José Łukasz Chloé").split()
+
+
+def arxiv_id(rng: random.Random, yymm: str = "2306") -> str:
+    return f"{yymm}.{rng.randrange(0, 99999):05d}"
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))).capitalize()
+
+
+def _authors(rng: random.Random) -> list[str]:
+    return [f"{rng.choice(NAMES)} {rng.choice(NAMES)}son" for _ in range(rng.randint(1, 8))]
+
+
+def _entry(rng: random.Random, item: int, paper_id: str, category: str, annotation: str) -> str:
+    subjects: list[str] = [category] + rng.sample(sorted(SUBJECTS), rng.randint(0, 2))
+    subjects = list(dict.fromkeys(subjects))
+    subject_text: str = "; ".join(f"{SUBJECTS.get(code, code)} ({code})" for code in subjects[1:])
+    primary: str = f'<span class="primary-subject">{SUBJECTS.get(subjects[0], subjects[0])} ({subjects[0]})</span>'
+    authors: str = ", \n".join(f'<a href="/search/cs?searchtype=author&amp;query={html.escape(name)}">{html.escape(name)}</a>'
+                               for name in _authors(rng))
+    return f"""<dt><a name="item{item}">[{item}]</a>&nbsp;  <span class="list-identifier"><a href="/abs/{paper_id}" title="Abstract">arXiv:{paper_id}</a> {annotation}[<a href="/pdf/{paper_id}" title="Download PDF">pdf</a>, <a href="/format/{paper_id}" title="Other formats">other</a>]</span></dt>
+<dd>
+<div class="meta">
+<div class="list-title mathjax">
+<span class="descriptor">Title:</span> {html.escape(_title(rng))}
+</div>
+<div class="list-authors">
+<span class="descriptor">Authors:</span>
+{authors}
+</div>
+<div class="list-comments mathjax">
+<span class="descriptor">Comments:</span> {rng.randint(4, 40)} pages, {rng.randint(1, 12)} figures
+</div>
+<div class="list-subjects">
+<span class="descriptor">Subjects:</span> {primary}{'; ' + subject_text if subject_text else ''}
+</div>
+<p class="mathjax">{html.escape(' '.join(rng.choice(WORDS) for _ in range(rng.randint(80, 200))))} &amp; $O(n^2)$.
+</p>
+</div>
+</dd>
+"""
+
+
+def listing_page(category: str, new: int, cross_lists: int, replaced: int, seed: int = 0) -> str:
+    """
+    Build a listing page with the given number of each type of entry
+
+    :param category: Repository of the listing, e.g. cs.LG
+    :param new: Number of new submissions
+    :param cross_lists: Number of cross-listed submissions
+    :param replaced: Number of replacements
+    :param seed: Seed of the random content
+    :return: Page HTML
+    """
+    rng = random.Random(seed)
+    sections: list[str] = []
+    item: int = 1
+
+    others: list[str] = [code for code in SUBJECTS if code != category]
+    for heading, count, annotation in (("New submissions", new, lambda: ""),
+                                       ("Cross-lists", cross_lists, lambda: f"(cross-list from {rng.choice(others)}) "),
+                                       ("Replacements", replaced, lambda: "(replaced) ")):
+        if not count:
+            continue
+
+        entries: list[str] = []
+        for _ in range(count):
+            yymm: str = "2306" if heading != "Replacements" else rng.choice(["2211", "2302", "2305"])
+            entries.append(_entry(rng, item, arxiv_id(rng, yymm), category, annotation()))
+            item += 1
+
+        sections.append(f"<h3>{heading} for Fri,  2 Jun 23</h3>\n<dl>\n{''.join(entries)}</dl>\n")
+
+    if not sections:
+        sections.append("<h3>No new submissions for Fri,  2 Jun 23</h3>\n")
+
+    paging: str = (f'<small>[ showing up to 2000 entries per page: <a href="/list/{category}/new?skip=0&amp;show=25">fewer</a> | '
+                   f'<a href="/list/{category}/new?skip=0&amp;show=5000">more</a> ]</small>')
+    return _document(category, "new", paging, "".join(sections))
+
+
+def monthly_page(category: str, yymm: str, total: int, skip: int = 0, show: int = 2000, seed: int = 0) -> str:
+    """
+    Build a page of the listing of a month, /list/<repository>/<yymm>?skip=&show=
+
+    :param category: Repository of the listing, e.g. cs.LG
+    :param yymm: Month of the listing, e.g. 2306
+    :param total: Number of entries in the whole month
+    :param skip: Entries before the first on the page
+    :param show: Maximum number of entries on the page
+    :param seed: Seed of the random content, the same entry has the same content on every request
+    :return: Page HTML
+    """
+    entries: list[str] = []
+    for item in range(skip + 1, min(skip + show, total) + 1):
+        rng = random.Random(f"{seed}-{category}-{yymm}-{item}")
+        entries.append(_entry(rng, item, f"{yymm}.{(seed * 7919 + item) % 100000:05d}", category, ""))
+
+    paging: str = f'<div class="paging">Total of {total} entries : <span>{skip + 1}-{min(skip + show, total)}</span></div>'
+    body: str = f"<h3>Authors and titles for {yymm}</h3>\n<dl>\n{''.join(entries)}</dl>\n" if entries else ""
+    return _document(category, yymm, paging, body)
+
+
+def _document(category: str, listing: str, paging: str, body: str) -> str:
+    name: str = SUBJECTS.get(category, category)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>{name}  authors/titles "{listing}"</title>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+<link rel="stylesheet" type="text/css" media="screen" href="/static/browse/0.3.4/css/arXiv.css" />
+<script type="text/javascript">
+  // Highlight the identifier of the entry under the cursor
+  document.querySelectorAll('.list-identifier').forEach(function (el) {{ el.dataset.ready = "1"; }});
+  var template = '<span class="list-identifier">arXiv:0000.00000</span>';
+</script>
+<style>.list-identifier {{ font-weight: bold; }}</style>
+</head>
+<body class="with-cu-identity">
+<!-- Each entry has a <span class="list-identifier"> with its ID -->
+<div id="dlpage">
+<h1>{name} ({category})</h1>
+{paging}
+{body}
+</div>
+</body>
+</html>
+"""
+
+
+def atom_feed(arxiv_ids: list[str], rng: random.Random) -> str:
+    """
+    Build a response of the export API listing the given papers, in the layout of the Atom feed
+    """
+    entries: list[str] = []
+    for paper_id in arxiv_ids:
+        subjects: list[str] = rng.sample(sorted(SUBJECTS), rng.randint(1, 3))
+        authors: str = "".join(f"\n    <author>\n      <name>{html.escape(name)}</name>\n    </author>"
+                               for name in _authors(rng))
+        categories: str = "".join(f'\n    <category term="{code}" scheme="http://arxiv.org/schemas/atom"/>'
+                                  for code in subjects)
+        abstract: str = html.escape(" ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 200))))
+        entries.append(f"""  <entry>
+    <id>http://arxiv.org/abs/{paper_id}v{rng.randint(1, 3)}</id>
+    <updated>2023-06-0{rng.randint(2, 9)}T17:59:59Z</updated>
+    <published>2023-06-01T17:59:59Z</published>
+    <title>{html.escape(_title(rng))}</title>
+    <summary>  {abstract}
+</summary>{authors}
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="{subjects[0]}" scheme="http://arxiv.org/schemas/atom"/>{categories}
+  </entry>
+""")
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title type="html">ArXiv Query: id_list={",".join(arxiv_ids)}</title>
+  <id>http://arxiv.org/api/synthetic</id>
+  <updated>2023-06-02T00:00:00-04:00</updated>
+  <opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{len(arxiv_ids)}</opensearch:totalResults>
+{''.join(entries)}</feed>
+"""
+
+
+# Pages checked in to benchmarks/corpus, named after the repository they imitate
+CORPUS: dict[str, tuple[str, int, int, int]] = {
+    "cs.LG": ("cs.LG", 1200, 700, 900),
+    "cs.CV": ("cs.CV", 350, 120, 200),
+    "cs.DL": ("cs.DL", 6, 3, 2),
+    "cs.GL": ("cs.GL", 0, 0, 0),
+}
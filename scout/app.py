@@ -1,10 +1,14 @@
 from __future__ import annotations
 import os
 from utils.typing import PythonScalar
-from utils.default_logging import configure_default_logging
+from utils.default_logging import configure_default_logging, configure_format, configure_levels, configure_log_root
+
+# Log files are kept in the app directory whatever the working directory, set before any module opens them
+configure_log_root(os.path.dirname(os.path.abspath(__file__)))
+
 from flask import Flask, request, render_template
 from flask_sqlalchemy import SQLAlchemy
-from db import db, Paper
+from db import db, is_migrated, migrate, Paper
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +37,7 @@ def create_app(config=None, instance_path=None) -> Flask:
     configure_logging(app)
     configure_blueprints(app)
     configure_error_handlers(app)
+    configure_jobs(app)
 
     logger.info("Application launched successfully")
 
@@ -51,9 +56,20 @@ def configure_app(app: Flask, config):
         SECRET_KEY='dev',
         SQLALCHEMY_DATABASE_URI="sqlite:///scout.sqlite",
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
-        MAX_CONTENT_LENGTH=16 * 1000 * 1000  # 16 MB max for uploaded files
+        MAX_CONTENT_LENGTH=16 * 1000 * 1000 * 1000,  # 16 GB max for uploaded files, which are streamed
+        JOB_WORKERS=2,
+        SCHEDULER_ENABLED=True,
+        RECOVER_JOBS=True,  # Fail jobs left unfinished by the last run, only for the process that runs the jobs
+        MIGRATE="check"  # Either check that the schema is current, or auto to migrate it on start
     )
 
+    if config is not None:
+        app.config.from_mapping(config)
+
+    # Pool and timeouts of the SQLite engine, unless configured explicitly
+    from engine import engine_options
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+
 
 def configure_logging(app: Flask):
     """
@@ -65,6 +81,12 @@ def configure_logging(app: Flask):
     # Configure
     configure_default_logging(logger, "logs/scout.log")
 
+    # Levels and format of the log file from the logging section of the configuration
+    from settings import load_config
+    logging_config: dict = load_config()["logging"]
+    configure_levels(logging_config.get("levels"), default=logging_config.get("level"))
+    configure_format(logging_config.get("format", "text"))
+
     # Test the configuration
     logger.info(f"Logging initialised from {__name__}")
 
@@ -77,14 +99,20 @@ def configure_blueprints(app: Flask):
     """
 
     # create the extension and initialize the app with the extension
+    from engine import configure_engine, init_writer
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        configure_engine(db.engine)
+        configure_schema(app)
+
+    # Writes are serialised through a single thread per application, reads use pooled connections
+    init_writer(app)
 
     import viewer
     app.register_blueprint(viewer.bp)
     app.add_url_rule("/", endpoint="index")
     app.add_url_rule("/papers", endpoint="get_papers")
+    app.add_url_rule("/papers/changes", endpoint="get_paper_changes")
     app.add_url_rule("/upload", endpoint="upload_papers")
     app.add_url_rule("/export", endpoint="export_papers")
 
@@ -97,6 +125,87 @@ def configure_blueprints(app: Flask):
     app.register_blueprint(log_viewer.bp)
     app.add_url_rule("/logs", endpoint="get_latest_logs")
 
+    import stats
+    app.register_blueprint(stats.bp)
+    app.add_url_rule("/stats/summary", endpoint="get_summary")
+
+    import rollups
+    app.register_blueprint(rollups.bp)
+    app.add_url_rule("/stats", endpoint="get_category_stats")
+
+    import enrich
+    app.register_blueprint(enrich.bp)
+    app.add_url_rule("/enrich", endpoint="enrich")
+
+    import search
+    app.register_blueprint(search.bp)
+    app.add_url_rule("/search", endpoint="search")
+
+    import backfill
+    app.register_blueprint(backfill.bp)
+    app.add_url_rule("/backfill", endpoint="backfill")
+
+    import work_queue
+    app.register_blueprint(work_queue.bp)
+    app.add_url_rule("/work", endpoint="get_work_items")
+
+    import instrumentation
+    instrumentation.init_app(app)
+    app.register_blueprint(instrumentation.bp)
+    app.add_url_rule("/metrics", endpoint="get_metrics")
+
+    import jobs
+    app.register_blueprint(jobs.bp)
+    app.add_url_rule("/jobs", endpoint="get_jobs")
+    app.add_url_rule("/jobs/<int:job_id>", endpoint="get_job")
+
+
+def configure_schema(app: Flask):
+    """
+    Check that the database was migrated to the current models, migrating it first if
+    configured to. Migrating inspects every table, so it is a separate step rather than
+    part of each start, run with python app.py migrate
+
+    :param app: Flask application for configuration
+    """
+
+    if is_migrated():
+        return
+
+    # In-memory databases are new on every start
+    uri: str = app.config["SQLALCHEMY_DATABASE_URI"]
+    if app.config["MIGRATE"] == "auto" or uri in ("sqlite://", "sqlite:///:memory:"):
+        logger.info("Migrating database")
+        migrate()
+        return
+
+    raise RuntimeError("Database schema is out of date, run python app.py migrate")
+
+
+def configure_jobs(app: Flask):
+    """
+    Start the background job workers and, if configured, the scrape scheduler
+
+    :param app: Flask application for configuration
+    """
+
+    from jobs import fail_interrupted_jobs, job_queue
+    job_queue.init_app(app, max_workers=app.config["JOB_WORKERS"])
+
+    # Jobs run on the threads of the process, so any still queued or running were interrupted by a restart
+    if app.config["RECOVER_JOBS"]:
+        with app.app_context():
+            fail_interrupted_jobs()
+
+    if not app.config["SCHEDULER_ENABLED"]:
+        return
+
+    # The interval is read on every run, so that changes to the config take effect without a restart
+    import scraper
+    from settings import config_service, install_reload_signal
+    install_reload_signal(config_service)
+    job_queue.schedule("scrape", lambda: config_service.get()["scrape_interval_minutes"], scraper.run_scrape)
+
 
 def configure_error_handlers(app: Flask):
     """
@@ -122,9 +231,24 @@ def configure_error_handlers(app: Flask):
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve Scout, or migrate its database to the current models")
+    parser.add_argument("command", nargs="?", choices=["serve", "migrate"], default="serve")
+    parser.add_argument("--database", default=None, help="SQLAlchemy URI of the database, defaults to the app's")
+    args = parser.parse_args()
+    database: dict = {"SQLALCHEMY_DATABASE_URI": args.database} if args.database else {}
+
+    if args.command == "migrate":
+        create_app({"MIGRATE": "auto", "SCHEDULER_ENABLED": False, "RECOVER_JOBS": False, **database})
+        exit(0)
+
     host: str = "localhost"
     port: int = 4000
     debug: bool = True
     use_reloader: bool = True
-    app = create_app()
+
+    # Only the reloader's child process serves requests, so only it runs the scheduler and the jobs
+    from werkzeug.serving import is_running_from_reloader
+    serving: bool = not use_reloader or is_running_from_reloader()
+    app = create_app({"SCHEDULER_ENABLED": serving, "RECOVER_JOBS": serving, **database})
     app.run(host=host, port=port, debug=debug, use_reloader=use_reloader)
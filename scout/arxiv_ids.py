@@ -0,0 +1,149 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# New-style identifiers, YYMM.NNNN up to 1412 and YYMM.NNNNN from 1501, optionally with a version
+NEW_STYLE_PATTERN = re.compile(r"^(\d{2})(\d{2})\.(\d{4,5})(?:v(\d+))?$")
+
+# First month of five digit sequence numbers
+FIVE_DIGIT_YYMM: int = 1501
+
+# The sequence number occupies the lowest five decimal digits of a key
+SEQUENCE_RANGE: int = 100_000
+
+
+def split_version(arxiv_id: str) -> tuple[str, int | None]:
+    """
+    :return: Identifier without its version suffix, and the version if there was one
+    """
+    base, separator, version = arxiv_id.rpartition("v")
+    if separator and base and version.isdigit() and not base.endswith("/"):
+        return base, int(version)
+    return arxiv_id, None
+
+
+def encode_arxiv_id(arxiv_id: str) -> int | None:
+    """
+    Pack a new-style identifier into an integer, YYMM * 100000 + sequence
+
+    Identifiers with a version are not encoded. They are stored as given, so 2306.01234 and
+    2306.01234v2 are different papers to the database and must not share a key
+
+    :param arxiv_id: Identifier, e.g. 2306.01234
+    :return: Key of the identifier, or None for versioned (e.g. 2306.01234v2) and old-style identifiers
+             (e.g. hep-th/9901001)
+    """
+    match = NEW_STYLE_PATTERN.match(arxiv_id)
+    if match is None or match.group(4) is not None:
+        return None
+
+    yymm: int = int(match.group(1) + match.group(2))
+    sequence: str = match.group(3)
+
+    # The number of digits follows from the month, otherwise e.g. 1412.0123 and 1412.00123 would share a key
+    if not 1 <= yymm % 100 <= 12 or (len(sequence) == 5) != (yymm >= FIVE_DIGIT_YYMM):
+        return None
+
+    return yymm * SEQUENCE_RANGE + int(sequence)
+
+
+class IdFilter:
+    """
+    In-memory set of known identifiers, used to drop known papers before they reach SQLite
+
+    Encoded identifiers are held in a sorted array of 8 byte integers, new
+    identifiers are collected in a set and merged into the array once it grows.
+    Identifiers that cannot be encoded, including any with a version, are held
+    as strings. Membership matches the primary key of the paper table exactly,
+    but the filter may be behind the database if another process writes to it,
+    in which case SQLite still ignores the duplicates
+    """
+
+    def __init__(self, merge_ratio: float = 0.125, min_merge: int = 65_536):
+        """
+        :param merge_ratio: Size of the pending set relative to the array at which they are merged
+        :param min_merge: Size of the pending set below which it is never merged
+        """
+        self.merge_ratio: float = merge_ratio
+        self.min_merge: int = min_merge
+        self._keys: array = array("q")
+        self._pending: set[int] = set()
+        self._others: set[str] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending) + len(self._others)
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        key: int | None = encode_arxiv_id(arxiv_id)
+        if key is None:
+            return arxiv_id in self._others
+
+        return key in self._pending or self._contains_key(key)
+
+    def rebuild(self, keys: Iterable[int], others: Iterable[str] = ()):
+        """
+        Replace the contents of the filter
+
+        :param keys: Encoded identifiers, ideally already sorted
+        :param others: Identifiers that cannot be encoded
+        """
+        rebuilt: array = array("q", keys)
+        if any(rebuilt[i] > rebuilt[i + 1] for i in range(len(rebuilt) - 1)):
+            rebuilt = array("q", sorted(rebuilt))
+
+        with self._lock:
+            self._keys = rebuilt
+            self._pending = set()
+            self._others = set(others)
+
+    def update(self, arxiv_ids: Iterable[str]):
+        """
+        Add identifiers that are now stored in the database
+        """
+        with self._lock:
+            for arxiv_id in arxiv_ids:
+                key: int | None = encode_arxiv_id(arxiv_id)
+                if key is None:
+                    self._others.add(arxiv_id)
+                else:
+                    self._pending.add(key)
+
+            if len(self._pending) >= max(self.min_merge, len(self._keys) * self.merge_ratio):
+                self._merge()
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate size of the encoded identifiers
+        """
+        return self._keys.itemsize * len(self._keys) + 8 * len(self._pending)
+
+    def _contains_key(self, key: int) -> bool:
+        keys: array = self._keys
+        index: int = bisect_left(keys, key)
+        return index < len(keys) and keys[index] == key
+
+    def _merge(self):
+        # Imported here, as numpy is only needed once the pending set is merged
+        import numpy as np
+
+        # The sorted pending keys are inserted at their positions in a view of the array, a linear
+        # merge that never creates a Python int for a stored key. Keys already stored are dropped
+        keys = np.frombuffer(self._keys, dtype=np.int64) if len(self._keys) else np.empty(0, dtype=np.int64)
+        pending = np.sort(np.fromiter(self._pending, dtype=np.int64, count=len(self._pending)))
+        positions = np.searchsorted(keys, pending)
+        stored = keys[np.minimum(positions, len(keys) - 1)] == pending if len(keys) else np.zeros(len(pending), bool)
+        merged: array = array("q")
+        merged.frombytes(np.insert(keys, positions[~stored], pending[~stored]).tobytes())
+        self._keys = merged
+        self._pending = set()
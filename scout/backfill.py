@@ -0,0 +1,259 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import math
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import Connection, case, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, BackfillPage, Job
+from fetcher import FetchResult, TokenBucket, fetch_all
+from ingest import insert_papers
+from jobs import JobProgress, job_queue, job_response
+from engine import write
+from listing import ListingEntry, extract_listing_entries, extract_listing_total
+from search import store_paper_text
+from settings import REPOSITORY_PATTERN, TARGETS, load_config
+from work_queue import get_shared_rate_limiter
+
+from flask import Blueprint, flash, redirect, render_template, request, url_for, jsonify
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("backfill", __name__)
+
+# Outcome of a page, failed pages are fetched again by the next backfill
+PAGE_DONE: str = "done"
+PAGE_FAILED: str = "failed"
+
+# Entries per page unless set in the backfill section of the config, the most arXiv shows at once
+DEFAULT_PAGE_SIZE: int = 2000
+
+# Month of a listing as yymm, e.g. 2306
+MONTH_PATTERN = re.compile(r"^\d{2}(0[1-9]|1[0-2])$")
+
+
+@bp.route("/backfill", methods=["GET", "POST"])
+def backfill():
+    """
+    Page showing the progress of each month that has been backfilled, a backfill is
+    started by posting a range of months and optionally the repositories to cover
+
+    Example usage
+    curl -X POST -H "Accept: application/json" "backfill?start=2301&end=2306&repositories=cs.LG,cs.AI"
+    """
+    wants_json: bool = request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+
+    if request.method == "POST":
+        start: str = request.values.get("start", "").strip()
+        end: str = request.values.get("end", "").strip() or start
+        repositories: list[str] = [repository for repository in re.split(r"[,\s]+", request.values.get("repositories", ""))
+                                   if repository] or load_config().get("repositories", [])
+
+        try:
+            months: list[str] = month_range(start, end)
+            invalid: list[str] = [repository for repository in repositories if not REPOSITORY_PATTERN.match(repository)]
+            if invalid:
+                raise ValueError(f"Invalid repositories: {', '.join(invalid)}")
+        except ValueError as e:
+            if wants_json:
+                return jsonify({"error": str(e)}), 400
+            flash(f"Failed to start backfill, {e}")
+            return redirect(url_for("backfill"))
+
+        job_id, created = job_queue.submit("backfill", run_backfill, repositories, months)
+        return job_response(job_id, created, "Backfill", endpoint="backfill")
+
+    months: list[dict] = get_backfill_progress()
+    job: Job | None = db.session.execute(select(Job).where(Job.kind == "backfill")
+                                         .order_by(Job.id.desc()).limit(1)).scalar()
+
+    if wants_json:
+        return jsonify({"job": job.to_dict() if job else None, "months": months}), 200
+
+    return render_template("backfill.html",
+                           job=job.to_dict() if job else None,
+                           months=months,
+                           repositories=", ".join(load_config().get("repositories", [])))
+
+
+def run_backfill(progress: JobProgress, repositories: list[str], months: list[str]):
+    """
+    Store every paper listed by the repositories in each month, from /list/<repository>/<yymm>
+
+    Each page is checkpointed once its papers are stored, so an interrupted backfill continues
+    where it stopped and completed pages are never fetched again. The first page of a month
+    shows the number of entries, after which its remaining pages are fetched. Requests are
+    issued concurrently under the rate limit shared with scraping
+
+    :param progress: Reporter for the number of pages and papers processed
+    :param repositories: Repositories to backfill, e.g. cs.LG
+    :param months: Months to backfill, as yymm
+    """
+    config: dict = load_config()
+    arxiv_url: str = config.get("arxiv_url", "https://arxiv.org")
+    page_size: int = max(int(config.get("backfill", {}).get("page_size", DEFAULT_PAGE_SIZE)), 1)
+    rate_limiter: TokenBucket = get_shared_rate_limiter(config)
+
+    checkpoints: dict[tuple[str, str, int], dict] = load_checkpoints(repositories, months)
+    totals: dict[str, int] = {"pages_done": 0, "pages_failed": 0, "pages_skipped": 0,
+                              "papers_found": 0, "papers_added": 0}
+    pages: dict[str, tuple[str, str, int]] = {}
+    start: float = time.monotonic()
+
+    def is_done(page: tuple[str, str, int]) -> bool:
+        # Pages of another size do not line up with the pages requested now
+        checkpoint: dict | None = checkpoints.get(page)
+        return checkpoint is not None and checkpoint["status"] == PAGE_DONE and checkpoint["show"] == page_size
+
+    def handle_result(result: FetchResult):
+        repository, month, skip = pages[result.url]
+
+        if not result.ok:
+            error: str = result.error or f"HTTP {result.status_code}"
+            logger.warning(f"Failed to retrieve {result.url}: {error}")
+            checkpoint: dict = {"status": PAGE_FAILED, "show": page_size, "total": None, "papers_found": 0}
+            write(record_page, repository, month, skip, dict(checkpoint, error=error))
+            totals["pages_failed"] += 1
+        else:
+            entries: list[ListingEntry] = extract_listing_entries(result.content, include=list(TARGETS))
+            total: int | None = extract_listing_total(result.content)
+
+            # Papers are dated by the month they were listed in
+            index_date: datetime = month_date(month)
+            num_added: int = insert_papers(((entry.arxiv_id, index_date) for entry in entries), source="backfill")
+            store_paper_text(entries)
+
+            # Listings short enough to fit on one page may not show a total
+            checkpoint: dict = {"status": PAGE_DONE, "show": page_size,
+                                "total": total if total is not None else skip + len(entries),
+                                "papers_found": len(entries)}
+            write(record_page, repository, month, skip, dict(checkpoint, error=None))
+            totals["pages_done"] += 1
+            totals["papers_found"] += len(entries)
+            totals["papers_added"] += num_added
+
+        checkpoints[repository, month, skip] = checkpoint
+        progress.update(**totals)
+
+    def fetch_pages(requested: list[tuple[str, str, int]]):
+        totals["pages_skipped"] += sum(1 for page in requested if is_done(page))
+        pages.clear()
+        pages.update({page_url(arxiv_url, *page, page_size): page for page in requested if not is_done(page)})
+        progress.update(pages_total=progress.state.get("pages_total", 0) + len(requested), **totals)
+
+        if pages:
+            fetch_all(list(pages), rate_limiter,
+                      max_in_flight=config.get("max_in_flight", 4),
+                      max_retries=config.get("max_retries", 3),
+                      on_result=handle_result)
+
+    # The first page of each month gives the number of entries, and so the pages that follow
+    progress.update(repositories=repositories, months=[months[0], months[-1]])
+    first_pages: list[tuple[str, str, int]] = [(repository, month, 0) for month in months for repository in repositories]
+    fetch_pages(first_pages)
+
+    remaining: list[tuple[str, str, int]] = []
+    for repository, month, _ in first_pages:
+        first: dict | None = checkpoints.get((repository, month, 0))
+        if first is not None and first["status"] == PAGE_DONE and first["total"]:
+            remaining.extend((repository, month, skip) for skip in range(page_size, first["total"], page_size))
+    fetch_pages(remaining)
+
+    elapsed: float = time.monotonic() - start
+    logger.info(f"Backfilled {len(repositories)} repositories over {len(months)} months in {elapsed:.1f}s, "
+                f"fetched {totals['pages_done']:,} pages ({totals['pages_skipped']:,} already done, "
+                f"{totals['pages_failed']:,} failed) and stored {totals['papers_added']:,} of "
+                f"{totals['papers_found']:,} papers found")
+
+
+def page_url(arxiv_url: str, repository: str, month: str, skip: int, show: int) -> str:
+    return f"{arxiv_url}/list/{repository}/{month}?skip={skip}&show={show}"
+
+
+def load_checkpoints(repositories: list[str], months: list[str]) -> dict[tuple[str, str, int], dict]:
+    """
+    :return: Checkpoint of every page of the months that has been fetched before, keyed by repository, month and skip
+    """
+    stmt = (select(BackfillPage.repository, BackfillPage.month, BackfillPage.skip, BackfillPage.status,
+                   BackfillPage.show, BackfillPage.total, BackfillPage.papers_found)
+            .where(BackfillPage.repository.in_(repositories), BackfillPage.month.in_(months)))
+
+    return {(row.repository, row.month, row.skip): {"status": row.status, "show": row.show, "total": row.total,
+                                                    "papers_found": row.papers_found}
+            for row in db.session.execute(stmt)}
+
+
+def record_page(connection: Connection, repository: str, month: str, skip: int, values: dict):
+    """
+    Checkpoint a page, replacing the outcome of any earlier attempt
+
+    :param connection: Connection of the write transaction
+    :param values: Status, show, total, papers_found and error of the page
+    """
+    stmt = sqlite_insert(BackfillPage).values(repository=repository, month=month, skip=skip,
+                                              fetched_at=datetime.now(), **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["repository", "month", "skip"],
+                                      set_={column: stmt.excluded[column] for column in (*values, "fetched_at")})
+    connection.execute(stmt)
+
+
+def get_backfill_progress() -> list[dict]:
+    """
+    :return: Pages fetched and papers found for each repository and month, most recent month first
+    """
+    stmt = (select(BackfillPage.repository,
+                   BackfillPage.month,
+                   func.max(BackfillPage.total).label("total"),
+                   func.max(BackfillPage.show).label("show"),
+                   func.sum(case((BackfillPage.status == PAGE_DONE, 1), else_=0)).label("pages_done"),
+                   func.sum(case((BackfillPage.status == PAGE_FAILED, 1), else_=0)).label("pages_failed"),
+                   func.sum(BackfillPage.papers_found).label("papers_found"))
+            .group_by(BackfillPage.repository, BackfillPage.month)
+            .order_by(BackfillPage.month.desc(), BackfillPage.repository))
+
+    return [{"repository": row.repository,
+             "month": row.month,
+             "total": row.total,
+             "pages": math.ceil(row.total / row.show) if row.total else None,
+             "pages_done": row.pages_done,
+             "pages_failed": row.pages_failed,
+             "papers_found": row.papers_found}
+            for row in db.session.execute(stmt)]
+
+
+def month_range(start: str, end: str) -> list[str]:
+    """
+    :param start: First month as yymm, e.g. 2301
+    :param end: Last month as yymm, inclusive
+    :return: Every month from start to end
+    """
+    for month in (start, end):
+        if not MONTH_PATTERN.match(month):
+            raise ValueError(f"Invalid month {month!r}, expected yymm")
+
+    first: datetime = month_date(start)
+    last: datetime = month_date(end)
+    if first > last:
+        raise ValueError(f"Start month {start} is after end month {end}")
+
+    months: list[str] = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f"{year % 100:02d}{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    return months
+
+
+def month_date(month: str) -> datetime:
+    """
+    :param month: Month as yymm, listings start in 1991
+    :return: First day of the month
+    """
+    year: int = int(month[:2])
+    return datetime(year + (1900 if year >= 91 else 2000), int(month[2:]), 1)
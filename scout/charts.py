@@ -0,0 +1,131 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+from utils.cache import VersionedValue
+from datetime import datetime
+from functools import cache
+from math import pi
+
+from sqlalchemy import func, select
+from db import db, Metric
+from jobs import JobProgress
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+
+# Rendered chart, versioned by the latest metric
+chart_cache: VersionedValue[str] = VersionedValue("")
+
+
+def metrics_version() -> datetime | None:
+    """
+    Date of the latest metric, which changes whenever a scrape adds one
+    """
+    return db.session.execute(select(func.max(Metric.index_date))).scalar()
+
+
+def is_chart_stale() -> bool:
+    """
+    :return: True if metrics have been added since the chart was rendered
+    """
+    version, _ = chart_cache.get()
+    return version != metrics_version()
+
+
+def chart_version() -> datetime | None:
+    """
+    Version of the cached chart, without touching the database
+    """
+    version, _ = chart_cache.get()
+    return version
+
+
+def get_metrics_chart() -> str:
+    """
+    :return: HTML of the cached chart, empty if it has not been rendered
+    """
+    _, html = chart_cache.get()
+    return html
+
+
+@cache
+def chart_resources() -> tuple[str, str]:
+    """
+    :return: URLs of the JavaScript and CSS required by the chart, fixed for a given version of Bokeh
+    """
+    from bokeh.resources import CDN
+
+    return CDN.js_files[0] if CDN.js_files else "", CDN.css_files[0] if CDN.css_files else ""
+
+
+def render_metrics_to_bokeh(force: bool = False) -> bool:
+    """
+    Read the metrics table and render as a bar chart held in the chart cache
+
+    :param force: Render even if no metrics have been added since the last render
+    :return: True if a chart is available
+    """
+    version: datetime | None = metrics_version()
+    cached_version, html = chart_cache.get()
+    if not force and html and version == cached_version:
+        return True
+
+    # Sort by index date and return the entire table
+    metrics: list[Metric] = list(db.session.execute(select(Metric).order_by(Metric.index_date.asc())).scalars())
+
+    if not metrics:
+        chart_cache.set(version, "")
+        return False
+
+    # Bokeh is slow to import, so it is only loaded once there is something to render
+    from bokeh.embed import components
+    from bokeh.plotting import figure
+
+    dates: list[str] = [metric.index_date.strftime("%d/%m/%y %H:%M:%S") for metric in metrics]
+    papers_found: list[int] = [metric.papers_found for metric in metrics]
+    papers_added: list[int] = [metric.papers_added for metric in metrics]
+
+    data: dict = {"dates": dates,
+                  "Found": papers_found,
+                  "Added": papers_added}
+
+    p = figure(x_range=dates,
+               height=512,
+               max_width=int(512 * 1.4),
+               sizing_mode="scale_width",
+               title="Scraping metrics",
+               toolbar_location=None)
+
+    p.vbar(x="dates", top="Found", width=0.9, line_width=0, source=data, legend_label="Found", color="#718dbf")
+    p.vbar(x="dates", top="Added", width=0.9, line_width=0, source=data, legend_label="Added", color="#FFB4B4")
+
+    p.xaxis.major_label_orientation = pi/3
+    p.y_range.start = 0
+    p.x_range.range_padding = 0.1
+    p.xgrid.grid_line_color = None
+    p.axis.minor_tick_line_color = None
+    p.outline_line_color = None
+    p.legend.location = "top_left"
+    p.legend.orientation = "horizontal"
+    p.legend.click_policy = "hide"
+
+    # Embed the plot in a container, the script populates the div once loaded
+    script, div = components(p)
+    chart_cache.set(version, f'<div class="container" style="display: flex; justify-content: center;">'
+                             f'{div}{script}</div>')
+    logger.info(f"Rendered metrics chart of {len(metrics)} scrapes")
+
+    return True
+
+
+def run_refresh(progress: JobProgress):
+    """
+    Refresh / regenerate any visualisations
+
+    :param progress: Reporter for the job, unused beyond the job status
+    """
+    res: bool = render_metrics_to_bokeh(force=True)
+    logger.info(f"Regenerating metrics visualisation")
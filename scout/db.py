@@ -1,18 +1,365 @@
 from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import hashlib
+import sqlalchemy as sa
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.schema import CreateColumn
+from arxiv_ids import encode_arxiv_id
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
 
 # Database object is defined as a global variable
 db = SQLAlchemy()
 
+# Statements that populate a column of existing rows when the column is added, keyed by table and column
+BACKFILLS: dict[tuple[str, str], str] = {
+    ("paper", "arxiv_key"): "UPDATE paper SET arxiv_key = encode_arxiv_id(arxiv_id)",
+    ("paper", "ingest_seq"): "UPDATE paper SET ingest_seq = rowid",  # The order existing papers were stored in
+}
+
+# Statements run on every migration that correct rows written by earlier versions, each must be idempotent.
+# Versioned IDs were once given the key of their unversioned form, which made them look stored already
+REPAIRS: tuple[str, ...] = (
+    "UPDATE paper SET arxiv_key = NULL WHERE arxiv_key IS NOT NULL AND arxiv_id GLOB '*v[0-9]*'",
+)
+
+# Full-text index of paper_text, kept in step with it by triggers. It is an external content
+# table, so the text is stored once and the index only holds the tokens
+FTS_TABLE: str = "paper_fts"
+FTS_STATEMENTS: tuple[str, ...] = (
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, authors, subjects, content='paper_text',
+        content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS paper_text_ai AFTER INSERT ON paper_text BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, subjects) VALUES (new.id, new.title, new.authors, new.subjects);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS paper_text_ad AFTER DELETE ON paper_text BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, subjects)
+        VALUES ('delete', old.id, old.title, old.authors, old.subjects);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS paper_text_au AFTER UPDATE ON paper_text BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, subjects)
+        VALUES ('delete', old.id, old.title, old.authors, old.subjects);
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, subjects) VALUES (new.id, new.title, new.authors, new.subjects);
+        END""",
+)
+
+# Papers listed by each category per day and per week (starting on Monday), kept in step with
+# paper_category by triggers so that time series are read without scanning the memberships
+ROLLUP_STATEMENTS: tuple[str, ...] = (
+    """CREATE TRIGGER IF NOT EXISTS paper_category_ai AFTER INSERT ON paper_category BEGIN
+        INSERT INTO category_daily (category, day, listing_type, papers)
+        VALUES (new.category, new.listed_on, new.listing_type, 1)
+        ON CONFLICT (category, day, listing_type) DO UPDATE SET papers = papers + 1;
+        INSERT INTO category_weekly (category, week, listing_type, papers)
+        VALUES (new.category, date(new.listed_on, '-6 days', 'weekday 1'), new.listing_type, 1)
+        ON CONFLICT (category, week, listing_type) DO UPDATE SET papers = papers + 1;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS paper_category_ad AFTER DELETE ON paper_category BEGIN
+        UPDATE category_daily SET papers = papers - 1
+        WHERE category = old.category AND day = old.listed_on AND listing_type = old.listing_type;
+        UPDATE category_weekly SET papers = papers - 1
+        WHERE category = old.category AND week = date(old.listed_on, '-6 days', 'weekday 1')
+        AND listing_type = old.listing_type;
+        END""",
+)
+ROLLUP_TRIGGERS: tuple[str, ...] = ("paper_category_ai", "paper_category_ad")
+
+
+def migrate():
+    """
+    Create any missing tables and indexes, must be called within an application context
+
+    create_all only creates new tables, so columns and indexes added to
+    existing tables are created separately. New columns must be nullable or
+    have a server default. Rows written by earlier versions are then repaired, see REPAIRS
+    """
+    db.create_all()
+
+    inspector = sa.inspect(db.engine)
+    with db.engine.begin() as connection:
+        # Backfills may encode values with the same functions used on insert
+        connection.connection.driver_connection.create_function("encode_arxiv_id", 1, encode_arxiv_id,
+                                                                deterministic=True)
+
+        for table in db.metadata.sorted_tables:
+            existing: set[str] = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+
+                    if (table.name, column.name) in BACKFILLS:
+                        result = connection.execute(sa.text(BACKFILLS[table.name, column.name]))
+                        logger.info(f"Populated {table.name}.{column.name} of {result.rowcount:,} rows")
+
+        for statement in REPAIRS:
+            result = connection.execute(sa.text(statement))
+            if result.rowcount:
+                logger.info(f"Repaired {result.rowcount:,} rows: {statement}")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    create_fts_index()
+    create_rollups()
+
+    # Counters are seeded from the tables they summarise, after which ingestion maintains them
+    with db.engine.begin() as connection:
+        connection.execute(sa.text("INSERT OR IGNORE INTO stat (key, value) SELECT 'paper_count', COUNT(*) FROM paper"))
+        connection.execute(sa.text("INSERT OR IGNORE INTO stat (key, value) VALUES ('data_version', 0)"))
+        connection.execute(sa.text("INSERT OR IGNORE INTO stat (key, value) "
+                                   "SELECT 'ingest_seq', COALESCE(MAX(ingest_seq), 0) FROM paper"))
+
+        # Recorded last, so an interrupted migration is run again on the next start
+        connection.execute(sa.text(f"PRAGMA user_version = {schema_fingerprint()}"))
+
+
+def schema_fingerprint() -> int:
+    """
+    :return: Hash of the tables, columns, indexes and FTS statements of the models, stored as the
+             user_version of a migrated database. It fits in the signed 32 bits of user_version
+    """
+    parts: list[str] = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name} {column.type}" for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    parts.extend(FTS_STATEMENTS)
+    parts.extend(ROLLUP_STATEMENTS)
+    parts.extend(BACKFILLS.values())
+    parts.extend(REPAIRS)
+
+    return int(hashlib.sha1("\n".join(parts).encode()).hexdigest()[:7], 16)
+
+
+def is_migrated() -> bool:
+    """
+    :return: Whether the database was migrated to the current models, must be called within an application context
+    """
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar() == schema_fingerprint()
+
+
+def create_fts_index():
+    """
+    Create the full-text index of paper_text if it does not exist, indexing any rows it already holds
+
+    Search is unavailable when SQLite is built without FTS5, everything else works as before
+    """
+    inspector = sa.inspect(db.engine)
+    if inspector.has_table(FTS_TABLE):
+        return
+
+    try:
+        with db.engine.begin() as connection:
+            for statement in FTS_STATEMENTS:
+                connection.execute(sa.text(statement))
+            connection.execute(sa.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except sa.exc.OperationalError as e:
+        logger.warning(f"Full-text search is unavailable, SQLite does not support FTS5: {e}")
+        return
+
+    logger.info(f"Created full-text index {FTS_TABLE}")
+
+
+def create_rollups():
+    """
+    Create the triggers that maintain the category rollups if they do not exist, rebuilding
+    the rollups from the memberships recorded without them
+    """
+    with db.engine.begin() as connection:
+        existing: set[str] = set(connection.execute(sa.text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+                                 .scalars())
+        if existing.issuperset(ROLLUP_TRIGGERS):
+            return
+
+        for statement in ROLLUP_STATEMENTS:
+            connection.execute(sa.text(statement))
+
+        connection.execute(sa.text("DELETE FROM category_daily"))
+        connection.execute(sa.text("DELETE FROM category_weekly"))
+        connection.execute(sa.text("""INSERT INTO category_daily (category, day, listing_type, papers)
+                                      SELECT category, listed_on, listing_type, COUNT(*) FROM paper_category
+                                      GROUP BY category, listed_on, listing_type"""))
+        connection.execute(sa.text("""INSERT INTO category_weekly (category, week, listing_type, papers)
+                                      SELECT category, date(listed_on, '-6 days', 'weekday 1'), listing_type, COUNT(*)
+                                      FROM paper_category GROUP BY 1, 2, 3"""))
+
+    logger.info("Created the triggers of the category rollups")
+
 
 # Used to create / access a table called paper
 class Paper(db.Model):
     arxiv_id = db.Column(db.String, primary_key=True)
     index_date = db.Column(db.TIMESTAMP, nullable=False)
 
+    # Integer form of unversioned new-style IDs (see arxiv_ids.encode_arxiv_id), NULL for others
+    arxiv_key = db.Column(db.BigInteger, nullable=True)
+
+    # Position in the order papers were stored, increasing across every process (see stats.reserve_ingest_seq)
+    ingest_seq = db.Column(db.BigInteger, nullable=True)
+
+    # Covers range queries on the date, returning IDs in date order without touching the table
+    __table_args__ = (db.Index("ix_paper_index_date_arxiv_id", "index_date", "arxiv_id"),
+                      db.Index("ix_paper_arxiv_key", "arxiv_key"),
+                      db.Index("ix_paper_ingest_seq", "ingest_seq", unique=True))
+
+
+# Used to create / access a table called paper_metadata, filled in by the enrichment job
+class PaperMetadata(db.Model):
+    arxiv_id = db.Column(db.String, db.ForeignKey("paper.arxiv_id"), primary_key=True)
+    status = db.Column(db.String, nullable=False)  # ok, or missing if the API did not return the paper
+    title = db.Column(db.String, nullable=True)
+    authors = db.Column(db.JSON, nullable=True)
+    abstract = db.Column(db.String, nullable=True)
+    primary_category = db.Column(db.String, nullable=True)
+    categories = db.Column(db.JSON, nullable=True)
+    version = db.Column(db.INTEGER, nullable=True)
+    published = db.Column(db.TIMESTAMP, nullable=True)
+    updated = db.Column(db.TIMESTAMP, nullable=True)
+    fetched_at = db.Column(db.TIMESTAMP, nullable=False)
+
+
+# Used to create / access a table called paper_text, the fields shown on listing pages, indexed by paper_fts.
+# The integer key is the rowid of the index, declared so that it is kept by VACUUM
+class PaperText(db.Model):
+    id = db.Column(db.INTEGER, primary_key=True, autoincrement=True)
+    arxiv_id = db.Column(db.String, db.ForeignKey("paper.arxiv_id"), nullable=False, unique=True)
+    title = db.Column(db.String, nullable=False, default="")
+    authors = db.Column(db.String, nullable=False, default="")  # Separated by ", "
+    subjects = db.Column(db.String, nullable=False, default="")  # Separated by "; ", e.g. Machine Learning (cs.LG)
+
+
+# Used to create / access a table called paper_category, the categories whose listings showed each paper.
+# A paper is recorded once per category and listing type, on the day it was first seen there
+class PaperCategory(db.Model):
+    arxiv_id = db.Column(db.String, db.ForeignKey("paper.arxiv_id"), primary_key=True)
+    category = db.Column(db.String, primary_key=True)  # Repository of the listing, e.g. cs.LG
+    listing_type = db.Column(db.String, primary_key=True)  # new, cross-list or replaced
+    listed_on = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (db.Index("ix_paper_category_category_listed_on", "category", "listed_on"),)
+
+
+# Used to create / access the tables called category_daily and category_weekly, maintained from paper_category
+class CategoryDaily(db.Model):
+    category = db.Column(db.String, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    listing_type = db.Column(db.String, primary_key=True)
+    papers = db.Column(db.INTEGER, nullable=False, default=0)
+
+
+class CategoryWeekly(db.Model):
+    category = db.Column(db.String, primary_key=True)
+    week = db.Column(db.Date, primary_key=True)  # Monday the week starts on
+    listing_type = db.Column(db.String, primary_key=True)
+    papers = db.Column(db.INTEGER, nullable=False, default=0)
+
 
 # Used to create / access a table called metric
 class Metric(db.Model):
     index_date = db.Column(db.TIMESTAMP, primary_key=True, nullable=False)
     papers_found = db.Column(db.INTEGER, nullable=False)
     papers_added = db.Column(db.INTEGER, nullable=False)
+    cache_hits = db.Column(db.INTEGER, nullable=False, default=0, server_default="0")
+
+
+# Used to create / access a table called repository_metric, the timing of each repository within a scrape
+class RepositoryMetric(db.Model):
+    index_date = db.Column(db.TIMESTAMP, db.ForeignKey("metric.index_date"), primary_key=True)
+    repository = db.Column(db.String, primary_key=True)
+    status = db.Column(db.String, nullable=False)
+    status_code = db.Column(db.INTEGER, nullable=True)
+    attempts = db.Column(db.INTEGER, nullable=False)
+    fetch_seconds = db.Column(db.Float, nullable=False)
+    wait_seconds = db.Column(db.Float, nullable=False)
+    extract_seconds = db.Column(db.Float, nullable=False)
+    papers_found = db.Column(db.INTEGER, nullable=False)
+
+
+# Used to create / access a table called backfill_page, the checkpoint of each page of a monthly listing
+class BackfillPage(db.Model):
+    repository = db.Column(db.String, primary_key=True)
+    month = db.Column(db.String, primary_key=True)  # yymm, e.g. 2306
+    skip = db.Column(db.INTEGER, primary_key=True)
+    show = db.Column(db.INTEGER, nullable=False)
+    status = db.Column(db.String, nullable=False)  # done, or failed to be retried by the next backfill
+    total = db.Column(db.INTEGER, nullable=True)  # Entries in the month, as shown on the page
+    papers_found = db.Column(db.INTEGER, nullable=False, default=0)
+    error = db.Column(db.String, nullable=True)
+    fetched_at = db.Column(db.TIMESTAMP, nullable=False)
+
+
+# Used to create / access a table called job, which tracks background work
+class Job(db.Model):
+    id = db.Column(db.INTEGER, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String, nullable=False)
+    status = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.TIMESTAMP, nullable=False)
+    started_at = db.Column(db.TIMESTAMP, nullable=True)
+    finished_at = db.Column(db.TIMESTAMP, nullable=True)
+    progress = db.Column(db.JSON, nullable=False, default=dict)
+    error = db.Column(db.String, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at.isoformat() if self.created_at else None,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "progress": self.progress,
+                "error": self.error}
+
+
+# Used to create / access a table called work_item, units of work shared by the workers of every process
+class WorkItem(db.Model):
+    id = db.Column(db.INTEGER, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String, nullable=False)  # e.g. scrape
+    batch = db.Column(db.String, nullable=False)  # Items submitted together, e.g. the repositories of one scrape
+    key = db.Column(db.String, nullable=False)  # Item within the batch, e.g. cs.LG
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String, nullable=False)  # queued, leased, done or failed
+    attempts = db.Column(db.INTEGER, nullable=False, default=0)
+    lease_owner = db.Column(db.String, nullable=True)
+    lease_expires_at = db.Column(db.Float, nullable=True)  # Seconds since the epoch, compared across hosts
+    heartbeat_at = db.Column(db.TIMESTAMP, nullable=True)
+    created_at = db.Column(db.TIMESTAMP, nullable=False)
+    finished_at = db.Column(db.TIMESTAMP, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.String, nullable=True)
+
+    # Claims look for the oldest available item of a kind, batches are followed until they finish
+    __table_args__ = (db.Index("ix_work_item_kind_status", "kind", "status", "id"),
+                      db.Index("ix_work_item_batch", "batch"))
+
+    def to_dict(self) -> dict:
+        return {"id": self.id,
+                "kind": self.kind,
+                "batch": self.batch,
+                "key": self.key,
+                "status": self.status,
+                "attempts": self.attempts,
+                "lease_owner": self.lease_owner,
+                "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+                "created_at": self.created_at.isoformat() if self.created_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "result": self.result,
+                "error": self.error}
+
+
+# Used to create / access a table called rate_limit, the next free request slot of each limit shared between processes
+class RateLimit(db.Model):
+    name = db.Column(db.String, primary_key=True)
+    next_at = db.Column(db.Float, nullable=False)  # Seconds since the epoch
+
+
+# Used to create / access a table called stat, which holds counters maintained on ingest
+class Stat(db.Model):
+    key = db.Column(db.String, primary_key=True)
+    value = db.Column(db.INTEGER, nullable=False, default=0)
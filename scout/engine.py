@@ -0,0 +1,179 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from sqlalchemy import Connection, Engine, event
+from db import db
+
+from flask import Flask, current_app
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Milliseconds a connection waits for a lock before failing with "database is locked"
+BUSY_TIMEOUT_MS: int = 30_000
+
+# Applied to every new connection. WAL lets readers continue while a write is in progress,
+# and NORMAL synchronisation is durable in WAL mode except against power loss
+PRAGMAS: dict[str, str | int] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # Negative values are in KiB
+    "temp_store": "MEMORY",
+}
+
+# Largest number of queued writes committed in one transaction
+MAX_BATCH: int = 64
+
+# Key of the writer of each application in app.extensions
+WRITER_EXTENSION: str = "scout_db_writer"
+
+
+def engine_options(uri: str, pool_size: int = 8) -> dict:
+    """
+    Options of the SQLite engine, see SQLALCHEMY_ENGINE_OPTIONS
+
+    :param uri: Database URI, in-memory databases keep their single connection
+    :param pool_size: Connections kept open for reuse by requests and jobs
+    """
+    if uri in ("sqlite://", "sqlite:///:memory:"):
+        return {}
+
+    return {"pool_size": pool_size,
+            "max_overflow": pool_size,
+            "connect_args": {"timeout": BUSY_TIMEOUT_MS / 1000, "check_same_thread": False}}
+
+
+def configure_engine(engine: Engine):
+    """
+    Apply the pragmas to each connection opened by the engine, must be called before it connects
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class DatabaseWriter:
+    """
+    Runs every write on a single thread, so that writers queue in-process rather than contend for the SQLite lock
+
+    Writes that are queued together are committed in one transaction. If that
+    transaction fails, each write is retried in a transaction of its own so
+    that one failing write does not affect the others
+
+    Transactions take the write lock when they begin, so that writers in other
+    processes sharing the database wait on busy_timeout rather than failing when
+    a read lock cannot be upgraded
+    """
+
+    def __init__(self, engine: Engine):
+        """
+        :param engine: Engine of the database that is written to
+        """
+        self._engine: Engine = engine
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="scout-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Queue a write without waiting for it
+
+        :param func: Callable invoked as func(connection, *args, **kwargs) within a transaction
+        :return: Future of the value returned by func
+        """
+        future: Future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def write(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Queue a write and wait for it to be committed, see submit
+
+        :return: Value returned by func
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Writes cannot be queued from within a write")
+
+        return self.submit(func, *args, **kwargs).result()
+
+    def _loop(self):
+        while True:
+            batch: list[tuple[Future, Callable, tuple, dict]] = [self._queue.get()]
+
+            # Group the writes that queued up while the previous batch was committed
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                with self._transaction() as connection:
+                    results: list = [func(connection, *args, **kwargs) for _, func, args, kwargs in batch]
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][0].set_exception(e)
+                    continue
+
+                logger.warning(f"Batch of {len(batch)} writes failed, retrying individually: {e}")
+                for item in batch:
+                    self._write_one(*item)
+                continue
+
+            for (future, _, _, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _write_one(self, future: Future, func: Callable, args: tuple, kwargs: dict):
+        try:
+            with self._transaction() as connection:
+                result = func(connection, *args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Connection]:
+        with self._engine.begin() as connection:
+            if self._engine.dialect.name == "sqlite":
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            yield connection
+
+
+def init_writer(app: Flask):
+    """
+    Start the writer of an application, each application writes to its own database
+
+    :param app: Application whose database is written to
+    """
+    with app.app_context():
+        app.extensions[WRITER_EXTENSION] = DatabaseWriter(db.engine)
+
+
+def write(func: Callable[[Connection], Any], *args, **kwargs) -> Any:
+    """
+    Commit a write through the writer of the current application, see DatabaseWriter.write
+    """
+    writer: DatabaseWriter | None = current_app.extensions.get(WRITER_EXTENSION)
+    if writer is None:
+        raise RuntimeError("Database writer has not been initialised")
+    return writer.write(func, *args, **kwargs)
@@ -0,0 +1,229 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import io
+import time
+from datetime import datetime
+from typing import Iterator
+from urllib.parse import urlencode
+from xml.etree.ElementTree import Element, ParseError, iterparse
+
+from sqlalchemy import Connection, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, Paper, PaperMetadata
+from arxiv_ids import split_version
+from engine import write
+from fetcher import FetchResult, fetch_all
+from jobs import JobProgress, job_queue, job_response
+from settings import load_config
+from work_queue import get_shared_rate_limiter
+from stats import get_paper_count
+
+from flask import Blueprint
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("enrich", __name__)
+
+# Namespaces of the Atom feed returned by the export API
+ATOM: str = "{http://www.w3.org/2005/Atom}"
+ARXIV: str = "{http://arxiv.org/schemas/atom}"
+
+# Outcome of a paper, missing if the API did not return it
+METADATA_OK: str = "ok"
+METADATA_MISSING: str = "missing"
+
+# Defaults of the enrich section of the config
+DEFAULT_API_URL: str = "https://export.arxiv.org/api/query"
+DEFAULT_BATCH_SIZE: int = 400
+DEFAULT_MAX_IN_FLIGHT: int = 2
+
+
+class ExportApiError(Exception):
+    """
+    Raised when the export API responds with an error instead of the requested papers
+    """
+
+
+@bp.route("/enrich")
+def enrich():
+    """
+    Queue the enrichment of every paper without metadata, see run_enrich
+    """
+    job_id, created = job_queue.submit("enrich", run_enrich)
+    return job_response(job_id, created, "Enrichment")
+
+
+def run_enrich(progress: JobProgress):
+    """
+    Fetch the metadata of papers that do not have any, many IDs per request to the export API
+
+    Papers are processed in ID order and every response is stored as it arrives, so an
+    interrupted run continues where it stopped. Papers in failed requests are left
+    without metadata, to be retried by the next run
+
+    :param progress: Reporter for the number of papers processed
+    """
+    config: dict = load_config()
+    enrich_config: dict = config.get("enrich", {})
+    api_url: str = enrich_config.get("api_url", DEFAULT_API_URL)
+    batch_size: int = max(int(enrich_config.get("batch_size", DEFAULT_BATCH_SIZE)), 1)
+    max_in_flight: int = max(int(enrich_config.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT)), 1)
+    max_batches: int = int(enrich_config.get("max_batches", 0))
+
+    # Shares the rate limit with scraping, as both go to arXiv
+    rate_limiter = get_shared_rate_limiter(config)
+
+    remaining: int = get_paper_count() - db.session.execute(select(func.count()).select_from(PaperMetadata)).scalar()
+    totals: dict[str, int] = {"enriched": 0, "missing": 0, "failed": 0, "batches": 0}
+    progress.update(remaining=remaining, **totals)
+    logger.info(f"Enriching up to {remaining:,} papers in batches of {batch_size}")
+
+    after: str = ""
+    start: float = time.monotonic()
+
+    # Each round keeps a few batches in flight, only the responses of the current round are held in memory
+    while not max_batches or totals["batches"] < max_batches:
+        round_size: int = batch_size * max_in_flight * 2
+        if max_batches:
+            round_size = min(round_size, batch_size * (max_batches - totals["batches"]))
+
+        ids: list[str] = find_unenriched(after, round_size)
+        if not ids:
+            break
+        after = ids[-1]
+
+        batches: dict[str, list[str]] = {}
+        for offset in range(0, len(ids), batch_size):
+            batch: list[str] = ids[offset:offset + batch_size]
+            batches[f"{api_url}?{urlencode({'id_list': ','.join(batch), 'max_results': len(batch)})}"] = batch
+
+        def handle_result(result: FetchResult):
+            requested: list[str] = batches[result.url]
+            if not result.ok:
+                logger.warning(f"Failed to fetch metadata of {len(requested)} papers: "
+                               f"{result.error or result.status_code}")
+                totals["failed"] += len(requested)
+                return
+
+            try:
+                entries: list[dict] = list(parse_feed(result.content))
+            except (ExportApiError, ParseError) as e:
+                # Not marked as missing, as the papers may exist
+                logger.warning(f"Failed to parse metadata of {len(requested)} papers: {e}")
+                totals["failed"] += len(requested)
+                return
+
+            stored, missing = write(store_metadata, requested, entries)
+            totals["enriched"] += stored
+            totals["missing"] += missing
+
+        fetch_all(list(batches), rate_limiter, max_in_flight=max_in_flight,
+                  max_retries=config.get("max_retries", 3), on_result=handle_result)
+
+        totals["batches"] += len(batches)
+        progress.update(remaining=remaining, **totals)
+
+    elapsed: float = time.monotonic() - start
+    logger.info(f"Enriched {totals['enriched']:,} papers in {totals['batches']} requests over {elapsed:.1f}s, "
+                f"{totals['missing']:,} were not returned and {totals['failed']:,} failed")
+
+
+def find_unenriched(after: str, limit: int) -> list[str]:
+    """
+    :param after: ID to continue after, in ID order
+    :param limit: Maximum number of IDs to return
+    :return: IDs of papers without metadata
+    """
+    stmt = (select(Paper.arxiv_id)
+            .outerjoin(PaperMetadata, PaperMetadata.arxiv_id == Paper.arxiv_id)
+            .where(PaperMetadata.arxiv_id.is_(None), Paper.arxiv_id > after)
+            .order_by(Paper.arxiv_id)
+            .limit(limit))
+    return list(db.session.execute(stmt).scalars())
+
+
+def parse_feed(content: bytes) -> Iterator[dict]:
+    """
+    Parse the entries of an Atom feed from the export API one at a time, discarding each once read
+
+    :param content: Body of the response
+    :return: Iterator of the metadata of each paper, keyed by PaperMetadata column
+    """
+    for _, element in iterparse(io.BytesIO(content), events=("end",)):
+        if element.tag != f"{ATOM}entry":
+            continue
+
+        entry: dict = _parse_entry(element)
+        element.clear()
+        yield entry
+
+
+def store_metadata(connection: Connection, requested: list[str], entries: list[dict]) -> tuple[int, int]:
+    """
+    Upsert the metadata of a batch, marking requested papers that were not returned as missing
+
+    :param connection: Connection of the write transaction
+    :param requested: IDs as stored in the paper table
+    :param entries: Parsed entries of the response
+    :return: Number of papers stored and missing
+    """
+    fetched_at: datetime = datetime.now()
+
+    # The API returns IDs with their latest version, which are matched to the requested IDs without one
+    by_base: dict[str, str] = {split_version(arxiv_id)[0]: arxiv_id for arxiv_id in requested}
+    rows: dict[str, dict] = {}
+    for entry in entries:
+        arxiv_id: str | None = by_base.get(entry["arxiv_id"])
+        if arxiv_id is not None:
+            rows[arxiv_id] = dict(entry, arxiv_id=arxiv_id, status=METADATA_OK, fetched_at=fetched_at)
+
+    missing: list[str] = [arxiv_id for arxiv_id in requested if arxiv_id not in rows]
+    for arxiv_id in missing:
+        rows[arxiv_id] = {"arxiv_id": arxiv_id, "status": METADATA_MISSING, "title": None, "authors": None,
+                          "abstract": None, "primary_category": None, "categories": None, "version": None,
+                          "published": None, "updated": None, "fetched_at": fetched_at}
+
+    if rows:
+        stmt = sqlite_insert(PaperMetadata)
+        columns: list[str] = [column.name for column in PaperMetadata.__table__.columns if column.name != "arxiv_id"]
+        stmt = stmt.on_conflict_do_update(index_elements=["arxiv_id"],
+                                          set_={column: stmt.excluded[column] for column in columns})
+        connection.execute(stmt, list(rows.values()))
+
+    return len(rows) - len(missing), len(missing)
+
+
+def _parse_entry(element: Element) -> dict:
+    # Errors are reported as an entry whose ID is not that of a paper
+    identifier: str = _text(element, f"{ATOM}id")
+    if "/abs/" not in identifier:
+        raise ExportApiError(_text(element, f"{ATOM}summary") or identifier)
+
+    arxiv_id, version = split_version(identifier.split("/abs/", 1)[1])
+    primary: Element | None = element.find(f"{ARXIV}primary_category")
+
+    return {"arxiv_id": arxiv_id,
+            "version": version,
+            "title": _text(element, f"{ATOM}title"),
+            "abstract": _text(element, f"{ATOM}summary"),
+            "authors": [_text(author, f"{ATOM}name") for author in element.findall(f"{ATOM}author")],
+            "primary_category": primary.get("term") if primary is not None else None,
+            "categories": [category.get("term") for category in element.findall(f"{ATOM}category")],
+            "published": _parse_timestamp(_text(element, f"{ATOM}published")),
+            "updated": _parse_timestamp(_text(element, f"{ATOM}updated"))}
+
+
+def _text(element: Element, tag: str) -> str:
+    # Titles and abstracts are wrapped over several lines
+    child: Element | None = element.find(tag)
+    return " ".join(child.text.split()) if child is not None and child.text else ""
+
+
+def _parse_timestamp(value: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
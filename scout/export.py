@@ -0,0 +1,169 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Callable, Iterator, Sequence
+
+from sqlalchemy import Row, select
+from db import db, Paper
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Rows fetched from the database and serialised at a time
+EXPORT_BATCH_ROWS: int = 10_000
+
+
+def iter_paper_batches(start_date: datetime | None = None,
+                       end_date: datetime | None = None,
+                       batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[Sequence[Row]]:
+    """
+    Read papers from the database in batches, without loading the whole table
+
+    Rows are ordered by date and then ID, which follows the paper date index
+
+    :param start_date: Optional inclusive lower bound on the index date
+    :param end_date: Optional inclusive upper bound on the index date
+    :param batch_rows: Number of rows per batch
+    :return: Iterator of batches of (arxiv_id, index_date) rows
+    """
+    stmt = select(Paper.arxiv_id, Paper.index_date).order_by(Paper.index_date, Paper.arxiv_id)
+    if start_date is not None:
+        stmt = stmt.where(Paper.index_date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(Paper.index_date <= end_date)
+
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=batch_rows).execute(stmt)
+        yield from result.partitions()
+
+
+def _csv_chunks(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["Id", "Date"])
+
+    for batch in batches:
+        writer.writerows((arxiv_id, index_date.isoformat(sep=" ")) for arxiv_id, index_date in batch)
+        yield buffer.getvalue().encode("utf8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only, when there are no papers
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf8")
+
+
+def _csv_gz_chunks(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    # A window of 16 + 15 bits produces a gzip container
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in _csv_chunks(batches):
+        compressed: bytes = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _jsonl_chunks(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    for batch in batches:
+        lines: list[str] = [json.dumps({"Id": arxiv_id, "Date": index_date.isoformat()}) + "\n"
+                            for arxiv_id, index_date in batch]
+        yield "".join(lines).encode("utf8")
+
+
+class _DrainableSink:
+    """
+    Write-only file object whose contents are handed out as they are written
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position: int = 0
+        self.closed: bool = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data: bytes = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_chunks(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("Id", pa.string()), ("Date", pa.timestamp("us"))])
+    sink = _DrainableSink()
+
+    # Each batch becomes a row group, which is sent as soon as it is written
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for batch in batches:
+            ids, dates = zip(*batch)
+            writer.write_table(pa.table({"Id": list(ids), "Date": list(dates)}, schema=schema))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+# Supported formats: serialiser, mimetype, file extension and an availability check
+EXPORT_FORMATS: dict[str, tuple[Callable[[Iterator[Sequence[Row]]], Iterator[bytes]], str, str, Callable[[], bool]]] = {
+    "csv": (_csv_chunks, "text/csv", "csv", lambda: True),
+    "csv.gz": (_csv_gz_chunks, "application/gzip", "csv.gz", lambda: True),
+    "jsonl": (_jsonl_chunks, "application/x-ndjson", "jsonl", lambda: True),
+    "parquet": (_parquet_chunks, "application/vnd.apache.parquet", "parquet", _parquet_available),
+}
+
+
+def stream_papers(export_format: str,
+                  start_date: datetime | None = None,
+                  end_date: datetime | None = None) -> Iterator[bytes]:
+    """
+    Serialise papers in the requested format, one batch at a time
+
+    :param export_format: One of EXPORT_FORMATS
+    :param start_date: Optional inclusive lower bound on the index date
+    :param end_date: Optional inclusive upper bound on the index date
+    :return: Iterator of encoded chunks of the file
+    """
+    num_rows: int = 0
+
+    def count(batches: Iterator[Sequence[Row]]) -> Iterator[Sequence[Row]]:
+        nonlocal num_rows
+        for batch in batches:
+            num_rows += len(batch)
+            yield batch
+
+    serialiser = EXPORT_FORMATS[export_format][0]
+    for chunk in serialiser(count(iter_paper_batches(start_date, end_date))):
+        if chunk:
+            yield chunk
+
+    logger.info(f"Exported {num_rows} papers")
@@ -0,0 +1,321 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+from http_cache import CacheEntry, HttpCache, content_hash
+
+if TYPE_CHECKING:
+    import requests
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Responses that are worth retrying, anything else is returned to the caller as-is
+RETRY_STATUS_CODES: tuple[int, ...] = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to enforce a global request rate
+
+    Tokens are reserved ahead of time, so concurrent callers queue up behind each
+    other and are released one interval apart regardless of how long each request takes
+    """
+
+    def __init__(self, seconds_per_request: float, capacity: int = 1):
+        """
+        :param seconds_per_request: Minimum interval between two requests
+        :param capacity: Number of requests that may be issued back-to-back
+        """
+        self._lock = threading.Lock()
+        self.seconds_per_request: float = max(float(seconds_per_request), 0.0)
+        self.capacity: int = max(int(capacity), 1)
+        self._tokens: float = float(self.capacity)
+        self._last: float = time.monotonic()
+
+    def set_rate(self, seconds_per_request: float):
+        """
+        Update the interval without losing reservations already handed out
+
+        :param seconds_per_request: Minimum interval between two requests
+        """
+        with self._lock:
+            self.seconds_per_request = max(float(seconds_per_request), 0.0)
+
+    def reserve(self) -> float:
+        """
+        Take a token, going into debt if none are available
+
+        :return: Number of seconds the caller must wait before using the token
+        """
+        with self._lock:
+            now: float = time.monotonic()
+
+            if self.seconds_per_request <= 0:
+                return 0.0
+
+            # Refill based on the time elapsed since the previous reservation
+            refill: float = (now - self._last) / self.seconds_per_request
+            self._tokens = min(float(self.capacity), self._tokens + refill)
+            self._last = now
+
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens * self.seconds_per_request
+
+    def acquire(self):
+        """
+        Block the current thread until a token is available
+        """
+        delay: float = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """
+        Suspend the current task until a token is available
+        """
+        delay: float = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Rate limiter shared by every fetch made by this process
+_rate_limiter: TokenBucket | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(seconds_per_request: float) -> TokenBucket:
+    """
+    Return the process-wide rate limiter, updating its interval if required
+
+    :param seconds_per_request: Minimum interval between two requests
+    :return: Shared token bucket
+    """
+    global _rate_limiter
+
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(seconds_per_request)
+        elif _rate_limiter.seconds_per_request != seconds_per_request:
+            _rate_limiter.set_rate(seconds_per_request)
+
+    return _rate_limiter
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of fetching a single URL
+    """
+    url: str
+    status_code: int | None
+    content: bytes
+    elapsed: float
+    attempts: int
+    error: str | None = None
+    unchanged: bool = False
+    waited: float = 0.0
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        # A 304 is answered from the cache, so its content is available too
+        return self.status_code in (200, 304)
+
+
+def create_session(max_connections: int) -> requests.Session:
+    """
+    Create an HTTP session whose connections are kept alive between requests
+
+    :param max_connections: Number of pooled connections per host
+    :return: Configured session
+    """
+    # Imported here, so that processes which never fetch do not load requests and urllib3
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_connections, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": "Scout (ResearchRadar)"})
+    return session
+
+
+def fetch_all(urls: list[str],
+              rate_limiter: TokenBucket,
+              max_in_flight: int = 4,
+              max_retries: int = 3,
+              backoff: float = 2.0,
+              timeout: float = 10,
+              on_result: Callable[[FetchResult], None] | None = None,
+              cache: HttpCache | None = None) -> list[FetchResult]:
+    """
+    Fetch several URLs concurrently while respecting a shared rate limit
+
+    With a cache, requests are made conditional on the cached validators and results are
+    marked as unchanged when the server replies 304 or returns the same content as before.
+    Changed content is not cached here, the caller stores it with store_response once it
+    has been processed, so that a page is never skipped as unchanged before it was handled
+
+    :param urls: URLs to be fetched
+    :param rate_limiter: Token bucket that every attempt (including retries) must pass through
+    :param max_in_flight: Maximum number of requests waiting on the network at once
+    :param max_retries: Number of retries for connection errors and retryable status codes
+    :param backoff: Base delay in seconds, doubled on each retry
+    :param timeout: Timeout in seconds of a single request
+    :param on_result: Optional callback invoked as soon as each URL completes, if it raises the
+                      response is removed from the cache and the error recorded on the result
+    :param cache: Optional on-disk cache of previous responses
+    :return: Results in the same order as the URLs
+    """
+    return asyncio.run(_fetch_all(urls, rate_limiter, max_in_flight, max_retries, backoff, timeout, on_result, cache))
+
+
+async def _fetch_all(urls: list[str],
+                     rate_limiter: TokenBucket,
+                     max_in_flight: int,
+                     max_retries: int,
+                     backoff: float,
+                     timeout: float,
+                     on_result: Callable[[FetchResult], None] | None,
+                     cache: HttpCache | None) -> list[FetchResult]:
+    semaphore = asyncio.Semaphore(max(max_in_flight, 1))
+
+    with create_session(max_in_flight) as session:
+        async def run(url: str) -> FetchResult:
+            async with semaphore:
+                result: FetchResult = await _fetch_with_retries(session, url, rate_limiter,
+                                                                max_retries, backoff, timeout, cache)
+
+            # Handle the result while other requests are still in flight
+            if on_result is not None:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    logger.exception(f"Failed to handle response from {url}: {e}")
+
+                    # The response was not processed, so it must not be skipped as unchanged next time
+                    if cache is not None:
+                        cache.remove(url)
+                    result.error = f"Failed to handle response: {e}"
+                    result.unchanged = False
+
+            return result
+
+        return list(await asyncio.gather(*[run(url) for url in urls]))
+
+
+async def _fetch_with_retries(session: requests.Session,
+                              url: str,
+                              rate_limiter: TokenBucket,
+                              max_retries: int,
+                              backoff: float,
+                              timeout: float,
+                              cache: HttpCache | None = None) -> FetchResult:
+    import requests
+
+    start: float = time.monotonic()
+    entry: CacheEntry | None = cache.get(url) if cache is not None else None
+    headers: dict[str, str] = HttpCache.conditional_headers(entry)
+    status_code: int | None = None
+    error: str | None = None
+    attempt: int = 0
+    waited: float = 0.0
+
+    while True:
+        attempt += 1
+        wait_start: float = time.monotonic()
+        await rate_limiter.acquire_async()
+        waited += time.monotonic() - wait_start
+
+        retry_after: float = 0.0
+        try:
+            r: requests.Response = await asyncio.to_thread(session.get, url, headers=headers, timeout=timeout)
+            status_code = r.status_code
+            error = None
+
+            if status_code not in RETRY_STATUS_CODES:
+                result = FetchResult(url=url, status_code=status_code, content=r.content,
+                                     elapsed=time.monotonic() - start, attempts=attempt, waited=waited)
+                if cache is not None:
+                    _apply_cache(cache, entry, r, result)
+                return result
+
+            error = f"HTTP {status_code}"
+            retry_after = _parse_retry_after(r.headers.get("Retry-After"))
+        except requests.RequestException as e:
+            status_code = None
+            error = str(e)
+
+        if attempt > max_retries:
+            logger.warning(f"Giving up on {url} after {attempt} attempts: {error}")
+            return FetchResult(url=url, status_code=status_code, content=b"",
+                               elapsed=time.monotonic() - start, attempts=attempt, error=error, waited=waited)
+
+        delay: float = max(backoff * 2 ** (attempt - 1), retry_after)
+        logger.info(f"Retrying {url} in {delay:.1f}s ({error})")
+        await asyncio.sleep(delay)
+
+
+def _apply_cache(cache: HttpCache, entry: CacheEntry | None, r: requests.Response, result: FetchResult):
+    """
+    Answer a 304 from the cache, or check whether the content of a new response changed
+    """
+    if result.status_code == 304 and entry is not None:
+        body: bytes | None = cache.read(result.url)
+        if body is not None:
+            cache.refresh(result.url, entry)
+            result.content = body
+            result.unchanged = True
+            return
+
+        # The body has gone missing, so the response cannot be used
+        result.status_code = None
+        result.error = "Not modified, but the cached body is unavailable"
+        return
+
+    if result.status_code == 200:
+        result.etag = r.headers.get("ETag")
+        result.last_modified = r.headers.get("Last-Modified")
+        result.unchanged = entry is not None and entry.content_hash == content_hash(result.content)
+
+        # The same content was processed before, so its entry is renewed straight away
+        if result.unchanged:
+            cache.put(result.url, result.content, etag=result.etag, last_modified=result.last_modified)
+
+
+def store_response(cache: HttpCache, result: FetchResult):
+    """
+    Cache a changed response once its content has been processed and stored, a later fetch
+    of the same content is then skipped as unchanged
+
+    :param cache: Cache the response was fetched with
+    :param result: Result returned by fetch_all
+    """
+    if result.status_code == 200 and not result.unchanged:
+        cache.put(result.url, result.content, etag=result.etag, last_modified=result.last_modified)
+
+
+def _parse_retry_after(value: str | None) -> float:
+    """
+    Convert a Retry-After header to seconds, ignoring the HTTP date form
+    """
+    if not value:
+        return 0.0
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return 0.0
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+
+@dataclass
+class CacheEntry:
+    """
+    Metadata of a cached response, the body is stored alongside it
+    """
+    url: str
+    content_hash: str
+    size: int
+    stored_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class HttpCache:
+    """
+    On-disk cache of response bodies keyed by URL, used to make conditional requests
+
+    Entries are evicted once they are older than max_age, or least recently
+    used first once the cache grows beyond max_bytes
+    """
+
+    def __init__(self, directory: str | Path, max_age: float = 48 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param directory: Location of the cache, created if required
+        :param max_age: Seconds after which an entry is discarded
+        :param max_bytes: Total size of the stored bodies
+        """
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age: float = max_age
+        self.max_bytes: int = max_bytes
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CacheEntry | None:
+        """
+        :return: Entry for the URL, or None if it is missing or has expired
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            entry = CacheEntry(**json.loads(meta_path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+        if entry.url != url or time.time() - entry.stored_at > self.max_age or not body_path.exists():
+            return None
+
+        return entry
+
+    def read(self, url: str) -> bytes | None:
+        """
+        :return: Cached body of the URL, or None if it is not available
+        """
+        _, body_path = self._paths(url)
+        try:
+            body: bytes = body_path.read_bytes()
+        except OSError:
+            return None
+
+        # Used as the recency of the entry when evicting
+        os.utime(body_path)
+        return body
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry | None) -> dict[str, str]:
+        """
+        :return: Headers that ask the server to reply 304 if the entry is still current
+        """
+        headers: dict[str, str] = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(self, url: str, body: bytes, etag: str | None = None, last_modified: str | None = None) -> CacheEntry:
+        """
+        Store a response, replacing any previous entry for the URL
+        """
+        entry = CacheEntry(url=url,
+                           content_hash=content_hash(body),
+                           size=len(body),
+                           stored_at=time.time(),
+                           etag=etag,
+                           last_modified=last_modified)
+
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            _write_atomic(body_path, body)
+            _write_atomic(meta_path, json.dumps(asdict(entry)).encode("utf8"))
+
+        return entry
+
+    def refresh(self, url: str, entry: CacheEntry) -> CacheEntry:
+        """
+        Mark an entry as current again, e.g. after a 304 response
+        """
+        entry.stored_at = time.time()
+        meta_path, _ = self._paths(url)
+        with self._lock:
+            _write_atomic(meta_path, json.dumps(asdict(entry)).encode("utf8"))
+        return entry
+
+    def remove(self, url: str):
+        """
+        Discard the entry for a URL, e.g. when its content could not be processed
+        """
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            _remove(meta_path, body_path)
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then the least recently used until the cache fits within max_bytes
+
+        :return: Number of entries removed
+        """
+        now: float = time.time()
+        entries: list[tuple[float, int, Path, Path]] = []
+        removed: int = 0
+
+        with self._lock:
+            for meta_path in self.directory.glob("*.json"):
+                body_path: Path = meta_path.with_suffix(".body")
+                try:
+                    meta = json.loads(meta_path.read_text())
+                    last_used: float = body_path.stat().st_mtime
+                except (OSError, ValueError):
+                    meta, last_used = None, 0.0
+
+                if meta is None or now - meta.get("stored_at", 0) > self.max_age:
+                    removed += _remove(meta_path, body_path)
+                else:
+                    entries.append((last_used, meta.get("size", 0), meta_path, body_path))
+
+            total: int = sum(size for _, size, _, _ in entries)
+            for _, size, meta_path, body_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                removed += _remove(meta_path, body_path)
+                total -= size
+
+        if removed:
+            logger.info(f"Evicted {removed} entries from the HTTP cache")
+        return removed
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key: str = hashlib.sha256(url.encode("utf8")).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes):
+    temporary: Path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def _remove(meta_path: Path, body_path: Path) -> int:
+    for path in (meta_path, body_path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    return 1
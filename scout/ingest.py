@@ -0,0 +1,134 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import Connection, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, Paper
+from arxiv_ids import IdFilter, encode_arxiv_id
+from engine import write
+from response_cache import expire_data_version
+from stats import record_ingest, reserve_ingest_seq
+
+from flask import current_app
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Rows written per transaction
+DEFAULT_CHUNK_SIZE: int = 10_000
+
+
+# Key of the application's filter of stored IDs, see get_id_filter
+ID_FILTER_EXTENSION: str = "scout_id_filter"
+_id_filter_lock = threading.Lock()
+
+
+def insert_papers(papers: Iterable[tuple[str, datetime]], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  source: str = "ingest", on_chunk: Callable[[int, int], None] | None = None) -> int:
+    """
+    Insert papers in bulk, ignoring any that already exist
+
+    IDs already in the filter of stored IDs are dropped without touching the database,
+    the rest of each chunk is written by the database writer with a single executemany
+    inside one transaction, the number of stored papers is taken from the row counts
+    reported by SQLite
+
+    :param papers: Pairs of arXiv ID and index date, the first occurrence of an ID wins
+    :param chunk_size: Number of rows per transaction
+    :param source: Name used when logging throughput
+    :param on_chunk: Optional callback invoked after each chunk with the rows processed and papers stored so far
+    :return: Number of papers that did not previously exist in the database
+    """
+    stmt = sqlite_insert(Paper.__table__).on_conflict_do_nothing(index_elements=["arxiv_id"])
+    id_filter: IdFilter = get_id_filter()
+
+    start: float = time.monotonic()
+    num_rows: int = 0
+    num_added: int = 0
+    num_known: int = 0
+
+    for chunk in _chunked(papers, chunk_size):
+        # Duplicates within a chunk and known papers are dropped before reaching SQLite
+        rows: dict[str, datetime] = {}
+        for arxiv_id, index_date in chunk:
+            if arxiv_id not in rows and arxiv_id not in id_filter:
+                rows[arxiv_id] = index_date
+
+        chunk_added: int = write(_insert_chunk, stmt, rows) if rows else 0
+        id_filter.update(rows)
+        if chunk_added:
+            expire_data_version()
+
+        num_known += len(chunk) - len(rows)
+        num_rows += len(chunk)
+        num_added += chunk_added
+
+        if on_chunk is not None:
+            on_chunk(num_rows, num_added)
+
+    elapsed: float = time.monotonic() - start
+    rate: float = num_rows / elapsed if elapsed > 0 else 0.0
+    logger.info(f"{source}: processed {num_rows:,} rows and stored {num_added:,} papers "
+                f"in {elapsed:.2f}s ({rate:,.0f} rows/s), {num_known:,} rows were known without a query")
+
+    return num_added
+
+
+def get_id_filter() -> IdFilter:
+    """
+    Filter of the IDs stored in the application's database, loaded on first use
+
+    Must be called within an application context
+    """
+    id_filter: IdFilter | None = current_app.extensions.get(ID_FILTER_EXTENSION)
+    if id_filter is not None:
+        return id_filter
+
+    with _id_filter_lock:
+        if ID_FILTER_EXTENSION not in current_app.extensions:
+            current_app.extensions[ID_FILTER_EXTENSION] = load_id_filter()
+        return current_app.extensions[ID_FILTER_EXTENSION]
+
+
+def load_id_filter() -> IdFilter:
+    """
+    Build a filter of the stored IDs, reading the keys in order from their index
+    """
+    start: float = time.monotonic()
+    id_filter = IdFilter()
+
+    with db.engine.connect() as connection:
+        keys = connection.execute(select(Paper.arxiv_key)
+                                  .where(Paper.arxiv_key.is_not(None))
+                                  .order_by(Paper.arxiv_key)).scalars()
+        others = connection.execute(select(Paper.arxiv_id).where(Paper.arxiv_key.is_(None))).scalars()
+        id_filter.rebuild(keys, others)
+
+    logger.info(f"Loaded {len(id_filter):,} stored IDs ({id_filter.memory_bytes() / 1024 / 1024:.1f} MiB) "
+                f"in {time.monotonic() - start:.2f}s")
+    return id_filter
+
+
+def _insert_chunk(connection: Connection, stmt, rows: dict[str, datetime]) -> int:
+    # Numbers of rows that turn out to exist already are skipped, so the sequence may have gaps
+    first_seq: int = reserve_ingest_seq(connection, len(rows))
+    result = connection.execute(stmt, [{"arxiv_id": arxiv_id, "index_date": index_date,
+                                        "arxiv_key": encode_arxiv_id(arxiv_id), "ingest_seq": first_seq + offset}
+                                       for offset, (arxiv_id, index_date) in enumerate(rows.items())])
+    num_added: int = max(result.rowcount, 0)
+    record_ingest(connection, num_added)
+    return num_added
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+from utils.metrics import REGISTRY, Counter, Histogram
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from flask import Blueprint, Flask, Response, g, request
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("metrics", __name__)
+
+# Requests, labelled by endpoint rather than path so that the number of series is bounded
+http_requests = Counter("scout_http_requests_total", "HTTP requests handled",
+                        ("method", "endpoint", "status"))
+http_request_duration = Histogram("scout_http_request_duration_seconds",
+                                  "Time to produce a response, excluding the body of streamed responses",
+                                  ("method", "endpoint"))
+
+# Scrapes, split into the phases of run_scrape
+scrape_phase_duration = Histogram("scout_scrape_phase_duration_seconds", "Time spent in each phase of a scrape",
+                                  ("phase",), buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+scrape_papers = Counter("scout_scrape_papers_total", "Papers found and added by scrapes", ("outcome",))
+
+# Repositories, labelled by repository as the configured list is small
+repository_fetches = Counter("scout_repository_fetches_total", "Listing fetches by outcome",
+                             ("repository", "outcome"))
+repository_fetch_duration = Histogram("scout_repository_fetch_duration_seconds",
+                                      "Time to fetch a listing, including retries and rate limiting",
+                                      ("repository",))
+repository_extract_duration = Histogram("scout_repository_extract_duration_seconds",
+                                        "Time to extract the IDs of a listing", ("repository",),
+                                        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+# Read endpoints answered from the response cache, see response_cache.cached_response
+response_cache_requests = Counter("scout_response_cache_requests_total",
+                                  "Requests to cached endpoints by outcome, one of hit, miss, not_modified or bypass",
+                                  ("endpoint", "outcome"))
+
+
+def init_app(app: Flask):
+    """
+    Time every request handled by the application
+    """
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response: Response) -> Response:
+        start: float | None = g.pop("request_start", None)
+        if start is not None:
+            endpoint: str = request.endpoint or "unmatched"
+            http_request_duration.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint)
+            http_requests.inc(method=request.method, endpoint=endpoint, status=str(response.status_code))
+        return response
+
+
+@contextmanager
+def scrape_phase(phase: str) -> Iterator[None]:
+    """
+    Time a phase of a scrape, e.g. fetch or insert
+    """
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed: float = time.perf_counter() - start
+        scrape_phase_duration.observe(elapsed, phase=phase)
+        logger.debug(f"Scrape phase {phase} took {elapsed:.3f}s")
+
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Endpoint that returns every metric in the Prometheus text format
+    """
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
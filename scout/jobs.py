@@ -0,0 +1,294 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+from sqlalchemy import Connection, insert, select, update
+from db import db, Job
+from engine import write
+
+from flask import (
+    Blueprint, Flask, flash, redirect, request, url_for, jsonify
+)
+from werkzeug.exceptions import abort
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("jobs", __name__)
+
+# Lifecycle of a job
+JOB_QUEUED: str = "queued"
+JOB_RUNNING: str = "running"
+JOB_FINISHED: str = "finished"
+JOB_FAILED: str = "failed"
+
+
+class JobProgress:
+    """
+    Progress reporter handed to every job, each update is persisted to the job table
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id: int = job_id
+        self.state: dict = {}
+        self._lock = threading.Lock()
+
+    def update(self, **values):
+        """
+        Set top-level progress values, e.g. a message or counters
+        """
+        with self._lock:
+            self.state.update(values)
+            self._save()
+
+    def set_item(self, group: str, key: str, value):
+        """
+        Set the progress of a single item within a group, e.g. one repository of a scrape
+
+        :param group: Name of the group, e.g. "repositories"
+        :param key: Item within the group
+        :param value: JSON serialisable progress of the item
+        """
+        with self._lock:
+            self.state.setdefault(group, {})[key] = value
+            self._save()
+
+    def _save(self):
+        # Copy the state so that the JSON column sees a new value
+        _update_job(self.job_id, progress=dict(self.state))
+
+
+class JobQueue:
+    """
+    Runs jobs on a thread pool, recording their state in the job table
+
+    Submitting a job while another of the same kind is queued or running
+    returns the existing job instead of starting a duplicate
+    """
+
+    def __init__(self):
+        self._app: Flask | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._active: dict[str, int] = {}
+        self._stop = threading.Event()
+
+    def init_app(self, app: Flask, max_workers: int = 2):
+        """
+        :param app: Application whose context jobs are executed in
+        :param max_workers: Number of jobs that may run at once
+        """
+        self._app = app
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scout-job")
+
+    def submit(self, kind: str, func: Callable, *args, **kwargs) -> tuple[int, bool]:
+        """
+        Queue a job, merging it with an active job of the same kind
+
+        :param kind: Name of the job type, used for de-duplication
+        :param func: Callable invoked as func(progress, *args, **kwargs) within the app context
+        :return: ID of the job and whether a new job was created
+        """
+        if self._executor is None:
+            raise RuntimeError("Job queue has not been initialised")
+
+        with self._lock:
+            if kind in self._active:
+                return self._active[kind], False
+
+            with self._app.app_context():
+                job_id: int = _create_job(kind)
+
+            self._active[kind] = job_id
+
+        logger.info(f"Queued {kind} job {job_id}")
+        self._executor.submit(self._run, job_id, kind, func, args, kwargs)
+        return job_id, True
+
+    def schedule(self, kind: str, interval_minutes: int | Callable[[], int], func: Callable,
+                 *args, **kwargs) -> threading.Thread:
+        """
+        Submit a job on a fixed interval, aligned to midnight like a */N cron entry
+
+        :param kind: Name of the job type
+        :param interval_minutes: Minutes between runs, or a callable read before each run (0 pauses the schedule)
+        :param func: Job callable, see submit
+        :return: Daemon thread driving the schedule
+        """
+        get_interval: Callable[[], int] = interval_minutes if callable(interval_minutes) else lambda: interval_minutes
+
+        def loop():
+            while True:
+                interval: int = get_interval()
+
+                # Check again later whether the schedule has been enabled
+                if not interval:
+                    if self._stop.wait(60):
+                        return
+                    continue
+
+                delay: float = _seconds_until_next_run(datetime.now(), interval)
+                if self._stop.wait(delay):
+                    return
+
+                # The interval may have been disabled while waiting
+                if not get_interval():
+                    continue
+
+                try:
+                    self.submit(kind, func, *args, **kwargs)
+                except Exception as e:
+                    logger.exception(f"Failed to submit scheduled {kind} job: {e}")
+
+        thread = threading.Thread(target=loop, name=f"scout-schedule-{kind}", daemon=True)
+        thread.start()
+        logger.info(f"Scheduled {kind} jobs every {get_interval()} minutes")
+        return thread
+
+    def _run(self, job_id: int, kind: str, func: Callable, args: tuple, kwargs: dict):
+        with self._app.app_context():
+            _update_job(job_id, status=JOB_RUNNING, started_at=datetime.now())
+            progress = JobProgress(job_id)
+
+            try:
+                func(progress, *args, **kwargs)
+                _update_job(job_id, status=JOB_FINISHED, finished_at=datetime.now())
+                logger.info(f"Finished {kind} job {job_id}")
+            except Exception as e:
+                logger.exception(f"Failed {kind} job {job_id}: {e}")
+                _update_job(job_id, status=JOB_FAILED, finished_at=datetime.now(), error=str(e))
+            finally:
+                with self._lock:
+                    self._active.pop(kind, None)
+
+
+# Queue shared by the application, initialised in app.configure_jobs
+job_queue = JobQueue()
+
+
+@bp.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id: int):
+    """
+    Endpoint that reports the state and progress of a job
+    """
+    job: Job | None = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+
+    return jsonify(job.to_dict()), 200
+
+
+@bp.route("/jobs", methods=["GET"])
+def get_jobs():
+    """
+    Endpoint that lists the most recent jobs
+
+    Example usage
+    jobs?kind=scrape&limit=10
+    """
+    kind: str | None = request.args.get("kind")
+    limit: int = max(1, min(request.args.get("limit", 20, type=int), 100))
+
+    stmt = select(Job).order_by(Job.id.desc()).limit(limit)
+    if kind:
+        stmt = stmt.where(Job.kind == kind)
+
+    jobs: list[Job] = list(db.session.execute(stmt).scalars())
+    return jsonify([job.to_dict() for job in jobs]), 200
+
+
+@contextmanager
+def track_job(kind: str) -> Iterator[JobProgress]:
+    """
+    Record work carried out within the current request as a job, so that its progress can be followed
+
+    :param kind: Name of the job type
+    :return: Reporter for the job
+    """
+    job_id: int = _create_job(kind)
+    _update_job(job_id, status=JOB_RUNNING, started_at=datetime.now())
+
+    try:
+        yield JobProgress(job_id)
+    except Exception as e:
+        _update_job(job_id, status=JOB_FAILED, finished_at=datetime.now(), error=str(e))
+        raise
+
+    _update_job(job_id, status=JOB_FINISHED, finished_at=datetime.now())
+
+
+def job_response(job_id: int, created: bool, description: str, endpoint: str = "index"):
+    """
+    Respond to a request that submitted a job
+
+    API clients receive the job ID immediately, browsers are sent back to a page, the index by default
+
+    :param job_id: ID of the submitted job
+    :param created: False if the request was merged into an existing job
+    :param description: Human-readable name of the job
+    :param endpoint: Page that browsers are redirected to
+    """
+    status_url: str = url_for("jobs.get_job", job_id=job_id)
+
+    if request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json":
+        response = jsonify({"job_id": job_id, "created": created, "status_url": status_url})
+        response.status_code = 202
+        response.headers["Location"] = status_url
+        return response
+
+    if created:
+        flash(f"{description} started as job {job_id}")
+    else:
+        flash(f"{description} already in progress as job {job_id}")
+    return redirect(url_for(endpoint))
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    Mark jobs left queued or running by a previous run of the application as failed, as they
+    only ran on its threads. Must only be called by the process that runs the jobs of the database
+
+    :return: Number of jobs marked as failed
+    """
+    def fail(connection: Connection) -> int:
+        result = connection.execute(update(Job)
+                                    .where(Job.status.in_((JOB_QUEUED, JOB_RUNNING)))
+                                    .values(status=JOB_FAILED, finished_at=datetime.now(),
+                                            error="Interrupted by a restart of the application"))
+        return result.rowcount
+
+    interrupted: int = write(fail)
+    if interrupted:
+        logger.warning(f"Marked {interrupted} jobs interrupted by a restart as failed")
+    return interrupted
+
+
+def _create_job(kind: str) -> int:
+    def create(connection: Connection) -> int:
+        result = connection.execute(insert(Job).values(kind=kind, status=JOB_QUEUED,
+                                                       created_at=datetime.now(), progress={}))
+        return result.inserted_primary_key[0]
+
+    return write(create)
+
+
+def _update_job(job_id: int, **values):
+    write(lambda connection: connection.execute(update(Job).where(Job.id == job_id).values(**values)))
+
+
+def _seconds_until_next_run(now: datetime, interval_minutes: int) -> float:
+    """
+    Time until the next multiple of the interval, counted from midnight
+    """
+    interval_minutes = max(int(interval_minutes), 1)
+    midnight: datetime = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed: float = (now - midnight).total_seconds()
+    runs: int = int(elapsed // (interval_minutes * 60)) + 1
+    next_run: datetime = midnight + timedelta(minutes=runs * interval_minutes)
+    return (next_run - now).total_seconds()
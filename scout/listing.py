@@ -0,0 +1,234 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import html
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Every entry on a listing page has an element with this class holding its ID
+IDENTIFIER_CLASS: bytes = b"list-identifier"
+
+_START_TAG = re.compile(rb"<([a-zA-Z][^\s/>]*)([^<>]*)>")
+_CLASS_ATTR = re.compile(rb"""\sclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""", re.IGNORECASE)
+_TAG = re.compile(rb"<[^>]*>")
+_COMMENT = re.compile(rb"<!--.*?-->", re.DOTALL)
+
+# Regions whose contents are not markup, the class name may appear in them as text
+_OPAQUE = re.compile(rb"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>", re.DOTALL | re.IGNORECASE)
+
+# Fields of an entry, held in the <dd> that follows its identifier
+_DETAIL_DIV = re.compile(rb"""<div\s+class\s*=\s*["']list-(title|authors|subjects)\b[^"']*["'][^>]*>(.*?)</div\s*>""",
+                         re.DOTALL | re.IGNORECASE)
+_LINK = re.compile(rb"<a\b[^>]*>(.*?)</a\s*>", re.DOTALL | re.IGNORECASE)
+_DESCRIPTOR = re.compile(r"^\s*(Title|Authors|Subjects):\s*")
+_SUBJECT_CODE = re.compile(r"\(([^()]+)\)\s*$")
+
+# Size of a paged listing, e.g. "Total of 5,432 entries" on the listing of a month
+_TOTAL = re.compile(rb"total of\s+([\d,]+)\s+entries", re.IGNORECASE)
+
+
+@dataclass
+class ListingEntry:
+    """
+    A paper on a listing page, with the fields shown alongside its identifier
+    """
+    arxiv_id: str
+    listing_type: str
+    title: str = ""
+    authors: list[str] = field(default_factory=list)
+    subjects: list[str] = field(default_factory=list)
+
+    @property
+    def categories(self) -> list[str]:
+        """
+        Codes of the subjects, e.g. cs.LG for "Machine Learning (cs.LG)"
+        """
+        return [match.group(1) for subject in self.subjects if (match := _SUBJECT_CODE.search(subject))]
+
+
+class UnsupportedMarkup(ValueError):
+    """
+    Raised when a page cannot be handled by the fast extractor
+    """
+
+
+def _extract_identifiers_fast(content: bytes) -> list[str]:
+    """
+    Scan for the identifier class name and read the enclosing element, without building a tree
+
+    Only the identifier elements are decoded and stripped of tags, the rest of the page is never parsed
+    """
+    return [text for text, _, _ in _scan_identifiers(content)]
+
+
+def _scan_identifiers(content: bytes) -> list[tuple[str, int, int]]:
+    """
+    :return: Text, start and end offsets of each identifier element, see _extract_identifiers_fast
+    """
+    opaque: list[tuple[int, int]] = []
+    if b"<!--" in content or b"<script" in content or b"<style" in content:
+        opaque = [match.span() for match in _OPAQUE.finditer(content)]
+    opaque_starts: list[int] = [start for start, _ in opaque]
+
+    identifiers: list[tuple[str, int, int]] = []
+    position: int = 0
+
+    while True:
+        index: int = content.find(IDENTIFIER_CLASS, position)
+        if index < 0:
+            break
+        position = index + len(IDENTIFIER_CLASS)
+
+        # Ignore occurrences within comments, scripts and styles
+        region: int = bisect_right(opaque_starts, index) - 1
+        if region >= 0 and index < opaque[region][1]:
+            continue
+
+        # The occurrence must be within the class attribute of a start tag
+        tag_start: int = content.rfind(b"<", 0, index)
+        tag = _START_TAG.match(content, tag_start) if tag_start >= 0 else None
+        if tag is None or tag.end() <= index:
+            continue
+
+        if IDENTIFIER_CLASS not in _class_names(tag.group(2)):
+            position = tag.end()
+            continue
+
+        name: bytes = tag.group(1).lower()
+        if tag.group(2).rstrip().endswith(b"/"):
+            raise UnsupportedMarkup(f"Self-closing <{name.decode()}> identifier element")
+
+        close = re.compile(rb"</" + re.escape(name) + rb"\s*>", re.IGNORECASE).search(content, tag.end())
+        if close is None:
+            raise UnsupportedMarkup(f"Unclosed <{name.decode()}> identifier element")
+
+        inner: bytes = content[tag.end():close.start()]
+        if re.search(rb"<" + re.escape(name) + rb"[\s/>]", inner, re.IGNORECASE):
+            raise UnsupportedMarkup(f"Nested <{name.decode()}> within an identifier element")
+
+        identifiers.append((_text(inner), tag_start, close.end()))
+        position = close.end()
+
+    return identifiers
+
+
+def _class_names(attributes: bytes) -> list[bytes]:
+    match = _CLASS_ATTR.search(b" " + attributes)
+    if match is None:
+        return []
+
+    value: bytes = next(group for group in match.groups() if group is not None)
+    return value.split()
+
+
+def _text(inner: bytes) -> str:
+    """
+    Equivalent of the element's text in BeautifulSoup, i.e. its strings without markup
+    """
+    if b"<!--" in inner:
+        inner = _COMMENT.sub(b"", inner)
+
+    try:
+        text: str = _TAG.sub(b"", inner).decode("utf8")
+    except UnicodeDecodeError as e:
+        raise UnsupportedMarkup("Page is not UTF-8 encoded") from e
+
+    return html.unescape(text) if "&" in text else text
+
+
+def _extract_identifiers_bs4(content: bytes) -> list[str]:
+    """
+    Reference implementation, builds the full tree of the page
+    """
+    from bs4 import BeautifulSoup
+
+    # Parse the HTML
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Find all elements with class "list-identifier"
+    identifier_elements: list = soup.find_all(class_="list-identifier")
+    return [tag.text for tag in identifier_elements]
+
+
+def extract_listing_entries(content: bytes, include: list[str] | None = None) -> list[ListingEntry]:
+    """
+    Extract the entries of the requested listing types, with the title, authors and subjects of each
+
+    The fields are read from the markup between one identifier and the next, falling back to
+    entries without fields if the page cannot be handled by the fast extractor
+
+    :param content: Listing page HTML
+    :param include: Any of "new", "cross-list" and "replaced"
+    :return: Entries in page order, the first of each ID
+    """
+    try:
+        identifiers: list[tuple[str, int, int]] = _scan_identifiers(content)
+    except UnsupportedMarkup as e:
+        logger.warning(f"Extracting identifiers without their fields: {e}")
+        identifiers = [(text, 0, 0) for text in _extract_identifiers_bs4(content)]
+
+    entries: dict[str, ListingEntry] = {}
+    for index, (text, _, end) in enumerate(identifiers):
+        arxiv_id, listing_type = _parse_identifier(text)
+        if not arxiv_id or listing_type not in (include or []) or arxiv_id in entries:
+            continue
+
+        entry = ListingEntry(arxiv_id=arxiv_id, listing_type=listing_type)
+        if end:
+            region_end: int = identifiers[index + 1][1] if index + 1 < len(identifiers) else len(content)
+            _read_fields(entry, content[end:region_end])
+        entries[arxiv_id] = entry
+
+    return list(entries.values())
+
+
+def extract_listing_total(content: bytes) -> int | None:
+    """
+    :param content: Page of a paged listing, e.g. /list/<repository>/<yymm>?skip=0&show=2000
+    :return: Number of entries across every page of the listing, None if not shown
+    """
+    match = _TOTAL.search(content)
+    return int(match.group(1).replace(b",", b"")) if match else None
+
+
+def _parse_identifier(id_text: str) -> tuple[str, str]:
+    """
+    :param id_text: Text of an identifier element, e.g. "arXiv:2306.01234 (cross-list from math.OC) [pdf]"
+    :return: ID and listing type of the element, the ID is empty if the text is
+    """
+    arxiv_id: str = id_text.split(" ")[0].split(":")[-1] if id_text else ""
+    if "cross-list" in id_text:
+        return arxiv_id, "cross-list"
+    if "replaced" in id_text:
+        return arxiv_id, "replaced"
+    return arxiv_id, "new"
+
+
+def _read_fields(entry: ListingEntry, region: bytes):
+    for match in _DETAIL_DIV.finditer(region):
+        name: bytes = match.group(1).lower()
+        inner: bytes = match.group(2)
+
+        try:
+            if name == b"title":
+                entry.title = _clean(_text(inner))
+            elif name == b"authors":
+                links: list[bytes] = _LINK.findall(inner)
+                names: list[str] = [_clean(_text(link)) for link in links] if links else _clean(_text(inner)).split(",")
+                entry.authors = [name for name in (name.strip() for name in names) if name]
+            elif name == b"subjects":
+                entry.subjects = [subject.strip() for subject in _clean(_text(inner)).split(";") if subject.strip()]
+        except UnsupportedMarkup:
+            continue
+
+
+def _clean(text: str) -> str:
+    # Fields are wrapped over several lines and start with a descriptor, e.g. "Title:"
+    return _DESCRIPTOR.sub("", " ".join(text.split()))
+
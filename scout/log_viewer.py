@@ -1,8 +1,10 @@
 from __future__ import annotations
-from utils.default_logging import configure_default_logging
+from utils.default_logging import configure_default_logging, resolve_log_path, LOG_SEPARATOR
 from datetime import datetime
+import json
 import os
 from pathlib import Path
+from typing import Iterator
 
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, url_for, current_app, jsonify
@@ -16,42 +18,246 @@ logger.info(f"Logging initialised from {__name__}")
 
 bp = Blueprint("log", __name__)
 
-# TODO Rewrite this with proper args
+# Current log file of the app, rotated copies sit alongside it with a suffix, workers write their own (see worker.py)
+LOG_FILE: str = "logs/scout.log"
+LOG_TIME_FORMAT: str = "%Y-%m-%d %H:%M:%S,%f"
+
+# Files are read backwards this many bytes at a time
+BLOCK_SIZE: int = 64 * 1024
+
+# Upper bound on the bytes read by a single request, so that a selective filter
+# cannot scan the whole history, the cursor continues from where the scan stopped
+MAX_SCAN_BYTES: int = 8 * 1024 * 1024
+
+
 @bp.route("/logs/<int:entries>", methods=["GET"])
 @bp.route("/logs", defaults={"entries": 0}, methods=["GET"])
 def get_latest_logs(entries: int):
-    # This shouldn't be hardcoded
-    filename: str = "logs/scout.log"
+    """
+    Endpoint that returns the latest log entries, oldest first
+
+    Entries are read backwards from the end of the log, continuing into rotated files.
+    The cursor of the next (older) page is returned in the X-Next-Cursor header
+
+    Example usage
+    logs?entries=100&level=WARNING&logger=scraper&since=2023-06-01T00:00:00&cursor=<X-Next-Cursor>
+    """
     max_entries: int = 250
 
     # Limit the number of entries that can be returned
-    if (entries > max_entries) or (entries == 0):
+    entries = request.args.get("entries", entries, type=int)
+    if (entries > max_entries) or (entries <= 0):
         entries = max_entries
 
-    if os.path.exists(filename):
-        data: list[str] = Path(filename).read_text().split("\n")
-        data: list[str] = [entry for entry in data if entry]
+    try:
+        filters = LogFilter(level=request.args.get("level"),
+                            name=request.args.get("logger"),
+                            since=_parse_time_arg("since"),
+                            until=_parse_time_arg("until"))
+        cursor: tuple[int, int] | None = _parse_cursor(request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    formatted_data, next_cursor = read_log_entries(resolve_log_path(LOG_FILE), entries, filters, cursor)
+
+    response = jsonify(formatted_data)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = f"{next_cursor[0]}:{next_cursor[1]}"
+    return response
+
+
+class LogFilter:
+    """
+    Criteria that log entries must meet to be returned
+    """
+
+    def __init__(self, level: str | None = None, name: str | None = None,
+                 since: datetime | None = None, until: datetime | None = None):
+        """
+        :param level: Minimum level, e.g. WARNING
+        :param name: Logger name, also matching its children
+        :param since: Oldest time of an entry, inclusive
+        :param until: Newest time of an entry, inclusive
+        """
+        self.level: int = logging.NOTSET
+        if level:
+            self.level = logging.getLevelName(level.upper())
+            if not isinstance(self.level, int):
+                raise ValueError(f"Unknown level {level}")
+
+        self.name: str | None = name
+        self.since: datetime | None = since
+        self.until: datetime | None = until
+
+    def matches(self, entry: dict, time: datetime | None) -> bool:
+        if self.level and logging.getLevelName(entry["level"]) < self.level:
+            return False
 
-        if len(data) > entries:
-            data = data[-entries:]
+        if self.name and entry["name"] != self.name and not entry["name"].startswith(f"{self.name}."):
+            return False
 
-    else:
-        data: list[str] = []
+        if self.until is not None and time is not None and time > self.until:
+            return False
 
-    # Pre-process the strings
+        return True
+
+
+def read_log_entries(filename: str,
+                     entries: int,
+                     filters: LogFilter,
+                     cursor: tuple[int, int] | None = None) -> tuple[list[dict], tuple[int, int] | None]:
+    """
+    Read the newest matching entries, starting from the end of the log or from a cursor
+
+    :param filename: Current log file
+    :param entries: Maximum number of entries to return
+    :param filters: Criteria that entries must meet
+    :param cursor: Inode and offset of the file to continue reading before
+    :return: Entries oldest first, and the cursor of the next older page if there may be one
+    """
     formatted_data: list[dict] = []
-    for entry in data:
-        items: list[str] = entry.split("-*-")
+    scanned: int = 0
+    files: list[Path] = _log_files(filename)
+
+    # Resume from the file identified by the cursor, which survives the file being renamed by rotation
+    start_offset: int | None = None
+    if cursor is not None:
+        inode, start_offset = cursor
+        files = _files_from_inode(files, inode)
+
+    for path in files:
+        inode: int = path.stat().st_ino
+        continuation: list[str] = []
+
+        for offset, line in _read_lines_backwards(path, start_offset):
+            scanned += len(line) + 1
+            entry: dict | None = _parse_entry(line)
+
+            # Lines that are not entries (e.g. tracebacks) belong to the entry above them
+            if entry is None:
+                continuation.insert(0, line)
+                continue
+
+            if continuation:
+                entry["message"] = "\n".join([entry["message"], *continuation])
+                continuation = []
+
+            time: datetime | None = _parse_time(entry["time"])
+            if filters.since is not None and time is not None and time < filters.since:
+                # Everything further back is older still
+                return formatted_data[::-1], None
+
+            if filters.matches(entry, time):
+                formatted_data.append(entry)
+
+            if len(formatted_data) >= entries or scanned >= MAX_SCAN_BYTES:
+                return formatted_data[::-1], (inode, offset)
+
+        start_offset = None
+
+    return formatted_data[::-1], None
+
+
+def _log_files(filename: str) -> list[Path]:
+    """
+    The current log file followed by its rotated copies, newest first
+    """
+    path = Path(filename)
+    if not path.parent.exists():
+        return []
+
+    rotated: list[Path] = [candidate for candidate in path.parent.glob(f"{path.name}.*") if candidate.is_file()]
+    rotated.sort(key=lambda candidate: candidate.stat().st_mtime, reverse=True)
+    return ([path] if path.exists() else []) + rotated
+
+
+def _files_from_inode(files: list[Path], inode: int) -> list[Path]:
+    for index, path in enumerate(files):
+        if path.stat().st_ino == inode:
+            return files[index:]
+
+    # The file has since been deleted by rotation
+    return []
+
+
+def _read_lines_backwards(path: Path, end: int | None = None) -> Iterator[tuple[int, str]]:
+    """
+    Yield the non-empty lines of a file from the end, reading it in blocks
+
+    :param path: File to read
+    :param end: Offset to read before, defaults to the end of the file
+    :return: Iterator of the offset at which each line starts and the line
+    """
+    with open(path, "rb") as file:
+        position: int = file.seek(0, os.SEEK_END) if end is None else min(end, file.seek(0, os.SEEK_END))
+        remainder: bytes = b""
+
+        while position > 0:
+            size: int = min(BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            block: bytes = file.read(size) + remainder
+
+            # The first line of the block may be incomplete, keep it for the next block
+            lines: list[bytes] = block.split(b"\n")
+            remainder = lines.pop(0)
+            offset: int = position + len(block)
+
+            for line in reversed(lines):
+                offset -= len(line) + 1
+                if line.strip():
+                    yield offset + 1, line.decode("utf8", errors="replace")
+
+        if remainder.strip():
+            yield 0, remainder.decode("utf8", errors="replace")
+
+
+def _parse_entry(line: str) -> dict | None:
+    # Structured lines already hold the fields of an entry
+    if line.startswith("{"):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) and "message" in entry else None
+
+    items: list[str] = line.split(LOG_SEPARATOR)
+
+    if len(items) < 5:
+        return None
+
+    clean_entry: dict = {}
+    clean_entry["time"] = items[0].strip()
+    clean_entry["name"] = items[1].strip()
+    clean_entry["location"] = items[2].strip()
+    clean_entry["level"] = items[3].strip()
+
+    # The message itself may contain the separator
+    clean_entry["message"] = LOG_SEPARATOR.join(items[4:]).strip()
+    return clean_entry
+
+
+def _parse_time(value: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, LOG_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def _parse_time_arg(name: str) -> datetime | None:
+    value: str | None = request.args.get(name)
+    if not value:
+        return None
+
+    return datetime.fromisoformat(value)
 
-        if len(items) != 5:
-            logger.warning("Entry in log is malformed")
 
-        clean_entry: dict = {}
-        clean_entry["time"] = items[0].strip()
-        clean_entry["name"] = items[1].strip()
-        clean_entry["location"] = items[2].strip()
-        clean_entry["level"] = items[3].strip()
-        clean_entry["message"] = items[4].strip()
-        formatted_data.append(clean_entry)
+def _parse_cursor(value: str | None) -> tuple[int, int] | None:
+    if not value:
+        return None
 
-    return jsonify(formatted_data)
+    inode, _, offset = value.partition(":")
+    try:
+        return int(inode), int(offset)
+    except ValueError:
+        raise ValueError(f"Malformed cursor {value}")
@@ -0,0 +1,181 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+from utils.cache import LRUCache
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, Hashable
+
+from stats import get_data_version
+from settings import load_config
+from instrumentation import response_cache_requests
+
+from flask import Response, current_app, make_response, request
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Key of the application's response cache, see get_response_cache
+RESPONSE_CACHE_EXTENSION: str = "scout_response_cache"
+_response_cache_lock = threading.Lock()
+
+# Defaults of the response_cache section of the config
+DEFAULT_MAX_ENTRIES: int = 256
+DEFAULT_MAX_SIZE_MB: int = 64
+DEFAULT_MAX_AGE_SECONDS: int = 0
+DEFAULT_VERSION_TTL_SECONDS: float = 2.0
+
+
+@dataclass
+class CachedResponse:
+    """
+    Body and headers of a response, valid while the data version is unchanged
+    """
+    version: int
+    body: bytes
+    status: int
+    mimetype: str
+
+
+class ResponseCache:
+    """
+    Responses of read endpoints, keyed by endpoint and normalised parameters
+
+    Entries record the data version they were produced at and are replaced once it
+    moves on. The version is held in memory so that conditional requests are answered
+    without a query. Writes in this process expire it as soon as they commit, writes
+    from other processes sharing the database are seen within version_ttl seconds
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, version_ttl: float):
+        """
+        :param max_entries: Number of responses kept
+        :param max_bytes: Total size of the response bodies kept
+        :param version_ttl: Seconds the data version is trusted before it is read again
+        """
+        self.entries: LRUCache[CachedResponse] = LRUCache(max_entries, max_bytes)
+        self.version_ttl: float = version_ttl
+        self._lock = threading.Lock()
+        self._version: int = 0
+        self._version_read_at: float | None = None
+
+    def data_version(self) -> int:
+        """
+        :return: Current data version, read from the database if it has expired
+        """
+        with self._lock:
+            if self._version_read_at is not None and time.monotonic() - self._version_read_at < self.version_ttl:
+                return self._version
+
+        # Read outside the lock, the version only ever increases so the largest read wins
+        read_at: float = time.monotonic()
+        version: int = get_data_version()
+        with self._lock:
+            self._version = max(self._version, version)
+            self._version_read_at = read_at
+            return self._version
+
+    def expire_version(self):
+        """
+        Read the data version again on the next request, called once a write has committed
+        """
+        with self._lock:
+            self._version_read_at = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Response cache of the application, created on first use
+
+    Must be called within an application context
+    """
+    cache: ResponseCache | None = current_app.extensions.get(RESPONSE_CACHE_EXTENSION)
+    if cache is not None:
+        return cache
+
+    with _response_cache_lock:
+        if RESPONSE_CACHE_EXTENSION not in current_app.extensions:
+            cache_config: dict = load_config().get("response_cache", {})
+            current_app.extensions[RESPONSE_CACHE_EXTENSION] = ResponseCache(
+                max_entries=int(cache_config.get("max_entries", DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(cache_config.get("max_size_mb", DEFAULT_MAX_SIZE_MB) * 1024 * 1024),
+                version_ttl=float(cache_config.get("version_ttl_seconds", DEFAULT_VERSION_TTL_SECONDS)))
+        return current_app.extensions[RESPONSE_CACHE_EXTENSION]
+
+
+def expire_data_version():
+    """
+    Let the response cache know that papers have changed, must be called within an application context
+    """
+    cache: ResponseCache | None = current_app.extensions.get(RESPONSE_CACHE_EXTENSION)
+    if cache is not None:
+        cache.expire_version()
+
+
+def make_etag(key: tuple, version: int) -> str:
+    """
+    Entity tag of the response to a request at a data version. Responses are derived only
+    from the stored papers, so every process sharing the database gives the same tag
+    """
+    digest: str = hashlib.sha1(repr(key).encode("utf8")).hexdigest()[:16]
+    return f"{digest}-{version}"
+
+
+def cached_response(make_key: Callable[[], Hashable | None]):
+    """
+    Cache the successful responses of a view until the data version changes, and answer
+    requests whose If-None-Match matches the current entity tag with 304 Not Modified
+
+    :param make_key: Callable returning the normalised parameters of the current request,
+                     None if the response must not be cached, e.g. as it depends on the time
+    """
+
+    def decorator(view: Callable):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache_config: dict = load_config().get("response_cache", {})
+            params: Hashable | None = make_key() if cache_config.get("enabled", True) else None
+            if params is None:
+                response_cache_requests.inc(endpoint=request.endpoint, outcome="bypass")
+                return view(*args, **kwargs)
+
+            cache: ResponseCache = get_response_cache()
+            key: tuple = (request.endpoint, params)
+            version: int = cache.data_version()
+            etag: str = make_etag(key, version)
+            max_age: int = int(cache_config.get("max_age_seconds", DEFAULT_MAX_AGE_SECONDS))
+
+            # The tag identifies the response, so a client holding it needs nothing from the database
+            if request.if_none_match.contains_weak(etag):
+                response_cache_requests.inc(endpoint=request.endpoint, outcome="not_modified")
+                return _with_validators(Response(status=304), etag, max_age)
+
+            cached: CachedResponse | None = cache.entries.get(key)
+            if cached is not None and cached.version == version:
+                response_cache_requests.inc(endpoint=request.endpoint, outcome="hit")
+                response = Response(cached.body, status=cached.status, mimetype=cached.mimetype)
+                return _with_validators(response, etag, max_age)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                response_cache_requests.inc(endpoint=request.endpoint, outcome="bypass")
+                return response
+
+            body: bytes = response.get_data()
+            cache.entries.put(key, CachedResponse(version, body, response.status_code, response.mimetype), len(body))
+            response_cache_requests.inc(endpoint=request.endpoint, outcome="miss")
+            return _with_validators(response, etag, max_age)
+
+        return wrapper
+
+    return decorator
+
+
+def _with_validators(response: Response, etag: str, max_age: int) -> Response:
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+    return response
@@ -0,0 +1,142 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import re
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable
+
+from sqlalchemy import Connection, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, CategoryDaily, CategoryWeekly, PaperCategory
+from engine import write
+from response_cache import cached_response, expire_data_version
+from stats import record_change
+
+from flask import Blueprint, jsonify, request
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("rollups", __name__)
+
+# Rows written per transaction
+CHUNK_SIZE: int = 5_000
+
+# Rollup read for each interval, and the column holding the start of its periods
+ROLLUPS: dict[str, tuple[type, str]] = {"day": (CategoryDaily, "day"), "week": (CategoryWeekly, "week")}
+
+# Periods returned when no start date is given
+DEFAULT_PERIODS: dict[str, int] = {"day": 30, "week": 12}
+
+
+def store_categories(memberships: Iterable[tuple[str, str, str]], listed_on: date) -> int:
+    """
+    Record the categories whose listings showed each paper, updating the daily and weekly
+    rollups. Memberships that are already recorded are ignored, so listings seen again
+    are not counted twice. The papers must already be stored
+
+    :param memberships: Triples of arXiv ID, category and listing type, e.g. ("2306.00001", "cs.LG", "new")
+    :param listed_on: Day the listings were retrieved
+    :return: Number of memberships recorded
+    """
+    rows: Iterable[dict] = ({"arxiv_id": arxiv_id, "category": category, "listing_type": listing_type,
+                             "listed_on": listed_on}
+                            for arxiv_id, category, listing_type in memberships)
+
+    num_recorded: int = 0
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        num_recorded += write(_insert_chunk, chunk)
+
+    if num_recorded:
+        expire_data_version()
+    return num_recorded
+
+
+def _insert_chunk(connection: Connection, rows: list[dict]) -> int:
+    # The rollups are incremented by the insert trigger of paper_category, for new rows only
+    stmt = sqlite_insert(PaperCategory.__table__).on_conflict_do_nothing()
+    result = connection.execute(stmt, rows)
+    num_recorded: int = max(result.rowcount, 0)
+    if num_recorded:
+        record_change(connection)
+    return num_recorded
+
+
+def category_stats_key() -> tuple | None:
+    """
+    :return: Parameters of a request for statistics that identify its response, None unless both dates are given
+    """
+    if not request.args.get("start_date") or not request.args.get("end_date"):
+        return None
+    return tuple(request.args.get(name, "") for name in ("categories", "listing_types", "interval",
+                                                         "start_date", "end_date"))
+
+
+@bp.route("/stats", methods=["GET"])
+@cached_response(category_stats_key)
+def get_category_stats():
+    """
+    Endpoint that returns the number of papers listed by each category per day or per week,
+    read from the rollups maintained as papers are scraped
+
+    Takes a comma separated list of categories and of listing types (new, cross-list or
+    replaced), every one if omitted, an interval of day or week, and start_date and end_date
+    as with /papers. Periods without papers are left out of each series
+
+    Example usage
+    stats?categories=cs.LG,cs.AI&interval=week&start_date=01-01-2023&end_date=01-06-2023
+    """
+    interval: str = request.args.get("interval", "day")
+    if interval not in ROLLUPS:
+        return jsonify({"error": f"Unsupported interval, expected one of {', '.join(ROLLUPS)}"}), 400
+    rollup, period_column = ROLLUPS[interval]
+    period = getattr(rollup, period_column)
+
+    try:
+        end_date: date = _parse_date(request.args.get("end_date")) or date.today()
+        start_date: date = (_parse_date(request.args.get("start_date"))
+                            or end_date - timedelta(days=DEFAULT_PERIODS[interval] * (7 if interval == "week" else 1)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Weeks are included if they overlap the range
+    if interval == "week":
+        start_date -= timedelta(days=start_date.weekday())
+
+    categories: list[str] = _split(request.args.get("categories", ""))
+    listing_types: list[str] = _split(request.args.get("listing_types", ""))
+
+    stmt = (select(rollup.category, period.label("period"), rollup.listing_type, rollup.papers)
+            .where(period >= start_date, period <= end_date, rollup.papers > 0)
+            .order_by(rollup.category, period))
+    if categories:
+        stmt = stmt.where(rollup.category.in_(categories))
+    if listing_types:
+        stmt = stmt.where(rollup.listing_type.in_(listing_types))
+
+    series: dict[str, dict[str, dict]] = {}
+    for row in db.session.execute(stmt):
+        point: dict = series.setdefault(row.category, {}).setdefault(row.period.isoformat(),
+                                                                     {"date": row.period.isoformat(), "papers": 0})
+        point[row.listing_type] = row.papers
+        point["papers"] += row.papers
+
+    return jsonify({"interval": interval,
+                    "start_date": start_date.isoformat(),
+                    "end_date": end_date.isoformat(),
+                    "series": {category: list(points.values()) for category, points in series.items()}}), 200
+
+
+def _parse_date(value: str | None) -> date | None:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%d-%m-%Y").date()
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, expected dd-mm-yyyy") from None
+
+
+def _split(value: str) -> list[str]:
+    return [item for item in re.split(r"[,\s]+", value) if item]
@@ -1,23 +1,32 @@
 from __future__ import annotations
 from utils.default_logging import configure_default_logging
-from math import pi
 from datetime import datetime
 import os
 
-import bs4
-
 from utils.typing import PythonScalar
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import sessionmaker
-from db import db, Paper, Metric
-import yaml
-import requests
+from sqlalchemy import Connection
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, Paper, Metric, RepositoryMetric
+from engine import write
 import time
+from fetcher import FetchResult, TokenBucket, fetch_all, store_response
+from jobs import JobProgress, job_queue, job_response
+from ingest import insert_papers
+from listing import ListingEntry, extract_listing_entries
+from search import store_paper_text
+from rollups import store_categories
+from http_cache import HttpCache
+from charts import render_metrics_to_bokeh, run_refresh
+from settings import load_config
+from work_queue import (
+    ACTIVE_STATUSES, enqueue_batch, get_batch, get_queue_config, get_shared_rate_limiter, register_handler
+)
+from instrumentation import (
+    repository_extract_duration, repository_fetch_duration, repository_fetches, scrape_papers, scrape_phase
+)
 
 from pathlib import Path
-from bokeh.plotting import figure, show, output_file, save
-from bs4 import BeautifulSoup
 
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, url_for, jsonify, current_app
@@ -31,197 +40,322 @@ logger.info(f"Logging initialised from {__name__}")
 
 bp = Blueprint("scrape", __name__)
 
+# Seconds between checks on the items of a queued scrape, and the default time to wait for them
+QUEUE_POLL_SECONDS: float = 2.0
+DEFAULT_QUEUE_WAIT_MINUTES: int = 60
+
 
 @bp.route('/scrape')
 def scrape():
+    """
+    Queue a scrape of every repository listed in the config, see run_scrape
+    """
+    job_id, created = submit_scrape()
+    return job_response(job_id, created, "Scrape")
+
+
+@bp.route('/refresh')
+def refresh():
+    """
+    Queue a refresh / regeneration of any visualisations
+    """
+    job_id, created = job_queue.submit("refresh", run_refresh)
+    return job_response(job_id, created, "Refresh")
+
+
+def submit_scrape() -> tuple[int, bool]:
+    """
+    Queue a scrape job, merging it with one that is already queued or running
+
+    :return: ID of the job and whether a new job was created
+    """
+    return job_queue.submit("scrape", run_scrape)
+
+
+def run_scrape(progress: JobProgress):
     """
     Scrape the arXiv IDs for the new papers on each of the
     repositories listed in the config
+
+    With the work queue enabled, repositories are fetched by workers instead, see run_queued_scrape
+
+    :param progress: Reporter used to record the state of each repository
     """
     config: dict = load_config()
+    if get_queue_config(config)["enabled"]:
+        return run_queued_scrape(progress, config)
+
     repositories: list[str] = config.get("repositories", [])
+    targets: list[str] = config.get("targets", [])
     current_time: datetime = datetime.now()
     retrieved_paper_ids: list[str] = []
-
-    # TODO Add error handling and logging
+    entries: dict[str, ListingEntry] = {}
+    memberships: set[tuple[str, str, str]] = set()
+    cache: HttpCache | None = get_http_cache(config)
+    cache_hits: int = 0
+    repository_metrics: list[dict] = []
+    processed: list[FetchResult] = []
+
+    # All new, cross-listed, and replaced papers
+    arxiv_url: str = config.get("arxiv_url", "https://arxiv.org")
+    urls: dict[str, str] = {f"{arxiv_url}/list/{repository}/new": repository for repository in repositories}
     for repository in repositories:
-        # This could be improved by making the requests async or non-blocking
-        time.sleep(config.get("seconds_per_request", 4))
-
-        # All new, cross-listed, and replaced papers
-        url: str = f"https://arxiv.org/list/{repository}/new"
-
-        # Content can be extracted from the page HTML
-        r: requests.Response = requests.get(url, timeout=10)
-
-        # Extract the new arXiv IDs
-        if r.status_code == 200:
-            paper_ids: list[str] = extract_paper_ids(r.content, include=config.get("targets", []))
+        progress.set_item("repositories", repository, {"status": "pending"})
+
+    def handle_result(result: FetchResult):
+        # Extract the new arXiv IDs as each page arrives, while the remaining requests are in flight
+        nonlocal cache_hits
+        repository: str = urls[result.url]
+        page_entries, metric = process_listing(result, repository, targets)
+        repository_metrics.append(metric)
+        retrieved_paper_ids.extend(entry.arxiv_id for entry in page_entries)
+
+        # A paper listed by several repositories has the same fields on each, but is a member of each
+        for entry in page_entries:
+            entries.setdefault(entry.arxiv_id, entry)
+            memberships.add((entry.arxiv_id, repository, entry.listing_type))
+
+        if metric["status"] == "unchanged":
+            cache_hits += 1
+            progress.set_item("repositories", repository, {"status": "unchanged", "found": 0})
+        elif metric["status"] == "done":
+            progress.set_item("repositories", repository, {"status": "done", "found": len(page_entries)})
         else:
-            paper_ids: list[str] = []
-
-        retrieved_paper_ids.extend(paper_ids)
+            progress.set_item("repositories", repository, {"status": "failed",
+                                                           "error": result.error or f"HTTP {result.status_code}"})
+
+        if metric["status"] == "done":
+            processed.append(result)
+
+    # Requests are issued concurrently but share a single rate limit
+    rate_limiter: TokenBucket = get_shared_rate_limiter(config)
+    start: float = time.monotonic()
+    with scrape_phase("fetch"):
+        fetch_all(list(urls),
+                  rate_limiter,
+                  max_in_flight=config.get("max_in_flight", 4),
+                  max_retries=config.get("max_retries", 3),
+                  on_result=handle_result,
+                  cache=cache)
+    logger.info(f"Fetched {len(urls)} repositories in {time.monotonic() - start:.1f}s, "
+                f"{cache_hits} unchanged since the last scrape")
 
     # De-dupe and store in the database
     retrieved_paper_ids: list[str] = list(set(retrieved_paper_ids))
-    num_added_ids: int = len(retrieved_paper_ids)
-
-    # Start the session
-    Session = sessionmaker(bind=db.engine)
-    session = Session()
-
-    # Write all IDs to the database
-    for arxiv_id in retrieved_paper_ids:
-        try:
-            paper = Paper(arxiv_id=arxiv_id, index_date=current_time)
-            session.add(paper)
-            session.commit()
-        except IntegrityError as e:
-            # If the item exists, can ignore, don't log
-            session.rollback()
-            num_added_ids = num_added_ids - 1
-
-    # Add metrics to database
-    try:
-        metric = Metric(index_date=current_time,
-                        papers_found=len(retrieved_paper_ids),
-                        papers_added=num_added_ids)
-        session.add(metric)
-        session.commit()
-    except IntegrityError as e:
-        # If a metric with the same timestamp exists, ignore and rollback
-        session.rollback()
-
-    session.close()
+    with scrape_phase("insert"):
+        num_added_ids: int = insert_papers(((arxiv_id, current_time) for arxiv_id in retrieved_paper_ids),
+                                           source="scrape")
+
+    # Titles, authors and subjects are searchable once their papers are stored
+    with scrape_phase("index"):
+        num_indexed: int = store_paper_text(entries.values())
+    logger.info(f"Indexed the text of {num_indexed:,} new or changed papers")
+
+    # Categories of the papers, counted in the rollups read by /stats
+    with scrape_phase("categorise"):
+        num_categorised: int = store_categories(memberships, current_time.date())
+    logger.info(f"Recorded {num_categorised:,} new category memberships")
+
+    # Pages are skipped as unchanged only once their papers are stored, if anything above
+    # failed they are processed again by the next scrape
+    if cache is not None:
+        for result in processed:
+            store_response(cache, result)
+
+    scrape_papers.inc(len(retrieved_paper_ids), outcome="found")
+    scrape_papers.inc(num_added_ids, outcome="added")
+
+    # Add metrics to database, if a metric with the same timestamp exists it is kept
+    stmt = sqlite_insert(Metric).values(index_date=current_time,
+                                        papers_found=len(retrieved_paper_ids),
+                                        papers_added=num_added_ids,
+                                        cache_hits=cache_hits).on_conflict_do_nothing()
+    repository_stmt = sqlite_insert(RepositoryMetric).on_conflict_do_nothing()
+
+    def record(connection):
+        connection.execute(stmt)
+        if repository_metrics:
+            connection.execute(repository_stmt, [dict(values, index_date=current_time) for values in repository_metrics])
+
+    with scrape_phase("record"):
+        write(record)
 
     # Regenerate the graphs
-    res: bool = render_metrics_to_bokeh()
+    with scrape_phase("render"):
+        res: bool = render_metrics_to_bokeh()
     logger.info(f"Regenerating metrics visualisation")
     logger.info(f"Found {len(retrieved_paper_ids)} papers and stored {num_added_ids}")
+    progress.update(papers_found=len(retrieved_paper_ids), papers_added=num_added_ids, cache_hits=cache_hits)
 
-    return redirect(url_for("index"))
+    if cache is not None:
+        cache.evict()
 
 
-@bp.route('/refresh')
-def refresh():
-    """
-    Refresh / regenerate any visualisations
+def run_queued_scrape(progress: JobProgress, config: dict):
     """
+    Queue one item per repository for the workers of the work queue (see worker.py) and
+    follow the items until every repository has been scraped
 
-    res: bool = render_metrics_to_bokeh()
-    logger.info(f"Regenerating metrics visualisation")
-    return redirect(url_for("index"))
-
-
-def load_config() -> dict:
-    with open("config/config.yml", "r") as file:
-        config = yaml.safe_load(file)
-    return config
-
+    A scrape submitted while another is unfinished, by this or any other process, follows
+    the existing items rather than queueing the repositories again. Metrics are recorded
+    by the worker that finishes the last item, see finish_scrape_batch
 
-def extract_paper_ids(content: bytes, include: list[str] | None = None) -> list[str]:
-    # Parse the HTML
-    soup = BeautifulSoup(content, 'html.parser')
-
-    # Find all elements with class "list-identifier"
-    identifier_elements: list[bs4.Tag] = soup.find_all(class_="list-identifier")
-    identifier_text: list[str] = [tag.text for tag in identifier_elements]
-
-    new_ids: list[str] = []
-    cross_list_ids: list[str] = []
-    replaced_ids: list[str] = []
-
-    for id_text in identifier_text:
-        # Extract the ID
-        if id_text:
-            id: str = id_text.split(" ")[0]
-
-            if id:
-                id: str = id.split(":")[-1]
-        else:
-            id: str = ""
-
-        if "cross-list" in id_text:
-            if id:
-                cross_list_ids.append(id)
-        elif "replaced" in id_text:
-            if id:
-                replaced_ids.append(id)
-        else:
-            if id:
-                new_ids.append(id)
+    :param progress: Reporter used to record the state of each repository
+    :param config: Current config
+    """
+    current_time: datetime = datetime.now()
+    arxiv_url: str = config.get("arxiv_url", "https://arxiv.org")
+    payloads: dict[str, dict] = {repository: {"repository": repository,
+                                              "url": f"{arxiv_url}/list/{repository}/new",
+                                              "targets": config.get("targets", []),
+                                              "index_date": current_time.isoformat()}
+                                 for repository in config.get("repositories", [])}
+
+    batch, created = enqueue_batch("scrape", f"scrape-{current_time.isoformat()}", payloads)
+    progress.update(batch=batch)
+    logger.info(f"{'Queued' if created else 'Following unfinished'} scrape batch {batch}")
+
+    wait_seconds: float = config.get("work_queue", {}).get("wait_minutes", DEFAULT_QUEUE_WAIT_MINUTES) * 60
+    deadline: float = time.monotonic() + wait_seconds
+    while True:
+        # End the read transaction, so that the writes of workers in other processes are seen
+        db.session.rollback()
+        items = get_batch(batch)
+
+        states: dict[str, dict] = {item.key: {"status": item.status, "found": (item.result or {}).get("papers_found", 0)}
+                                   for item in items}
+        if states != progress.state.get("repositories"):
+            progress.update(repositories=states)
+
+        if not any(item.status in ACTIVE_STATUSES for item in items):
+            break
+        if time.monotonic() > deadline:
+            logger.warning(f"Stopped following scrape batch {batch} after {wait_seconds / 60:.0f} minutes, "
+                           f"its items remain queued for the workers")
+            return
+        time.sleep(QUEUE_POLL_SECONDS)
+
+    results: list[dict] = [item.result for item in items if item.result]
+    papers_found: int = sum(result["papers_found"] for result in results)
+    papers_added: int = sum(result["papers_added"] for result in results)
+    cache_hits: int = sum(1 for result in results if result["status"] == "unchanged")
+
+    with scrape_phase("render"):
+        render_metrics_to_bokeh()
+    logger.info(f"Workers found {papers_found} papers and stored {papers_added}")
+    progress.update(papers_found=papers_found, papers_added=papers_added, cache_hits=cache_hits)
+
+
+def process_scrape_item(payload: dict) -> dict:
+    """
+    Fetch and store the listing of one repository, run by a worker of the work queue
 
-    # Gather the IDs to be returned
-    ids: list[str] = []
-    if include:
-        if "new" in include:
-            ids.extend(new_ids)
+    :param payload: Repository, URL, targets and index date of the listing
+    :return: Row of the repository_metric table without its index_date, and the number of papers added
+    """
+    config: dict = load_config()
+    cache: HttpCache | None = get_http_cache(config)
+    index_date: datetime = datetime.fromisoformat(payload["index_date"])
 
-        if "cross-list" in include:
-            ids.extend(cross_list_ids)
+    # The rate limit is shared with every other worker
+    results: list[FetchResult] = fetch_all([payload["url"]], get_shared_rate_limiter(config), max_in_flight=1,
+                                           max_retries=config.get("max_retries", 3), cache=cache)
+    page_entries, metric = process_listing(results[0], payload["repository"], payload["targets"])
 
-        if "replaced" in include:
-            ids.extend(replaced_ids)
+    num_added: int = insert_papers(((entry.arxiv_id, index_date) for entry in page_entries), source="scrape")
+    store_paper_text(page_entries)
+    store_categories({(entry.arxiv_id, payload["repository"], entry.listing_type) for entry in page_entries},
+                     index_date.date())
 
-        ids: list[str] = list(set(ids))
+    # The page is skipped as unchanged only once its papers are stored, see run_scrape
+    if cache is not None and metric["status"] == "done":
+        store_response(cache, results[0])
 
-    return ids
+    scrape_papers.inc(len(page_entries), outcome="found")
+    scrape_papers.inc(num_added, outcome="added")
+    return dict(metric, papers_added=num_added)
 
 
-def render_metrics_to_bokeh() -> bool:
+def finish_scrape_batch(connection: Connection, batch: str, items: list[dict]):
     """
-    Read the metrics table and render as a bar chart saved in the instance folder
-    """
-
-    # Sort by index date and return the entire table
-    # TODO Update to newer select method
-    metrics: list[Metric] = Metric.query.order_by(Metric.index_date.asc()).all()
-
-    if not metrics:
-        return False
+    Record the metrics of a queued scrape once its last item has finished
 
-    dates: list[str] = [metric.index_date.strftime("%d/%m/%y %H:%M:%S") for metric in metrics]
-    papers_found: list[int] = [metric.papers_found for metric in metrics]
-    papers_added: list[int] = [metric.papers_added for metric in metrics]
-
-    data: dict = {"dates": dates,
-                  "Found": papers_found,
-                  "Added": papers_added}
+    Papers found are summed over repositories, so a paper listed by several is counted by each
+    """
+    index_date: datetime = datetime.fromisoformat(items[0]["payload"]["index_date"])
+    results: list[dict] = [item["result"] for item in items if item["result"]]
 
-    p = figure(x_range=dates,
-               height=512,
-               max_width=int(512 * 1.4),
-               sizing_mode="scale_width",
-               title="Scraping metrics",
-               toolbar_location=None)
+    connection.execute(sqlite_insert(Metric).values(index_date=index_date,
+                                                    papers_found=sum(result["papers_found"] for result in results),
+                                                    papers_added=sum(result["papers_added"] for result in results),
+                                                    cache_hits=sum(1 for result in results
+                                                                   if result["status"] == "unchanged"))
+                       .on_conflict_do_nothing())
 
-    p.vbar(x="dates", top="Found", width=0.9, line_width=0, source=data, legend_label="Found", color="#718dbf")
-    p.vbar(x="dates", top="Added", width=0.9, line_width=0, source=data, legend_label="Added", color="#FFB4B4")
+    columns: set[str] = {column.name for column in RepositoryMetric.__table__.columns}
+    if results:
+        connection.execute(sqlite_insert(RepositoryMetric).on_conflict_do_nothing(),
+                           [{key: value for key, value in dict(result, index_date=index_date).items() if key in columns}
+                            for result in results])
+    logger.info(f"Recorded the metrics of scrape batch {batch}")
 
-    p.xaxis.major_label_orientation = pi/3
-    p.y_range.start = 0
-    p.x_range.range_padding = 0.1
-    p.xgrid.grid_line_color = None
-    p.axis.minor_tick_line_color = None
-    p.outline_line_color = None
-    p.legend.location = "top_left"
-    p.legend.orientation = "horizontal"
-    p.legend.click_policy = "hide"
 
-    # set output to static HTML file - change these as desired
-    filename = os.path.join(current_app.instance_path, 'unformatted_graph.html')
-    output_file(filename=filename, title="Static HTML file")
-    _ = save(p)
+register_handler("scrape", process_scrape_item, finish_scrape_batch)
 
-    # Load the generated plot, extract the body, place in container
-    parsed_html = BeautifulSoup(Path(filename).read_text(), "html.parser")
-    body = parsed_html.find('body')
 
-    content: list = [str(tag) for tag in body.contents]
-    content.insert(0, '<div class="container" style="display: flex; justify-content: center;">')
-    content.append('</div>')
+def process_listing(result: FetchResult, repository: str, targets: list[str]) -> tuple[list[ListingEntry], dict]:
+    """
+    Extract the entries of a fetched listing and record the outcome of the fetch
 
-    filename = os.path.join(current_app.instance_path, 'formatted_graph.html')
-    _ = Path(filename).write_text(" ".join(content))
+    :param result: Response for the listing of a repository
+    :param repository: Repository of the listing
+    :param targets: Listing types to include
+    :return: Entries of the listing, empty unless it was fetched, changed and extracted, and the
+             row of the repository_metric table without its index_date
+    """
+    page_entries: list[ListingEntry] = []
+    extract_seconds: float = 0.0
+    status: str
+
+    if result.unchanged:
+        # The listing has not changed since it was last processed
+        status = "unchanged"
+    elif result.ok:
+        start_extract: float = time.perf_counter()
+        try:
+            page_entries = extract_listing_entries(result.content, include=targets)
+            status = "done"
+        except Exception as e:
+            # Recorded as a failed fetch, the page is not cached so it is processed again by the next scrape
+            logger.exception(f"Failed to extract entries from {result.url}: {e}")
+            result.error = f"Failed to extract entries: {e}"
+            status = "failed"
+        extract_seconds = time.perf_counter() - start_extract
+        repository_extract_duration.observe(extract_seconds, repository=repository)
+    else:
+        status = "failed"
+        logger.warning(f"Failed to retrieve {result.url}: {result.error or result.status_code}")
+
+    repository_fetches.inc(repository=repository, outcome=status)
+    repository_fetch_duration.observe(result.elapsed, repository=repository)
+    return page_entries, {"repository": repository,
+                          "status": status,
+                          "status_code": result.status_code,
+                          "attempts": result.attempts,
+                          "fetch_seconds": result.elapsed,
+                          "wait_seconds": result.waited,
+                          "extract_seconds": extract_seconds,
+                          "papers_found": len(page_entries)}
+
+
+def get_http_cache(config: dict) -> HttpCache | None:
+    """
+    Cache of listing pages stored in the instance folder, None if disabled in the config
+    """
+    cache_config: dict = config.get("http_cache", {})
+    if not cache_config.get("enabled", True):
+        return None
 
-    return True
+    return HttpCache(os.path.join(current_app.instance_path, "http_cache"),
+                     max_age=cache_config.get("max_age_hours", 48) * 3600,
+                     max_bytes=cache_config.get("max_size_mb", 256) * 1024 * 1024)
@@ -0,0 +1,159 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import re
+from itertools import islice
+from typing import Iterable
+
+from sqlalchemy import Connection, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from db import db, FTS_TABLE, PaperText
+from engine import write
+from listing import ListingEntry
+from response_cache import cached_response, expire_data_version
+from stats import record_change
+
+from flask import Blueprint, jsonify, request
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("search", __name__)
+
+# Results per page, unless requested otherwise
+DEFAULT_LIMIT: int = 20
+MAX_LIMIT: int = 100
+
+# Weights of the title, authors and subjects columns when ranking
+RANK_WEIGHTS: tuple[float, float, float] = (10.0, 5.0, 1.0)
+
+# Rows written per transaction
+CHUNK_SIZE: int = 1_000
+
+# Words of a query, optionally followed by * to match prefixes
+_TERM = re.compile(r"\w+\*?")
+
+_SEARCH_SQL = text(f"""
+    SELECT paper_text.arxiv_id, paper_text.title, paper_text.authors, paper_text.subjects, paper.index_date,
+           bm25({FTS_TABLE}, {", ".join(map(str, RANK_WEIGHTS))}) AS rank
+    FROM {FTS_TABLE}
+    JOIN paper_text ON paper_text.id = {FTS_TABLE}.rowid
+    JOIN paper ON paper.arxiv_id = paper_text.arxiv_id
+    WHERE {FTS_TABLE} MATCH :query
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def search_key() -> tuple | None:
+    """
+    :return: Parameters of a search that identify its response, None if limit or offset is not
+             an integer, as the search then fails and errors are not cached
+    """
+    try:
+        limit: int = int(request.args.get("limit", DEFAULT_LIMIT))
+        offset: int = int(request.args.get("offset", 0))
+    except ValueError:
+        return None
+    return request.args.get("q", ""), limit, offset
+
+
+@bp.route("/search", methods=["GET"])
+@cached_response(search_key)
+def search():
+    """
+    Endpoint that returns the papers whose title, authors or subjects contain every word of q,
+    best matches first
+
+    Takes limit (at most 100) and offset, the response includes the offset of the next page,
+    null on the last page
+    """
+    query: str | None = build_match_query(request.args.get("q", ""))
+    if query is None:
+        return jsonify({"error": "q must contain at least one word"}), 400
+
+    try:
+        limit: int = min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        offset: int = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({"error": "limit must be positive and offset must not be negative"}), 400
+
+    # One extra row shows whether there is another page
+    try:
+        rows = db.session.execute(_SEARCH_SQL, {"query": query, "limit": limit + 1, "offset": offset}).all()
+    except OperationalError as e:
+        logger.error(f"Search for {query!r} failed: {e}")
+        return jsonify({"error": "Search is unavailable"}), 503
+
+    results: list[dict] = [{"arxiv_id": row.arxiv_id,
+                            "title": row.title,
+                            "authors": row.authors.split(", ") if row.authors else [],
+                            "subjects": row.subjects.split("; ") if row.subjects else [],
+                            "index_date": str(row.index_date),
+                            "score": round(-row.rank, 4)}
+                           for row in rows[:limit]]
+    next_offset: int | None = offset + limit if len(rows) > limit else None
+
+    return jsonify({"query": request.args.get("q"), "results": results, "next_offset": next_offset}), 200
+
+
+def build_match_query(q: str) -> str | None:
+    """
+    Turn free text into an FTS5 query matching every word, so that operators and
+    punctuation in the input are searched for rather than interpreted
+
+    :param q: Text entered by the user, words ending in * match as prefixes
+    :return: FTS5 query, None if the text has no words
+    """
+    terms: list[str] = []
+    for term in _TERM.findall(q):
+        prefix: bool = term.endswith("*")
+        terms.append(f'"{term.rstrip("*")}"' + ("*" if prefix else ""))
+
+    return " ".join(terms) if terms else None
+
+
+def store_paper_text(entries: Iterable[ListingEntry]) -> int:
+    """
+    Store the fields of listing entries, replacing those that have changed, e.g. the
+    title of a replaced paper. The papers must already be stored
+
+    :param entries: Entries extracted from listing pages
+    :return: Number of entries written
+    """
+    rows: Iterable[dict] = ({"arxiv_id": entry.arxiv_id,
+                             "title": entry.title,
+                             "authors": ", ".join(entry.authors),
+                             "subjects": "; ".join(entry.subjects)}
+                            for entry in entries)
+
+    num_written: int = 0
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        num_written += write(_upsert_chunk, chunk)
+
+    if num_written:
+        expire_data_version()
+    return num_written
+
+
+def _upsert_chunk(connection: Connection, rows: list[dict]) -> int:
+    # Unchanged rows are left alone, so the index is only rewritten for entries that changed
+    stmt = sqlite_insert(PaperText.__table__)
+    changed = ((PaperText.title != stmt.excluded.title)
+               | (PaperText.authors != stmt.excluded.authors)
+               | (PaperText.subjects != stmt.excluded.subjects))
+    stmt = stmt.on_conflict_do_update(index_elements=["arxiv_id"],
+                                      set_={"title": stmt.excluded.title,
+                                            "authors": stmt.excluded.authors,
+                                            "subjects": stmt.excluded.subjects},
+                                      where=changed)
+
+    result = connection.execute(stmt, rows)
+    num_written: int = max(result.rowcount, 0)
+    if num_written:
+        record_change(connection)
+    return num_written
@@ -0,0 +1,262 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging, LOG_FORMATS
+import os
+import re
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Located relative to this file so that it does not depend on the working directory
+CONFIG_PATH: Path = Path(__file__).resolve().parent / "config" / "config.yml"
+
+# Listings that can be scraped, and the pattern of an arXiv category such as cs.LG or hep-th
+TARGETS: tuple[str, ...] = ("new", "cross-list", "replaced")
+REPOSITORY_PATTERN = re.compile(r"^[a-z\-]+(\.[A-Za-z\-]+)?$")
+
+# arXiv asks for at least 3 seconds between requests
+MIN_SECONDS_PER_REQUEST: float = 3
+
+
+class ConfigError(ValueError):
+    """
+    Raised when the config file does not match the schema
+    """
+
+
+def _positive(value) -> bool:
+    return value > 0
+
+
+def _non_negative(value) -> bool:
+    return value >= 0
+
+
+# Type, default and an optional check of each top-level key, None as the default marks it as required
+SCHEMA: dict[str, tuple[type | tuple[type, ...], Any, Callable[[Any], bool] | None]] = {
+    "arxiv_url": (str, "https://arxiv.org", None),
+    "seconds_per_request": ((int, float), 4, lambda value: value >= MIN_SECONDS_PER_REQUEST),
+    "max_in_flight": (int, 4, _positive),
+    "max_retries": (int, 3, _non_negative),
+    "http_cache": (dict, {}, None),
+    "scrape_interval_minutes": (int, 0, _non_negative),
+    "logging": (dict, {}, None),
+    "enrich": (dict, {}, None),
+    "backfill": (dict, {}, None),
+    "work_queue": (dict, {}, None),
+    "response_cache": (dict, {}, None),
+    "targets": (list, None, lambda value: all(target in TARGETS for target in value)),
+    "repositories": (list, None, lambda value: all(isinstance(repository, str) and REPOSITORY_PATTERN.match(repository)
+                                                   for repository in value)),
+}
+
+
+def _log_level(value) -> bool:
+    return isinstance(value, int) or isinstance(logging.getLevelName(value.upper()), int)
+
+
+def _log_levels(value) -> bool:
+    return all(isinstance(name, str) and isinstance(level, (str, int)) and not isinstance(level, bool)
+               and _log_level(level) for name, level in value.items())
+
+
+# Type and an optional check of each key of a section, every key is optional as defaults are applied where
+# the section is read. Keys that are not listed are rejected, so that a misspelt key is not silently ignored
+SECTIONS: dict[str, dict[str, tuple[type | tuple[type, ...], Callable[[Any], bool] | None]]] = {
+    "http_cache": {
+        "enabled": (bool, None),
+        "max_age_hours": ((int, float), _positive),
+        "max_size_mb": ((int, float), _positive),
+    },
+    "logging": {
+        "level": ((str, int), _log_level),
+        "levels": (dict, _log_levels),
+        "format": (str, lambda value: value in LOG_FORMATS),
+    },
+    "enrich": {
+        "api_url": (str, None),
+        "batch_size": (int, _positive),
+        "max_in_flight": (int, _positive),
+        "max_batches": (int, _non_negative),
+    },
+    "backfill": {
+        "page_size": (int, _positive),
+    },
+    "work_queue": {
+        "enabled": (bool, None),
+        "lease_seconds": (int, _positive),
+        "heartbeat_seconds": (int, _positive),
+        "max_attempts": (int, _positive),
+        "wait_minutes": ((int, float), _non_negative),
+    },
+    "response_cache": {
+        "enabled": (bool, None),
+        "max_entries": (int, _positive),
+        "max_size_mb": ((int, float), _positive),
+        "max_age_seconds": (int, _non_negative),
+        "version_ttl_seconds": ((int, float), _non_negative),
+    },
+}
+
+
+def validate_config(config: Any) -> dict:
+    """
+    Check a parsed config against the schema, filling in defaults
+
+    :param config: Parsed config file
+    :return: Validated config
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("Config must be a mapping")
+
+    errors: list[str] = []
+    validated: dict = dict(config)
+
+    for key, (expected, default, check) in SCHEMA.items():
+        if key not in config or config[key] is None:
+            if default is None:
+                errors.append(f"{key} is required")
+            else:
+                validated[key] = default
+            continue
+
+        value = config[key]
+        if isinstance(value, bool) or not isinstance(value, expected):
+            errors.append(f"{key} has the wrong type ({type(value).__name__})")
+        elif check is not None and not check(value):
+            errors.append(f"{key} has an invalid value ({value!r})")
+        elif key in SECTIONS:
+            validated[key] = _validate_section(key, value, errors)
+
+    if errors:
+        raise ConfigError(", ".join(errors))
+
+    return validated
+
+
+def _validate_section(name: str, section: dict, errors: list[str]) -> dict:
+    """
+    Check the keys of a section against SECTIONS, adding any problems to errors
+
+    :return: Section without the keys left empty, which take their defaults
+    """
+    validated: dict = {}
+    for key, value in section.items():
+        if key not in SECTIONS[name]:
+            errors.append(f"{name}.{key} is not a known key, expected one of {', '.join(SECTIONS[name])}")
+            continue
+        if value is None:
+            continue
+
+        expected, check = SECTIONS[name][key]
+        if isinstance(value, bool) != (expected is bool) or not isinstance(value, expected):
+            errors.append(f"{name}.{key} has the wrong type ({type(value).__name__})")
+        elif check is not None and not check(value):
+            errors.append(f"{name}.{key} has an invalid value ({value!r})")
+        else:
+            validated[key] = value
+
+    return validated
+
+
+class ConfigService:
+    """
+    Parsed and validated config, cached until the file changes or a reload is requested
+
+    The modification time of the file is checked at most once per check_interval,
+    an invalid file is logged and the last valid config is kept
+    """
+
+    def __init__(self, path: str | Path = CONFIG_PATH, check_interval: float = 1.0):
+        """
+        :param path: Location of the YAML config file
+        :param check_interval: Seconds between checks of the modification time
+        """
+        self.path: Path = Path(path)
+        self.check_interval: float = check_interval
+        self._config: dict | None = None
+        self._mtime: float | None = None
+        self._checked: float = 0.0
+        self._reload_requested: bool = False
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        """
+        :return: Current config, which must not be modified
+        """
+        now: float = time.monotonic()
+        if self._config is not None and not self._reload_requested and now - self._checked < self.check_interval:
+            return self._config
+
+        with self._lock:
+            self._checked = now
+            try:
+                mtime: float = os.stat(self.path).st_mtime
+            except OSError as e:
+                if self._config is None:
+                    raise
+                logger.error(f"Config {self.path} is unavailable, keeping the previous config: {e}")
+                return self._config
+
+            if self._config is None or self._reload_requested or mtime != self._mtime:
+                self._reload_requested = False
+                self._load(mtime)
+
+            return self._config
+
+    def reload(self) -> dict:
+        """
+        Parse the file again, regardless of its modification time
+        """
+        self._reload_requested = True
+        return self.get()
+
+    def request_reload(self):
+        """
+        Reload on the next access, safe to call from a signal handler
+        """
+        self._reload_requested = True
+
+    def _load(self, mtime: float):
+        try:
+            with open(self.path, "r") as file:
+                config: dict = validate_config(yaml.safe_load(file))
+        except (OSError, yaml.YAMLError, ConfigError) as e:
+            # Without a valid config there is nothing to fall back on
+            if self._config is None:
+                raise
+            logger.error(f"Ignoring invalid config {self.path}, keeping the previous config: {e}")
+        else:
+            self._config = config
+            logger.info(f"Loaded config from {self.path}")
+
+        self._mtime = mtime
+
+
+def install_reload_signal(service: ConfigService):
+    """
+    Reload the config on SIGHUP, where supported and when called from the main thread
+    """
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return
+
+    signal.signal(signal.SIGHUP, lambda signum, frame: service.request_reload())
+
+
+config_service = ConfigService()
+
+
+def load_config() -> dict:
+    """
+    :return: Current config, see ConfigService
+    """
+    return config_service.get()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+
+from sqlalchemy import Connection, select, update
+from db import db, Stat
+
+from flask import Blueprint, jsonify
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("stats", __name__)
+
+# Number of rows in the paper table
+PAPER_COUNT: str = "paper_count"
+
+# Last sequence number given to a stored paper, see reserve_ingest_seq
+INGEST_SEQ: str = "ingest_seq"
+
+# Incremented whenever papers are added or their text changes, so that anything derived from them can be cached
+DATA_VERSION: str = "data_version"
+
+
+def get_stats() -> dict[str, int]:
+    """
+    Read the maintained counters, a primary key lookup rather than a scan of the tables they describe
+    """
+    rows = db.session.execute(select(Stat.key, Stat.value))
+    return {key: value for key, value in rows}
+
+
+def get_paper_count() -> int:
+    return get_stats().get(PAPER_COUNT, 0)
+
+
+def get_data_version() -> int:
+    return get_stats().get(DATA_VERSION, 0)
+
+
+def record_ingest(connection: Connection, num_added: int):
+    """
+    Update the counters within the transaction that added the papers
+
+    :param connection: Connection of the ingest transaction
+    :param num_added: Number of papers that were stored
+    """
+    if num_added <= 0:
+        return
+
+    connection.execute(update(Stat).where(Stat.key == PAPER_COUNT).values(value=Stat.value + num_added))
+    record_change(connection)
+
+
+def reserve_ingest_seq(connection: Connection, count: int) -> int:
+    """
+    Reserve consecutive sequence numbers for papers about to be stored. Numbers are reserved
+    within the write transaction, so papers become visible in the order of their numbers
+
+    :param connection: Connection of the ingest transaction
+    :param count: Number of papers
+    :return: First of the numbers reserved
+    """
+    last: int = connection.execute(update(Stat).where(Stat.key == INGEST_SEQ)
+                                   .values(value=Stat.value + count)
+                                   .returning(Stat.value)).scalar()
+    return last - count + 1
+
+
+def record_change(connection: Connection):
+    """
+    Increment the data version within a transaction that changed stored papers
+
+    :param connection: Connection of the write transaction
+    """
+    connection.execute(update(Stat).where(Stat.key == DATA_VERSION).values(value=Stat.value + 1))
+
+
+@bp.route("/stats/summary", methods=["GET"])
+def get_summary():
+    """
+    Endpoint that returns the maintained counters
+    """
+    return jsonify(get_stats()), 200
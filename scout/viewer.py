@@ -3,23 +3,32 @@ from utils.default_logging import configure_default_logging
 from datetime import datetime, timedelta
 import os
 import io
+import base64
+import binascii
+import json
+import shutil
+import tempfile
+import zipfile
+from typing import IO, Callable, Iterator
 from utils.typing import PythonScalar
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import or_, select
 from db import db, Paper, Metric
+from ingest import insert_papers
+from jobs import job_queue, track_job
+from charts import chart_resources, chart_version, get_metrics_chart, is_chart_stale, run_refresh
+from stats import DATA_VERSION, PAPER_COUNT, get_stats
+from utils.cache import VersionedValue
+from export import EXPORT_FORMATS, iter_paper_batches, stream_papers
+from response_cache import cached_response
 import yaml
 from pathlib import Path
 
-import pandas as pd
-
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for, current_app, jsonify, send_file
+    Blueprint, flash, g, redirect, render_template, request, url_for, current_app, jsonify, send_file,
+    Response, stream_with_context
 )
 
-from bokeh.resources import CDN
-
 from werkzeug.exceptions import abort
 from werkzeug.utils import secure_filename
 
@@ -31,53 +40,105 @@ logger.info(f"Logging initialised from {__name__}")
 
 bp = Blueprint("viewer", __name__)
 
+# Compression of an uploaded file, inferred from its extension
+UPLOAD_COMPRESSION: dict[str, str | None] = {".csv": None, ".gz": "gzip", ".zip": "zip"}
+
+# Uploads are parsed and stored this many rows at a time
+UPLOAD_CHUNK_ROWS: int = 50_000
+UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+
+# Rendered content of the index page, versioned by the data and chart it shows
+index_cache: VersionedValue[str] = VersionedValue("")
+
+# Largest page of IDs returned by a single request to /papers
+PAPERS_MAX_LIMIT: int = 10_000
+
+# Papers per page of /papers/changes, unless requested otherwise
+CHANGES_DEFAULT_LIMIT: int = 1_000
+
 
 @bp.route('/')
 def index():
-    num_papers: int = Paper.query.count()
-    current_time: str = datetime.today().strftime('%a %d %b %Y, %I:%M%p')
+    # Charts are rendered by a background job whenever new metrics are available
+    if is_chart_stale():
+        job_queue.submit("refresh", run_refresh)
 
-    # If a graph is available, render it
-    filename: str = os.path.join(current_app.instance_path, "formatted_graph.html")
-    if os.path.exists(filename):
-        graph_data: str = Path(filename).read_text()
+    # The page content only changes when papers are added or the chart is rendered
+    stats: dict[str, int] = get_stats()
+    version: tuple = (stats.get(DATA_VERSION, 0), chart_version())
+    cached_version, content = index_cache.get()
 
-        if CDN.js_files:
-            cdn_js: str = CDN.js_files[0]
-        else:
-            cdn_js: str = ""
+    if cached_version != version or not content:
+        content: str = render_index_content()
+        index_cache.set(version, content)
 
-        if CDN.css_files:
-            cdn_css: str = CDN.css_files[0]
-        else:
-            cdn_css: str = ""
+    # The time and count are rendered on every request, outside the cached content
+    return render_template("index.html",
+                           content=content,
+                           current_time=datetime.today().strftime('%a %d %b %Y, %I:%M%p'),
+                           num_papers=f"{stats.get(PAPER_COUNT, 0):,}")
+
+
+def render_index_content() -> str:
+    """
+    Render the chart and actions of the index page, which are cached until the data changes
+    """
+    # If a graph is available, render it
+    graph_data: str = get_metrics_chart()
+    if graph_data:
+        cdn_js, cdn_css = chart_resources()
     else:
-        graph_data: str = ""
         cdn_js: str = ""
         cdn_css: str = ""
 
-    return render_template("index.html",
-                           current_time=current_time,
-                           num_papers=f"{num_papers:,}",
+    return render_template("index_content.html",
                            graph_data=graph_data,
                            cdn_js=cdn_js,
                            cdn_css=cdn_css)
 
 
+def papers_key() -> tuple | None:
+    """
+    :return: Parameters of a request for papers that identify its response, None if a date
+             defaults to the current time or the response is streamed
+    """
+    try:
+        start_date: datetime = datetime.strptime(request.args.get("start_date", ""), "%d-%m-%Y")
+        end_date: datetime = datetime.strptime(request.args.get("end_date", ""), "%d-%m-%Y")
+    except ValueError:
+        return None
+
+    if request.args.get("format", "json") != "json":
+        return None
+
+    return (start_date.isoformat(), end_date.isoformat(), request.args.get("limit", type=int),
+            request.args.get("after"))
+
+
 @bp.route('/papers', methods=['GET'])
+@cached_response(papers_key)
 def get_papers():
     """
     Endpoint used to return arXiv IDs from the database
 
-    Note that the result is [start_date, end_date)
+    Note that the result is [start_date, end_date]
+
+    By default a JSON array of IDs sorted by ID is returned. Larger ranges can be
+    retrieved in date order, either a page at a time by passing a limit (and the
+    cursor returned as next), or as a streamed JSON array or NDJSON with format
 
     Example usage
     papers?start_date=01-01-2023&end_date=01-06-2023
+    papers?start_date=01-01-2023&end_date=01-06-2023&limit=1000&after=<next>
+    papers?start_date=01-01-2023&end_date=01-06-2023&format=ndjson
     """
 
     # Get query parameters (defaults to None if not in dict)
     start_date: str | None = request.args.get("start_date")
     end_date: str | None = request.args.get("end_date")
+    limit: int | None = request.args.get("limit", type=int)
+    after: str | None = request.args.get("after")
+    response_format: str = request.args.get("format", "json")
 
     # If no start date is supplied, default to yesterday, else convert to a datetime object
     if not start_date:
@@ -100,109 +161,312 @@ def get_papers():
             logger.error(e)
             return jsonify([]), 500
 
+    # Stream the whole range in date order
+    if response_format in ("stream", "ndjson"):
+        batches = iter_paper_batches(start_date, end_date)
+        if response_format == "ndjson":
+            return Response(stream_with_context(_ndjson_ids(batches)), mimetype="application/x-ndjson")
+        return Response(stream_with_context(_json_array_ids(batches)), mimetype="application/json")
+
+    if response_format != "json":
+        return jsonify({"error": "Unsupported format, expected one of json, stream, ndjson"}), 400
+
     # Using the start and end date, select the relevant IDs from the database
-    Session = sessionmaker(bind=db.engine)
-    session = Session()
-    stmt = select(Paper.arxiv_id).where(Paper.index_date >= start_date, Paper.index_date <= end_date)
-    ids: list[str] = sorted([row[0] for row in session.execute(stmt)])
-    session.close()
+    if limit is None and after is None:
+        stmt = (select(Paper.arxiv_id)
+                .where(Paper.index_date >= start_date, Paper.index_date <= end_date)
+                .order_by(Paper.arxiv_id))
+        ids: list[str] = list(db.session.execute(stmt).scalars())
+        return jsonify(ids), 200
+
+    # Otherwise return a single page, continuing from the cursor
+    limit: int = min(max(limit or PAPERS_MAX_LIMIT, 1), PAPERS_MAX_LIMIT)
+    stmt = (select(Paper.arxiv_id, Paper.index_date)
+            .where(Paper.index_date >= start_date, Paper.index_date <= end_date)
+            .order_by(Paper.index_date, Paper.arxiv_id)
+            .limit(limit))
+
+    if after:
+        try:
+            after_date, after_id = decode_cursor(after)
+        except ValueError as e:
+            logger.error(e)
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        # The first condition bounds the index range scan, the second skips ties on the date
+        stmt = stmt.where(Paper.index_date >= after_date,
+                          or_(Paper.index_date > after_date, Paper.arxiv_id > after_id))
+
+    rows: list = list(db.session.execute(stmt))
+    next_cursor: str | None = encode_cursor(rows[-1].index_date, rows[-1].arxiv_id) if len(rows) == limit else None
+
+    return jsonify({"ids": [row.arxiv_id for row in rows], "next": next_cursor}), 200
+
+
+def changes_key() -> tuple:
+    """
+    :return: Parameters of a request for changes that identify its response, errors are not cached
+    """
+    return request.args.get("since", ""), request.args.get("limit", CHANGES_DEFAULT_LIMIT, type=int)
+
+
+@bp.route("/papers/changes", methods=["GET"])
+@cached_response(changes_key)
+def get_paper_changes():
+    """
+    Endpoint used to follow the papers stored since an earlier request, in the order they
+    were stored whatever their index dates
+
+    The response includes the papers stored after since, a page at a time, and the cursor
+    to pass as since on the next request. The cursor is returned even when there are no
+    new papers, so a consumer keeps the last cursor and polls with it, more is true while
+    further pages are available straight away. Omit since to start from the first paper
 
-    return jsonify(ids), 200
+    Example usage
+    papers/changes?limit=1000
+    papers/changes?since=<next>
+    """
+    since: str = request.args.get("since", "")
+    limit: int | None = request.args.get("limit", CHANGES_DEFAULT_LIMIT, type=int)
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    try:
+        since_seq: int = int(since) if since else 0
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    # One extra row shows whether there is another page
+    limit = min(limit, PAPERS_MAX_LIMIT)
+    stmt = (select(Paper.arxiv_id, Paper.index_date, Paper.ingest_seq)
+            .where(Paper.ingest_seq > since_seq)
+            .order_by(Paper.ingest_seq)
+            .limit(limit + 1))
+    rows: list = list(db.session.execute(stmt))
+    more: bool = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({"papers": [{"arxiv_id": row.arxiv_id, "index_date": row.index_date.isoformat()} for row in rows],
+                    "next": str(rows[-1].ingest_seq) if rows else str(since_seq),
+                    "more": more}), 200
+
+
+def encode_cursor(index_date: datetime, arxiv_id: str) -> str:
+    """
+    Opaque pagination cursor pointing at the last row of a page
+    """
+    value: str = f"{index_date.isoformat()}|{arxiv_id}"
+    return base64.urlsafe_b64encode(value.encode("utf8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Inverse of encode_cursor, raises ValueError if the cursor is malformed
+    """
+    try:
+        value: str = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf8")
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Malformed cursor {cursor}") from e
+
+    index_date, _, arxiv_id = value.partition("|")
+    if not arxiv_id:
+        raise ValueError(f"Malformed cursor {cursor}")
+
+    return datetime.fromisoformat(index_date), arxiv_id
+
+
+def _json_array_ids(batches) -> Iterator[str]:
+    yield "["
+    separator: str = ""
+    for batch in batches:
+        if batch:
+            yield separator + ",".join(json.dumps(arxiv_id) for arxiv_id, _ in batch)
+            separator = ","
+    yield "]"
+
+
+def _ndjson_ids(batches) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(json.dumps(arxiv_id) + "\n" for arxiv_id, _ in batch)
 
 
 @bp.route("/upload", methods=["GET", "POST"])
 def upload_papers():
     """
     Endpoint that handles the uploading of a CSV file of entries to be added to the paper database
+
+    Files may be plain, gzip or zip compressed CSVs and are read in chunks, so their size is
+    not limited by memory. They can be sent from the upload page as a form, or by API clients
+    as the raw request body, in which case the response is JSON
+
+    Example usage
+    curl --data-binary @papers.csv.gz "upload?filename=papers.csv.gz"
     """
     # Handle the file upload
     if request.method == "POST":
-        if "file" not in request.files:
-            flash("Failed to handle file, not found")
-            return redirect(url_for("index"))
+        if request.mimetype == "multipart/form-data":
+            if "file" not in request.files:
+                flash("Failed to handle file, not found")
+                return redirect(url_for("index"))
+
+            # Check that the file exists
+            file = request.files['file']
+            if not file:
+                flash("Failed to handle file, not valid")
+                return redirect(url_for("index"))
 
-        # Check that the file exists
-        file = request.files['file']
-        if not file:
-            flash("Failed to handle file, not valid")
-            return redirect(url_for("index"))
+            # Check for an empty filename
+            if file.filename == "":
+                flash("Failed to handle file, empty filename")
+                return redirect(url_for("index"))
 
-        # Check for an empty filename
-        if file.filename == "":
-            flash("Failed to handle file, empty filename")
-            return redirect(url_for("index"))
+            stream: IO[bytes] = file.stream
+            filename: str = file.filename
+            raw: bool = False
+        else:
+            # The request body is the file itself and is never buffered as a form
+            stream: IO[bytes] = request.stream
+            filename: str = request.args.get("filename", "upload.csv")
+            raw: bool = True
 
         # Check file valid file type
-        filename, file_extension = os.path.splitext(file.filename)
-        if file_extension != ".csv":
-            flash("Failed to handle file, not a CSV")
-            return redirect(url_for("index"))
+        _, file_extension = os.path.splitext(filename.lower())
+        if file_extension not in UPLOAD_COMPRESSION:
+            return _upload_response("Failed to handle file, not a CSV", raw, 400)
+
+        # Zip archives are read from their end, so the stream must be seekable
+        compression: str | None = UPLOAD_COMPRESSION[file_extension]
+        if compression == "zip" and not stream.seekable():
+            spooled = tempfile.TemporaryFile()
+            shutil.copyfileobj(stream, spooled, UPLOAD_CHUNK_BYTES)
+            spooled.seek(0)
+            stream = spooled
 
         # Sanitize the filename for logging
-        filename: str = secure_filename(file.filename)
+        filename: str = secure_filename(filename)
         logger.info(f"Handling upload of {filename}")
 
-        # Use Pandas to read the file stream
-        df: pd.DataFrame = pd.read_csv(file.stream, dtype={"Id": str, "Date": str})
+        num_rows: int = 0
+        num_skipped: int = 0
 
-        # Ensure that the correct columns exist
-        necessary_columns: list[str] = ["Id", "Date"]
-        for col in necessary_columns:
-            if col not in df.columns:
-                flash("Failed to handle file, incorrect columns")
-                return redirect(url_for("index"))
+        def skip(rows: int):
+            nonlocal num_skipped
+            num_skipped += rows
+            progress.update(skipped=num_skipped)
 
-        # Additional columns can be ignored
-        df = df[necessary_columns]
+        def report(rows: int, added: int):
+            nonlocal num_rows
+            num_rows = rows
+            progress.update(rows=rows, added=added)
+            logger.info(f"Upload of {filename}: processed {rows:,} rows and stored {added:,}")
 
-        # Covert column to datetime object
-        df["Date"] = pd.to_datetime(df["Date"])
-
-        # De-dupe and store in the database
-        retrieved_paper_ids: list[str] = df["Id"].unique().tolist()
-        num_added_ids: int = len(retrieved_paper_ids)
+        try:
+            with track_job("upload") as progress:
+                progress.update(filename=filename)
+                num_added_ids: int = insert_papers(_read_paper_chunks(stream, compression, on_skip=skip),
+                                                   chunk_size=UPLOAD_CHUNK_ROWS,
+                                                   source="upload",
+                                                   on_chunk=report)
+        except (ValueError, OSError, zipfile.BadZipFile) as e:
+            # Chunks that were read before the failure remain stored
+            logger.error(f"Failed to handle upload of {filename}: {e}")
+            return _upload_response(f"Failed to handle file after {num_rows:,} rows, {e}", raw, 400)
+
+        # Message to be displayed on the index page, rows may repeat an ID so both counts are reported
+        logger.info(f"Manually added {num_rows} rows and stored {num_added_ids} new papers, "
+                    f"skipped {num_skipped} rows missing an Id or Date")
+        message: str = f"Read {num_rows:,} rows and stored {num_added_ids:,} new papers"
+        if num_skipped:
+            message += f", skipped {num_skipped:,} rows missing an Id or Date"
+        return _upload_response(message, raw, 200,
+                                rows=num_rows, skipped=num_skipped, added=num_added_ids, job_id=progress.job_id)
 
-        # Start the session
-        Session = sessionmaker(bind=db.engine)
-        session = Session()
+    return render_template("upload_csv.html")
 
-        # Write all IDs to the database
-        for index, row in df.iterrows():
-            arxiv_id = row["Id"]
-            date = row["Date"]
-            try:
-                paper = Paper(arxiv_id=arxiv_id, index_date=date)
-                session.add(paper)
-                session.commit()
-            except IntegrityError as e:
-                # If the item exists, can ignore, don't log
-                session.rollback()
-                num_added_ids = num_added_ids - 1
 
-        session.close()
+def _read_paper_chunks(stream: IO[bytes], compression: str | None,
+                       on_skip: Callable[[int], None] | None = None) -> Iterator[tuple[str, datetime]]:
+    """
+    Read pairs of arXiv ID and date from a CSV stream, one chunk of rows at a time
 
-        # Message to be displayed on the index page
-        logger.info(f"Manually added {len(retrieved_paper_ids)} papers and stored {num_added_ids}")
-        flash(f"Uploaded {len(retrieved_paper_ids):,} papers and stored {num_added_ids:,}")
-        return redirect(url_for("index"))
+    :param stream: Binary stream of the (possibly compressed) CSV
+    :param compression: Compression understood by Pandas, or None
+    :param on_skip: Optional callback invoked with the number of rows of a chunk skipped for a missing field
+    :return: Iterator of arXiv ID and date pairs
+    """
+    # Imported here, as only uploads need pandas
+    import pandas as pd
+
+    # Ensure that the correct columns exist, additional columns can be ignored
+    necessary_columns: list[str] = ["Id", "Date"]
+    reader = pd.read_csv(stream,
+                         compression=compression,
+                         usecols=necessary_columns,
+                         dtype={"Id": str, "Date": str},
+                         chunksize=UPLOAD_CHUNK_ROWS)
+
+    with reader:
+        for chunk in reader:
+            # Rows without both fields cannot be stored, they are counted rather than dropped silently
+            num_read: int = len(chunk)
+            chunk = chunk.dropna()
+            if on_skip is not None and len(chunk) < num_read:
+                on_skip(num_read - len(chunk))
+
+            # Covert column to datetime objects, one vectorised call per chunk
+            dates = pd.to_datetime(chunk["Date"])
+            yield from zip(chunk["Id"], dates.dt.to_pydatetime())
+
+
+def _upload_response(message: str, raw: bool, status: int, **values):
+    """
+    Report the outcome of an upload, as JSON for API clients or as a message on the index page
+    """
+    if raw:
+        return jsonify({"message": message, **values}), status
 
-    return render_template("upload_csv.html")
+    flash(message)
+    return redirect(url_for("index"))
 
 
 @bp.route("/export", methods=["GET"])
 def export_papers():
     """
-    Endpoint that handles exporting of the entire paper database to a CSV file
+    Endpoint that handles exporting of the paper database to a file
+
+    Rows are streamed from the database to the response in batches, so memory use does not
+    depend on the size of the table. Dates are optional and inclusive
+
+    Example usage
+    export?format=csv.gz&start_date=01-01-2023&end_date=01-06-2023
     """
+    export_format: str = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    _, mimetype, extension, available = EXPORT_FORMATS[export_format]
+    if not available():
+        return jsonify({"error": f"Export to {export_format} is not available on this server"}), 400
 
-    # Read all papers from the database
-    data: list = Paper.query.all()
-    logger.info(f"Handling export of papers")
-    data: list[dict] = [{"Id": entry.arxiv_id, "Date": entry.index_date} for entry in data]
-    logger.info(f"Exported {len(data)} papers")
+    try:
+        start_date: datetime | None = _parse_date_arg("start_date")
+        end_date: datetime | None = _parse_date_arg("end_date")
+    except ValueError as e:
+        logger.error(e)
+        return jsonify({"error": str(e)}), 400
+
+    logger.info(f"Handling export of papers to {export_format}")
+    return Response(stream_with_context(stream_papers(export_format, start_date, end_date)),
+                    mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=exported_papers.{extension}"})
+
+
+def _parse_date_arg(name: str) -> datetime | None:
+    """
+    Convert an optional query parameter of the form dd-mm-yyyy to a datetime object
+    """
+    value: str | None = request.args.get(name)
+    if not value:
+        return None
 
-    # Use Pandas to convert to CSV
-    df = pd.DataFrame(data)
-    return send_file(io.BytesIO(df.to_csv(index=False).encode("utf8")),
-                     download_name="exported_papers.csv",
-                     as_attachment=True)
+    return datetime.strptime(value, "%d-%m-%Y")
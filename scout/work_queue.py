@@ -0,0 +1,321 @@
+from __future__ import annotations
+from utils.default_logging import configure_default_logging
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import Connection, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import db, RateLimit, WorkItem
+from engine import write
+from fetcher import TokenBucket, get_rate_limiter
+
+from flask import Blueprint, jsonify, request
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+bp = Blueprint("work", __name__)
+
+# Lifecycle of an item, leased items return to the queue when their lease expires
+ITEM_QUEUED: str = "queued"
+ITEM_LEASED: str = "leased"
+ITEM_DONE: str = "done"
+ITEM_FAILED: str = "failed"
+ACTIVE_STATUSES: tuple[str, ...] = (ITEM_QUEUED, ITEM_LEASED)
+
+# Defaults of the work_queue section of the config
+DEFAULT_LEASE_SECONDS: int = 120
+DEFAULT_HEARTBEAT_SECONDS: int = 30
+DEFAULT_MAX_ATTEMPTS: int = 3
+
+# Name of the limit on requests to arXiv
+ARXIV_RATE_LIMIT: str = "arxiv"
+
+
+@dataclass
+class WorkHandler:
+    """
+    Processing of one kind of item
+
+    process is called by a worker with the payload of an item and returns its result.
+    on_batch_done is called within the transaction that finishes the last item of a
+    batch, with every item of the batch
+    """
+    process: Callable[[dict], dict]
+    on_batch_done: Callable[[Connection, str, list[dict]], None] | None = None
+
+
+# Kinds of item that workers can process, registered by the modules that define them
+HANDLERS: dict[str, WorkHandler] = {}
+
+
+def register_handler(kind: str, process: Callable[[dict], dict],
+                     on_batch_done: Callable[[Connection, str, list[dict]], None] | None = None):
+    """
+    :param kind: Kind of item, e.g. scrape
+    :param process: Callable invoked as process(payload) by a worker, returning the JSON serialisable result
+    :param on_batch_done: Optional callable invoked as on_batch_done(connection, batch, items) once a batch finishes
+    """
+    HANDLERS[kind] = WorkHandler(process, on_batch_done)
+
+
+def get_queue_config(config: dict) -> dict:
+    """
+    :return: Work queue section of the config with defaults filled in, enabled is False unless set
+    """
+    queue_config: dict = config.get("work_queue", {})
+    return {"enabled": bool(queue_config.get("enabled", False)),
+            "lease_seconds": max(int(queue_config.get("lease_seconds", DEFAULT_LEASE_SECONDS)), 1),
+            "heartbeat_seconds": max(int(queue_config.get("heartbeat_seconds", DEFAULT_HEARTBEAT_SECONDS)), 1),
+            "max_attempts": max(int(queue_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS)), 1)}
+
+
+def enqueue_batch(kind: str, batch: str, payloads: dict[str, dict]) -> tuple[str, bool]:
+    """
+    Queue a batch of items, merging it with a batch of the same kind that has not finished
+
+    :param kind: Kind of item, see register_handler
+    :param batch: Name of the new batch
+    :param payloads: Payload of each item, keyed by the item within the batch
+    :return: Batch the items belong to and whether a new batch was created
+    """
+    return write(_enqueue_batch, kind, batch, payloads)
+
+
+def _enqueue_batch(connection: Connection, kind: str, batch: str, payloads: dict[str, dict]) -> tuple[str, bool]:
+    # Checked within the write transaction, so two processes cannot both create a batch
+    active: str | None = connection.execute(select(WorkItem.batch)
+                                            .where(WorkItem.kind == kind, WorkItem.status.in_(ACTIVE_STATUSES))
+                                            .order_by(WorkItem.id)
+                                            .limit(1)).scalar()
+    if active is not None:
+        return active, False
+
+    if payloads:
+        created_at: datetime = datetime.now()
+        connection.execute(insert(WorkItem), [{"kind": kind, "batch": batch, "key": key, "payload": payload,
+                                               "status": ITEM_QUEUED, "attempts": 0, "created_at": created_at}
+                                              for key, payload in payloads.items()])
+    return batch, True
+
+
+def claim(connection: Connection, kinds: list[str], owner: str, lease_seconds: int,
+          max_attempts: int) -> dict | None:
+    """
+    Lease the oldest available item, either queued or with an expired lease. Items whose
+    lease expired on their last attempt are failed instead of being claimed again
+
+    :param connection: Connection of the write transaction
+    :param kinds: Kinds of item the worker can process
+    :param owner: Name of the worker
+    :param lease_seconds: Time the worker has to finish or renew the lease
+    :param max_attempts: Number of times an item may be leased
+    :return: ID, kind, batch, key, payload and attempts of the item, None if nothing is available
+    """
+    now: float = time.time()
+    expired = (WorkItem.status == ITEM_LEASED) & (WorkItem.lease_expires_at < now)
+
+    failed = connection.execute(update(WorkItem)
+                                .where(WorkItem.kind.in_(kinds), expired, WorkItem.attempts >= max_attempts)
+                                .values(status=ITEM_FAILED, lease_owner=None, finished_at=datetime.now(),
+                                        error=f"Lease expired on attempt {max_attempts}")
+                                .returning(WorkItem.kind, WorkItem.batch)).all()
+
+    # Failing the last active item of a batch finishes it, as when a worker reports a failure
+    for kind, batch in sorted(set(failed)):
+        _finish_batch(connection, kind, batch)
+
+    available = (select(WorkItem.id)
+                 .where(WorkItem.kind.in_(kinds), (WorkItem.status == ITEM_QUEUED) | expired)
+                 .order_by(WorkItem.id)
+                 .limit(1)
+                 .scalar_subquery())
+    row = connection.execute(update(WorkItem)
+                             .where(WorkItem.id == available)
+                             .values(status=ITEM_LEASED, lease_owner=owner, lease_expires_at=now + lease_seconds,
+                                     heartbeat_at=datetime.now(), attempts=WorkItem.attempts + 1)
+                             .returning(WorkItem.id, WorkItem.kind, WorkItem.batch, WorkItem.key,
+                                        WorkItem.payload, WorkItem.attempts)).first()
+
+    return dict(row._mapping) if row is not None else None
+
+
+def heartbeat(connection: Connection, owner: str, lease_seconds: int) -> int:
+    """
+    Extend the leases held by a worker
+
+    :return: Number of leases extended
+    """
+    result = connection.execute(update(WorkItem)
+                                .where(WorkItem.lease_owner == owner, WorkItem.status == ITEM_LEASED)
+                                .values(lease_expires_at=time.time() + lease_seconds, heartbeat_at=datetime.now()))
+    return result.rowcount
+
+
+def complete(connection: Connection, item: dict, owner: str, result: dict) -> bool:
+    """
+    Record the result of an item, finishing its batch if it was the last active item
+
+    :param item: Item returned by claim
+    :param owner: Name of the worker, the result is discarded if it no longer holds the lease
+    :return: Whether the result was recorded
+    """
+    updated = connection.execute(update(WorkItem)
+                                 .where(WorkItem.id == item["id"], WorkItem.lease_owner == owner,
+                                        WorkItem.status == ITEM_LEASED)
+                                 .values(status=ITEM_DONE, lease_owner=None, result=result, error=None,
+                                         finished_at=datetime.now()))
+    if not updated.rowcount:
+        return False
+
+    _finish_batch(connection, item["kind"], item["batch"])
+    return True
+
+
+def fail(connection: Connection, item: dict, owner: str, error: str, max_attempts: int) -> str | None:
+    """
+    Return an item to the queue after an error, or fail it once it has used every attempt
+
+    :return: New status of the item, None if the worker no longer holds the lease
+    """
+    status: str = ITEM_FAILED if item["attempts"] >= max_attempts else ITEM_QUEUED
+    updated = connection.execute(update(WorkItem)
+                                 .where(WorkItem.id == item["id"], WorkItem.lease_owner == owner,
+                                        WorkItem.status == ITEM_LEASED)
+                                 .values(status=status, lease_owner=None, lease_expires_at=None, error=error,
+                                         finished_at=datetime.now() if status == ITEM_FAILED else None))
+    if not updated.rowcount:
+        return None
+
+    if status == ITEM_FAILED:
+        _finish_batch(connection, item["kind"], item["batch"])
+    return status
+
+
+def release(connection: Connection, owner: str) -> int:
+    """
+    Return the items leased by a worker that is shutting down to the queue, without using up an attempt
+
+    :return: Number of items released
+    """
+    result = connection.execute(update(WorkItem)
+                                .where(WorkItem.lease_owner == owner, WorkItem.status == ITEM_LEASED)
+                                .values(status=ITEM_QUEUED, lease_owner=None, lease_expires_at=None,
+                                        attempts=WorkItem.attempts - 1))
+    return result.rowcount
+
+
+def _finish_batch(connection: Connection, kind: str, batch: str):
+    handler: WorkHandler | None = HANDLERS.get(kind)
+    if handler is None or handler.on_batch_done is None:
+        return
+
+    active: int = connection.execute(select(func.count()).select_from(WorkItem)
+                                     .where(WorkItem.batch == batch, WorkItem.status.in_(ACTIVE_STATUSES))).scalar()
+    if active:
+        return
+
+    items: list[dict] = [dict(row._mapping) for row in
+                         connection.execute(select(WorkItem.key, WorkItem.status, WorkItem.payload, WorkItem.result,
+                                                   WorkItem.error)
+                                            .where(WorkItem.batch == batch).order_by(WorkItem.id))]
+    handler.on_batch_done(connection, batch, items)
+
+
+def get_batch(batch: str) -> list[WorkItem]:
+    """
+    :return: Items of a batch in the order they were queued
+    """
+    return list(db.session.execute(select(WorkItem).where(WorkItem.batch == batch).order_by(WorkItem.id)).scalars())
+
+
+class DatabaseRateLimiter(TokenBucket):
+    """
+    Rate limit shared by every process using the database
+
+    The next free slot is stored in the rate_limit table and advanced by one interval
+    per reservation, within a write transaction so that reservations from different
+    processes never overlap. Slots are in wall-clock time, so hosts sharing a limit
+    must keep their clocks synchronised
+    """
+
+    def __init__(self, name: str, seconds_per_request: float):
+        """
+        :param name: Name of the limit, processes using the same name share it
+        :param seconds_per_request: Minimum interval between two requests
+        """
+        super().__init__(seconds_per_request)
+        self.name: str = name
+
+    def reserve(self) -> float:
+        """
+        Take the next free slot
+
+        :return: Number of seconds the caller must wait before using the slot
+        """
+        if self.seconds_per_request <= 0:
+            return 0.0
+
+        now: float = time.time()
+        slot: float = write(_reserve_slot, self.name, now, self.seconds_per_request)
+        return max(slot - now, 0.0)
+
+    async def acquire_async(self):
+        """
+        Suspend the current task until a slot is available, reserving it off the event loop
+        """
+        delay: float = await asyncio.to_thread(self.reserve)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _reserve_slot(connection: Connection, name: str, now: float, interval: float) -> float:
+    connection.execute(sqlite_insert(RateLimit).values(name=name, next_at=now).on_conflict_do_nothing())
+    next_at: float = connection.execute(update(RateLimit)
+                                        .where(RateLimit.name == name)
+                                        .values(next_at=func.max(RateLimit.next_at, now) + interval)
+                                        .returning(RateLimit.next_at)).scalar()
+    return next_at - interval
+
+
+def get_shared_rate_limiter(config: dict) -> TokenBucket:
+    """
+    Rate limiter for requests to arXiv, shared through the database when the work queue
+    is enabled as other processes may be making requests too, otherwise within this process
+
+    :param config: Current config
+    """
+    seconds_per_request: float = config.get("seconds_per_request", 4)
+    if not get_queue_config(config)["enabled"]:
+        return get_rate_limiter(seconds_per_request)
+
+    return DatabaseRateLimiter(ARXIV_RATE_LIMIT, seconds_per_request)
+
+
+@bp.route("/work", methods=["GET"])
+def get_work_items():
+    """
+    Endpoint that reports the number of items of each kind and status, and the most recent items
+
+    Example usage
+    work?batch=<batch>&limit=50
+    """
+    batch: str | None = request.args.get("batch")
+    limit: int = max(1, min(request.args.get("limit", 20, type=int), 100))
+
+    counts: dict[str, dict[str, int]] = {}
+    for kind, status, count in db.session.execute(select(WorkItem.kind, WorkItem.status, func.count())
+                                                  .group_by(WorkItem.kind, WorkItem.status)):
+        counts.setdefault(kind, {})[status] = count
+
+    stmt = select(WorkItem).order_by(WorkItem.id.desc()).limit(limit)
+    if batch:
+        stmt = stmt.where(WorkItem.batch == batch)
+
+    items: list[WorkItem] = list(db.session.execute(stmt).scalars())
+    return jsonify({"counts": counts, "items": [item.to_dict() for item in items]}), 200
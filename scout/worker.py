@@ -0,0 +1,171 @@
+"""
+Worker that processes items of the work queue shared through the database
+
+Any number of workers, in any number of processes or on any host with access to
+the database, may run at once. Each claims one item at a time under a lease that
+it renews while working, items of a worker that stops are claimed by another once
+the lease expires. Requests to arXiv share one rate limit across every worker
+
+Each worker logs to a file of its own, e.g. logs/scout-worker-host-1.log
+
+Usage
+python worker.py [--threads 2] [--name host-1] [--once] [--config config.yml] [--database sqlite:///...]
+"""
+from __future__ import annotations
+from utils.default_logging import configure_default_logging, configure_log_root, configure_log_suffix
+import argparse
+import os
+
+# Log files are kept in the app directory whatever the working directory, set before any module opens them
+configure_log_root(os.path.dirname(os.path.abspath(__file__)))
+
+import socket
+import threading
+import traceback
+
+from flask import Flask
+from engine import write
+from settings import load_config
+from work_queue import HANDLERS, claim, complete, fail, get_queue_config, heartbeat, release
+
+import logging
+logger = logging.getLogger(__name__)
+logger.propagate = True
+configure_default_logging(logger, "logs/scout.log")
+logger.info(f"Logging initialised from {__name__}")
+
+# Seconds between checks for new items while the queue is empty
+IDLE_SECONDS: float = 2.0
+
+
+class Worker:
+    """
+    Claims and processes items on a number of threads, renewing their leases on another
+    """
+
+    def __init__(self, app: Flask, name: str | None = None, threads: int = 1):
+        """
+        :param app: Application whose database holds the queue
+        :param name: Name recorded as the owner of leases, unique to this worker
+        :param threads: Number of items processed at once
+        """
+        self.app: Flask = app
+        self.name: str = name or default_name()
+        self.threads: int = max(threads, 1)
+        self._stop = threading.Event()
+
+    def run(self, once: bool = False):
+        """
+        Process items until stopped
+
+        :param once: Stop once the queue is empty rather than waiting for more items
+        """
+        logger.info(f"Worker {self.name} started with {self.threads} threads for {', '.join(sorted(HANDLERS))}")
+        beat = threading.Thread(target=self._heartbeat, name="scout-worker-heartbeat", daemon=True)
+        beat.start()
+
+        workers: list[threading.Thread] = [threading.Thread(target=self._work, args=(once,),
+                                                            name=f"scout-worker-{index}")
+                                           for index in range(self.threads)]
+        for thread in workers:
+            thread.start()
+
+        try:
+            for thread in workers:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            logger.info(f"Worker {self.name} stopping")
+            self.stop()
+            for thread in workers:
+                thread.join()
+        finally:
+            self._stop.set()
+            with self.app.app_context():
+                released: int = write(release, self.name)
+            if released:
+                logger.info(f"Worker {self.name} returned {released} unfinished items to the queue")
+
+    def stop(self):
+        self._stop.set()
+
+    def _work(self, once: bool):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                queue_config: dict = get_queue_config(load_config())
+                item: dict | None = write(claim, list(HANDLERS), self.name, queue_config["lease_seconds"],
+                                          queue_config["max_attempts"])
+
+                if item is None:
+                    if once:
+                        return
+                    self._stop.wait(IDLE_SECONDS)
+                    continue
+
+                self._process(item, queue_config)
+
+    def _process(self, item: dict, queue_config: dict):
+        logger.info(f"Worker {self.name} processing {item['kind']} item {item['key']} of batch {item['batch']} "
+                    f"(attempt {item['attempts']})")
+        try:
+            result: dict = HANDLERS[item["kind"]].process(item["payload"])
+        except Exception as e:
+            logger.error(f"Failed {item['kind']} item {item['key']}: {e}\n{traceback.format_exc()}")
+            status: str | None = write(fail, item, self.name, str(e), queue_config["max_attempts"])
+            if status is None:
+                logger.warning(f"Lease of {item['kind']} item {item['key']} was lost before it failed")
+            return
+
+        if not write(complete, item, self.name, result):
+            # Another worker claimed the item after the lease expired, its result is recorded instead
+            logger.warning(f"Lease of {item['kind']} item {item['key']} was lost before it finished")
+
+    def _heartbeat(self):
+        with self.app.app_context():
+            while True:
+                queue_config: dict = get_queue_config(load_config())
+                if self._stop.wait(queue_config["heartbeat_seconds"]):
+                    return
+
+                try:
+                    write(heartbeat, self.name, queue_config["lease_seconds"])
+                except Exception as e:
+                    logger.error(f"Worker {self.name} failed to renew its leases: {e}")
+
+
+def default_name() -> str:
+    """
+    :return: Name of a worker that was not given one, unique to this process
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=1, help="Items processed at once")
+    parser.add_argument("--name", default=None, help="Name of the worker, defaults to the host and process ID")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+    parser.add_argument("--database", default=None, help="SQLAlchemy URI of the database, defaults to the app's")
+    parser.add_argument("--config", default=None, help="Config file, defaults to config/config.yml")
+    args = parser.parse_args()
+
+    # Log files are rotated by the process that writes them, so workers do not share the file of the app
+    name: str = args.name or default_name()
+    configure_log_suffix(f"worker-{name}")
+
+    if args.config:
+        import settings
+        settings.config_service = settings.ConfigService(args.config)
+
+    # Handlers are registered by the modules that define them, which are imported by the app
+    from app import create_app
+    # Jobs belong to the app, which may be running while workers start
+    config: dict = {"SCHEDULER_ENABLED": False, "RECOVER_JOBS": False, "JOB_WORKERS": 1}
+    if args.database:
+        config["SQLALCHEMY_DATABASE_URI"] = args.database
+
+    Worker(create_app(config), name=name, threads=args.threads).run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
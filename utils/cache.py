@@ -0,0 +1,76 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class VersionedValue(Generic[T]):
+    """
+    Thread-safe holder of a value computed from data identified by a version
+    """
+
+    def __init__(self, default: T):
+        self._lock = threading.Lock()
+        self.version: Hashable | None = None
+        self.value: T = default
+
+    def get(self) -> tuple[Hashable | None, T]:
+        with self._lock:
+            return self.version, self.value
+
+    def set(self, version: Hashable | None, value: T):
+        with self._lock:
+            self.version = version
+            self.value = value
+
+
+class LRUCache(Generic[T]):
+    """
+    Thread-safe mapping that evicts the least recently used entries once it holds more
+    than max_entries, or more than max_bytes as measured by the size given to put
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[T, int]] = OrderedDict()
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.size_bytes: int = 0
+
+    def get(self, key: Hashable) -> T | None:
+        with self._lock:
+            entry: tuple[T, int] | None = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: T, size: int) -> bool:
+        """
+        :return: Whether the value was stored, values larger than max_bytes are not
+        """
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes or self.max_entries < 1:
+                return False
+
+            self._entries[key] = (value, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable):
+        entry: tuple[T, int] | None = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
@@ -1,28 +1,248 @@
 from __future__ import annotations
+import atexit
+import json
 import logging
-from logging import Logger
+import os
+import queue
+import re
+import threading
+from pathlib import Path
+from logging import Formatter, Handler, Logger, LogRecord
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+# Rotation of the log file, either by size or, if LOG_ROTATE_WHEN is set, by time (see TimedRotatingFileHandler)
+LOG_MAX_BYTES: int = 10 * 1024 * 1024
+LOG_BACKUP_COUNT: int = 5
+LOG_ROTATE_WHEN: str | None = None
+
+# Formats of the log file, the text format is split on LOG_SEPARATOR by the log viewer
+LOG_SEPARATOR: str = "-*-"
+LOG_FORMATS: tuple[str, ...] = ("text", "json")
+CONSOLE_FORMAT: str = "%(asctime)-24s %(name)-16s %(module)-16s %(levelname)-8s %(message)-32s"
+FILE_FORMAT: str = " -*- ".join(["%(asctime)s", "%(name)s", "%(module)s:%(lineno)d", "%(levelname)s", "%(message)s"])
+
+# Level of loggers without a level of their own, see configure_levels
+DEFAULT_LEVEL: int = logging.DEBUG
+
+
+class JsonFormatter(Formatter):
+    """
+    Formats each record as a single JSON line with the same fields as the text format
+    """
+
+    def format(self, record: LogRecord) -> str:
+        message: str = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+
+        return json.dumps({"time": self.formatTime(record),
+                           "name": record.name,
+                           "location": f"{record.module}:{record.lineno}",
+                           "level": record.levelname,
+                           "message": message})
+
+
+class _LogWriter:
+    """
+    Handlers of a log file, run on a background thread so that loggers only put records on a queue
+    """
+
+    def __init__(self, filepath: str):
+        console_handler = logging.StreamHandler()  # Console handler
+
+        # Filtering is done by the level of each logger
+        console_handler.setLevel(logging.DEBUG)
+        console_handler.setFormatter(Formatter(CONSOLE_FORMAT))
+
+        self.filepath: str = filepath
+        self.file_handler: Handler = self._open(filepath, Formatter(FILE_FORMAT))
+        self.queue_handler: QueueHandler = QueueHandler(queue.SimpleQueue())
+        self.listener: QueueListener = QueueListener(self.queue_handler.queue, console_handler, self.file_handler,
+                                                     respect_handler_level=True)
+        self.listener.start()
+
+    def reopen(self, filepath: str):
+        """
+        Write to another file, records already on the queue are written to the current one first
+        """
+        self.listener.stop()
+        previous: Handler = self.file_handler
+        self.filepath = filepath
+        self.file_handler = self._open(filepath, previous.formatter)
+        self.listener.handlers = tuple(self.file_handler if handler is previous else handler
+                                       for handler in self.listener.handlers)
+        previous.close()
+        self.listener.start()
+
+    @staticmethod
+    def _open(filepath: str, formatter: Formatter) -> Handler:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
+        if LOG_ROTATE_WHEN:
+            file_handler = TimedRotatingFileHandler(filepath, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+        else:
+            file_handler = RotatingFileHandler(filepath, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+        return file_handler
+
+    def stop(self):
+        # Writes any records still on the queue
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+# One writer per file, shared by every logger so that handlers are only created once
+_writers: dict[str, _LogWriter] = {}
+_levels: dict[str, int] = {}
+_lock = threading.Lock()
+
+# Directory that relative log paths are resolved against, the working directory unless set, see configure_log_root
+_root: Path | None = None
+
+# Added to the name of every log file of this process, see configure_log_suffix
+_suffix: str = ""
 
 
 def configure_default_logging(logger: Logger, filepath: str):
     """
-    Default configuration that can be used across all files
+    Default configuration that can be used across all files, calling it again has no effect
+    """
+
+    # Create the writer of the file
+    with _lock:
+        if filepath not in _writers:
+            _writers[filepath] = _LogWriter(resolve_log_path(filepath))
+        writer: _LogWriter = _writers[filepath]
+
+    logger.setLevel(_level_of(logger.name))
+
+    # Add the handler to the logger
+    if writer.queue_handler not in logger.handlers:
+        logger.addHandler(writer.queue_handler)
+
+
+def configure_log_root(root: str | Path):
+    """
+    Resolve relative log paths against a directory rather than the working directory, so that
+    every process of an application writes to the same place wherever it is started. Should be
+    called before the first logger is configured, files already open are moved
+
+    :param root: Directory of the application, e.g. logs/scout.log is written to <root>/logs/scout.log
+    """
+    global _root
+
+    with _lock:
+        _root = Path(root).resolve()
+        _reopen()
+
+
+def configure_log_suffix(suffix: str):
+    """
+    Write the logs of this process to files of its own, e.g. logs/scout-worker-1.log rather than
+    logs/scout.log for the suffix worker-1. Rotation renames the file, which is only safe if a
+    single process writes it
+
+    :param suffix: Added to the name of each log file, characters other than letters, digits, dots and dashes are replaced
+    """
+    global _suffix
+
+    with _lock:
+        _suffix = re.sub(r"[^\w.-]", "_", suffix)
+        _reopen()
+
+
+def resolve_log_path(filepath: str) -> str:
+    """
+    :param filepath: Log file as configured, e.g. logs/scout.log
+    :return: Path of the file written by this process, relative paths are resolved against the root
+             set by configure_log_root
+    """
+    path: Path = _root / filepath if _root is not None else Path(filepath)
+    if _suffix:
+        path = path.with_name(f"{path.stem}-{_suffix}{path.suffix}")
+    return str(path)
+
+
+def configure_levels(levels: dict[str, str | int] | None = None, default: str | int | None = None):
+    """
+    Set the level of loggers, including those configured later on
+
+    :param levels: Level of each logger by name, applying to its children too, e.g. {"fetcher": "INFO"}
+    :param default: Level of loggers not named in levels
+    """
+    global DEFAULT_LEVEL
+
+    with _lock:
+        if default is not None:
+            DEFAULT_LEVEL = _to_level(default)
+        _levels.update({name: _to_level(level) for name, level in (levels or {}).items()})
+
+    # Update the loggers that have already been configured
+    for name, existing in logging.root.manager.loggerDict.items():
+        if isinstance(existing, Logger) and any(handler in existing.handlers for handler in _queue_handlers()):
+            existing.setLevel(_level_of(name))
+
+
+def configure_format(log_format: str):
+    """
+    Select the format of log files
+
+    :param log_format: Either text (fields separated by LOG_SEPARATOR) or json (one object per line)
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format {log_format}, expected one of {', '.join(LOG_FORMATS)}")
+
+    formatter: Formatter = JsonFormatter() if log_format == "json" else Formatter(FILE_FORMAT)
+    with _lock:
+        for writer in _writers.values():
+            writer.file_handler.setFormatter(formatter)
+
+
+def shutdown():
+    """
+    Flush and close every log file
     """
+    with _lock:
+        writers: list[_LogWriter] = list(_writers.values())
+        _writers.clear()
+
+    for writer in writers:
+        writer.stop()
+
+
+def _reopen():
+    # Called with the lock held, once the root or suffix has changed
+    for filepath, writer in _writers.items():
+        path: str = resolve_log_path(filepath)
+        if path != writer.filepath:
+            writer.reopen(path)
+
+
+def _queue_handlers() -> list[QueueHandler]:
+    return [writer.queue_handler for writer in _writers.values()]
+
+
+def _level_of(name: str) -> int:
+    # The most specific configured logger, e.g. scraper.fetch inherits from scraper
+    while name:
+        if name in _levels:
+            return _levels[name]
+        name = name.rpartition(".")[0]
+    return DEFAULT_LEVEL
+
 
-    # Create handlers
-    console_handler = logging.StreamHandler()  # Console handler
-    file_handler = logging.FileHandler(filepath)  # File handler
+def _to_level(level: str | int) -> int:
+    if isinstance(level, int):
+        return level
 
-    # Set level of logging
-    logger.setLevel(logging.DEBUG)  # Could be ERROR, WARNING, INFO, DEBUG
-    console_handler.setLevel(logging.DEBUG)
-    file_handler.setLevel(logging.DEBUG)
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level {level}")
+    return value
 
-    # Create formatters and add it to handlers
-    console_format = logging.Formatter("%(asctime)-24s %(name)-16s %(module)-16s %(levelname)-8s %(message)-32s")
-    file_format = logging.Formatter("%(asctime)s -*- %(name)s -*- %(module)s:%(lineno)d -*- %(levelname)s -*- %(message)s")
-    console_handler.setFormatter(console_format)
-    file_handler.setFormatter(file_format)
 
-    # Add handlers to the logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+atexit.register(shutdown)
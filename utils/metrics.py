@@ -0,0 +1,167 @@
+from __future__ import annotations
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+# Upper bounds in seconds of the default latency buckets, +Inf is implied
+DEFAULT_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        :return: Every metric in the text exposition format, version 0.0.4
+        """
+        with self._lock:
+            metrics: list[_Metric] = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 registry: Registry | None = REGISTRY):
+        """
+        :param name: Name of the metric, e.g. scout_requests_total
+        :param documentation: Help text of the metric
+        :param labelnames: Names of the labels that every sample must set
+        :param registry: Registry the metric is rendered by, None to leave it unregistered
+        """
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> str:
+        return f"# HELP {self.name} {_escape_help(self.documentation)}\n# TYPE {self.name} {self.kind}\n"
+
+    def _labels(self, key: tuple[str, ...], extra: dict[str, str] | None = None) -> str:
+        pairs: list[tuple[str, str]] = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> str:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Value that only increases, e.g. the number of requests
+    """
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+
+        key: tuple[str, ...] = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> str:
+        with self._lock:
+            values: list[tuple[tuple[str, ...], float]] = sorted(self._values.items())
+        return self._header() + "".join(f"{self.name}{self._labels(key)} {_format(value)}\n"
+                                        for key, value in values)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. request latency, counted in cumulative buckets
+    """
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key: tuple[str, ...] = self._key(labels)
+        index: int = bisect_left(self.buckets, value)
+        with self._lock:
+            counts: list[int] = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Observe the duration of the enclosed block, including when it raises
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), []))
+
+    def render(self) -> str:
+        with self._lock:
+            series: list[tuple[tuple[str, ...], list[int], float]] = [(key, list(counts), self._sums[key])
+                                                                      for key, counts in sorted(self._counts.items())]
+
+        lines: list[str] = [self._header()]
+        for key, counts, total in series:
+            cumulative: int = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': _format(bound)})} {cumulative}\n")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format(total)}\n")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}\n")
+        return "".join(lines)
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')